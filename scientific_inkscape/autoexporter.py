@@ -50,8 +50,10 @@ import math
 import shutil
 import tempfile
 import hashlib
+import json
 import lxml
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import dhelpers as dh
 import inkex
@@ -62,6 +64,7 @@ from inkex.text.parser import ParsedText, xyset, TChar, XY_TOL
 
 import numpy as np
 import image_helpers as ih
+import export_stats
 
 otp_support_tags = BaseElementCache.otp_support_tags
 peltag = inkex.PathElement.ctag
@@ -73,6 +76,15 @@ DISPPROFILE = False
 
 MAXATTEMPTS = 2
 MAX_THREADS = 10;
+MAX_PAGE_WORKERS = max(1, min(4, os.cpu_count() or 1))  # concurrent page exports
+USE_EXPORT_CACHE = True  # restore unchanged exports from si_cache
+MAX_CACHED_EXPORTS = 500
+USE_RASTER_CACHE = True  # reuse unchanged rasterizations from si_cache
+MAX_CACHED_RASTERS = 2000
+PIPELINE = True  # pass documents between stages in memory
+STATS_LOG = True  # append per-stage timings to si_ae_stats.jsonl
+MAX_INVERTED_COLORS = 100000  # dark-mode colors remembered across documents
+_inverted_colors = dict()
 sema_export = threading.Semaphore(MAX_THREADS)
 sema_finalize = threading.Semaphore(MAX_THREADS)
 
@@ -442,12 +454,30 @@ class Exporter():
         if getattr(self, "display_name", None) is None:
             self.display_name = os.path.basename(self.original_file)
         
+    # Attributes set while exporting, as opposed to the options passed in
+    RUN_STATE = (
+        "stats", "tempdir", "temphead", "tempbase", "exported_files",
+        "live_docs", "unwritten", "made_outputs", "page_message",
+        "duplicatelabels", "ctable", "pagecolor", "stpact", "original_hash",
+    )
+
     sema_temp = threading.Semaphore(1)
+    @export_stats.timed("export_all", report=True)
     def export_all(self):
         """Export all files in specified formats."""
+        # Skip everything if an identical export has already been made
+        ckey = self.cache_key()
+        if ckey is not None:
+            if self.restore_from_cache(ckey):
+                self.count_stat("export_cache_hits")
+                return None
+            self.count_stat("export_cache_misses")
+
         # Make a temp directory
         self.tempdir, self.temphead = dh.shared_temp('ae')
         self.tempbase = joinmod(self.tempdir,self.temphead)
+        self.exported_files = []
+        self.live_docs = dict()
         
         if self.debug:
             if self.prints:
@@ -456,10 +486,10 @@ class Exporter():
         # Add a document margin
         cfile = self.filein # current file we're working on
         if self.margin != 0:
-            svg = get_svg(cfile)
+            svg = self.read_svg(cfile)
             tmp = self.tempbase + "_marg.svg"
             Exporter.add_margin(svg, self.margin, self.testmode)
-            self.check(dh.overwrite_svg, svg, tmp)
+            self.write_svg(svg, tmp)
             cfile = copy.copy(tmp)
 
         # Do png before any preprocessing
@@ -478,6 +508,10 @@ class Exporter():
             if finished:
                 newfiles.append(myo)
 
+        if ckey is not None:
+            self.store_in_cache(ckey)
+        self.live_docs = dict()
+
         # Remove temporary outputs and directory
         failed_to_delete = None
         if not (self.debug):
@@ -488,6 +522,233 @@ class Exporter():
             subprocess.Popen(f'explorer "{os.path.realpath(self.tempdir)}"')
         return failed_to_delete
 
+    # Options that change the outputs of export_all
+    CACHE_OPTIONS = (
+        "formats",
+        "dpi",
+        "margin",
+        "thinline",
+        "stroketopath",
+        "texttopath",
+        "latexpdf",
+        "reduce_images",
+        "backingrect",
+        "darkmode",
+    )
+
+    def cache_key(self):
+        """
+        Key identifying an export by its source bytes, linked files, options,
+        and Inkscape binary. Returns None if caching does not apply.
+        """
+        if (
+            not USE_EXPORT_CACHE
+            or getattr(self, "testmode", False)
+            or getattr(self, "debug", False)
+        ):
+            return None
+        try:
+            keyd = {
+                "source": hash_file(self.filein),
+                "original": os.path.abspath(self.original_file),
+                "outtemplate": os.path.abspath(self.outtemplate),
+                "linked": self.linked_files_state(),
+                "inkscape": [
+                    self.bfn,
+                    os.path.getmtime(self.bfn) if os.path.exists(self.bfn) else None,
+                    inkex.installed_ivp,
+                ],
+            }
+        except OSError:
+            return None
+        keyd["options"] = {k: getattr(self, k, None) for k in Exporter.CACHE_OPTIONS}
+        if getattr(self, "darkmode", False):
+            keyd["dark_mode_colors"] = sorted(dh.si_config.dark_mode_colors.items())
+        keyv = json.dumps(keyd, sort_keys=True, default=str)
+        return hashlib.sha256(keyv.encode("utf-8")).hexdigest()
+
+    HREF_RE = re.compile(rb'href\s*=\s*["\']([^"\'#][^"\']*)["\']')
+
+    def linked_files_state(self):
+        """Modification times and sizes of linked files"""
+        if getattr(self, "exportnow", False) and hasattr(self, "linked_locations"):
+            paths = [p for p in self.linked_locations.values() if p is not None]
+        else:
+            # pylint: disable=import-outside-toplevel
+            from urllib.parse import unquote, urlparse
+            # pylint: enable=import-outside-toplevel
+
+            with open(self.filein, "rb") as file:
+                hrefs = Exporter.HREF_RE.findall(file.read())
+            odir = os.path.dirname(self.original_file)
+            paths = []
+            for href in hrefs:
+                href = href.decode("utf-8", errors="ignore")
+                if href.startswith("data:"):
+                    continue
+                href = unquote(urlparse(href).path)
+                paths.append(ih.absolute_href2(href, odir))
+        ret = []
+        for pth in sorted(set(paths)):
+            try:
+                ret.append((pth, os.path.getmtime(pth), os.path.getsize(pth)))
+            except OSError:
+                ret.append((pth, None, None))
+        return ret
+
+    def restore_from_cache(self, ckey):
+        """Copy cached outputs into place. Returns True on success."""
+        entry = os.path.join(dh.cache_dir("exports"), ckey)
+        try:
+            with open(os.path.join(entry, "manifest.json"), "r", encoding="utf-8") as f:
+                outputs = json.load(f)["outputs"]
+            base = os.path.splitext(self.outtemplate)[0]
+            for cname, suffix in outputs:
+                shutil.copyfile(os.path.join(entry, cname), base + suffix)
+            os.utime(entry)
+            self.exported_files = [base + suffix for _, suffix in outputs]
+        except (OSError, ValueError, KeyError):
+            return False
+        for fformat in self.formats:
+            self.remove_stale_outputs(self.output_name(fformat), self.exported_files)
+        self.terminal_message("Unchanged since last export, restored from cache")
+        return True
+
+    def store_in_cache(self, ckey):
+        """Save this export's outputs so an identical export can be skipped."""
+        base = os.path.splitext(self.outtemplate)[0]
+        outputs = []
+        for i, fname in enumerate(self.exported_files):
+            if not fname.startswith(base) or not os.path.exists(fname):
+                return
+            outputs.append([str(i), fname[len(base):]])
+
+        cdir = dh.cache_dir("exports")
+        entry = os.path.join(cdir, ckey)
+        tmpentry = os.path.join(cdir, self.temphead + ".tmp")
+        try:
+            os.makedirs(tmpentry, exist_ok=True)
+            for (cname, _), fname in zip(outputs, self.exported_files):
+                shutil.copyfile(fname, os.path.join(tmpentry, cname))
+            with open(os.path.join(tmpentry, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump({"outputs": outputs}, f)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmpentry, entry)
+        except OSError:
+            shutil.rmtree(tmpentry, ignore_errors=True)
+            return
+        dh.prune_cache(cdir, MAX_CACHED_EXPORTS)
+
+    def raster_key_common(self, svg):
+        """
+        The part of a rasterization key shared by all elements of a document:
+        DPI, document scale, stylesheets, and Inkscape binary. Returns None
+        if raster caching does not apply.
+        """
+        if not USE_RASTER_CACHE or self.testmode or getattr(self, "debug", False):
+            return None
+        try:
+            binv = [self.bfn, os.path.getmtime(self.bfn), inkex.installed_ivp]
+        except OSError:
+            return None
+        keyd = {
+            "dpi": int(self.dpi),
+            "inkscape": binv,
+            "doc": [svg.get(a) for a in ("width", "height", "viewBox")],
+            "styles": [el.text for el in svg.iter("{*}style")],
+        }
+        return json.dumps(keyd, sort_keys=True, default=str).encode("utf-8")
+
+    URL_RE = re.compile(r'url\(\s*["\']?#([^)"\'\s]+)|^#(\S+)$')
+
+    @staticmethod
+    def raster_key(common, elem, overlaps, below):
+        """
+        Key identifying the rasterizations of an element by its serialized
+        subtree, referenced defs, placement, and the elements drawn above
+        (hidden for the opaque image) and below it.
+        """
+        hashv = hashlib.sha256(common)
+
+        def refs(el):
+            for val in el.attrib.values():
+                for mtch in Exporter.URL_RE.finditer(val):
+                    yield mtch.group(1) or mtch.group(2)
+
+        def shallow(el):
+            return repr(
+                (el.tag, sorted(el.attrib.items()), el.text, el.tail)
+            ).encode("utf-8")
+
+        hashv.update(lxml.etree.tostring(elem, with_tail=False))
+        hashv.update(str(elem.ccomposed_transform).encode("utf-8"))
+        hashv.update(str(elem.cspecified_style).encode("utf-8"))
+        hashv.update(b"above")
+        for el in overlaps:
+            hashv.update(el.get_id().encode("utf-8"))
+        hashv.update(b"below")
+        for el in below:
+            hashv.update(shallow(el))
+
+        # Closure of referenced defs (gradients, filters, masks, clips, uses)
+        stack = [d for d in elem.iter("*") for d in refs(d)]
+        stack += [d for el in below for d in refs(el)]
+        seen = set()
+        while stack:
+            elid = stack.pop()
+            if elid in seen:
+                continue
+            seen.add(elid)
+            dfn = elem.croot.getElementById(elid)
+            if dfn is None:
+                continue
+            hashv.update(lxml.etree.tostring(dfn, with_tail=False))
+            stack += [d for el in dfn.iter("*") for d in refs(el)]
+        return hashv.hexdigest()
+
+    def restore_raster(self, rkey, actt, acto, bbs):
+        """
+        Copy cached rasterizations of an element into place and add its
+        bounding box to bbs. Returns True on success.
+        """
+        entry = os.path.join(dh.cache_dir("rasters"), rkey)
+        elid = actt.els[0].get_id()
+        try:
+            with open(os.path.join(entry, "bbox.json"), "r", encoding="utf-8") as f:
+                bbx = json.load(f)
+            shutil.copyfile(os.path.join(entry, "t.png"), joinmod(self.tempdir, actt.fname))
+            shutil.copyfile(os.path.join(entry, "o.png"), joinmod(self.tempdir, acto.fname))
+            os.utime(entry)
+        except (OSError, ValueError):
+            self.count_stat("raster_cache_misses")
+            return False
+        bbs[elid] = bbx
+        self.count_stat("raster_cache_hits")
+        return True
+
+    def store_raster(self, rkey, actt, acto, bbs):
+        """Save an element's rasterizations so they can be reused."""
+        elid = actt.els[0].get_id()
+        fnt = joinmod(self.tempdir, actt.fname)
+        fno = joinmod(self.tempdir, acto.fname)
+        if elid not in bbs or not (os.path.exists(fnt) and os.path.exists(fno)):
+            return
+        cdir = dh.cache_dir("rasters")
+        entry = os.path.join(cdir, rkey)
+        tmpentry = os.path.join(cdir, self.temphead + "_" + elid + ".tmp")
+        try:
+            os.makedirs(tmpentry, exist_ok=True)
+            shutil.copyfile(fnt, os.path.join(tmpentry, "t.png"))
+            shutil.copyfile(fno, os.path.join(tmpentry, "o.png"))
+            with open(os.path.join(tmpentry, "bbox.json"), "w", encoding="utf-8") as f:
+                json.dump(bbs[elid], f)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmpentry, entry)
+        except OSError:
+            shutil.rmtree(tmpentry, ignore_errors=True)
+
     def clear_temp(self):
         """ Clear any temporary files """
         if not (self.debug):
@@ -535,14 +796,12 @@ class Exporter():
             else:      
                 self.prints(fname + ": "+msg, flush=True)
 
+    @export_stats.timed("preprocessing")
     def preprocessing(self, fin):
         """Modifications that are done prior to conversion to any vector output"""
-        # self.terminal_message("Preprocessing vector output")
-        # timestart = time.time()
-
         # SVG modifications that should be done prior to any binary calls
         cfile = fin
-        svg = get_svg(cfile)
+        svg = self.read_svg(cfile)
 
         # Prune hidden items and remove language switching
         stag = inkex.addNS("switch", "svg")
@@ -568,6 +827,7 @@ class Exporter():
         ttags = {tetag,frtag}
         self.duplicatelabels = dict()
         raster_ids, image_ids, jpgs = [], [], []
+        self.count_stat("elements", len(vds))
         for elem in vds:
             # Unlink any clones for the PDF image and marker fixes
             if isinstance(elem, (inkex.Use)) and not (isinstance(elem, (inkex.Symbol))):
@@ -743,7 +1003,7 @@ class Exporter():
                         dsd.cstyle["fill"] = dsd.cspecified_style["fill"]
 
         tmp = self.tempbase + "_mod.svg"
-        self.check(dh.overwrite_svg,svg, tmp)
+        self.write_svg(svg, tmp)
         cfile = tmp
 
         do_rasterizations = len(raster_ids + image_ids) > 0
@@ -761,7 +1021,7 @@ class Exporter():
         
         allacts = []
         if do_stroketopaths:
-            svg = get_svg(cfile)
+            svg = self.read_svg(cfile)
             vdd = dh.visible_descendants(svg)
 
 
@@ -792,7 +1052,7 @@ class Exporter():
                 updatefile = True
 
             if updatefile:
-                self.check(dh.overwrite_svg,svg, cfile)
+                self.write_svg(svg, cfile)
 
             tmpstp = self.tempbase + "_stp.svg"
             allacts += [Act('stp',tels + pels,self,tmpstp)]
@@ -800,20 +1060,30 @@ class Exporter():
 
         # Rasterizations
         actts, actos  = [], []
+        bbs, uncached = dict(), []
         if do_rasterizations:
-            svg = get_svg(cfile)
+            svg = self.read_svg(cfile)
 
             vds = dh.visible_descendants(svg)
             els = [el for el in vds if el.get_id() in list(set(raster_ids + image_ids))]
             if len(els) > 0:
                 
-                overlaps = dh.overlapping_els(svg,els)
+                overlaps, below = dh.overlapping_els(svg, els, underlying=True)
+                rcommon = self.raster_key_common(svg)
                 for elem in els:
                     elid = elem.get_id()
                     actts.append(Act('imgt',elem,self))
                     actos.append(Act('imgo',elem,self,overlaps=overlaps))
+                    rkey = None
+                    if rcommon is not None:
+                        rkey = Exporter.raster_key(
+                            rcommon, elem, overlaps[elem], below[elem]
+                        )
+                        if self.restore_raster(rkey, actts[-1], actos[-1], bbs):
+                            continue
+                    uncached.append((rkey, actts[-1], actos[-1]))
                 
-                allacts += actos + actts
+                allacts += [a[2] for a in uncached] + [a[1] for a in uncached]
                 # export-id-onlys need to go last
                 
         imgs_trnp = {act.fname:act.els[0].get_id() for act in actts}
@@ -825,7 +1095,12 @@ class Exporter():
         if len(allacts) > 0 and not self.testmode:
             # use relative paths to reduce arg length
             
-            bbs = self.split_acts(fnm=cfile, acts=allacts)
+            bbs = bbs | (self.split_acts(fnm=cfile, acts=allacts) or dict())
+            if any(a[0] is not None for a in uncached):
+                for rkey, actt, acto in uncached:
+                    if rkey is not None:
+                        self.store_raster(rkey, actt, acto, bbs)
+                dh.prune_cache(dh.cache_dir("rasters"), MAX_CACHED_RASTERS)
             
             imgs = imgs_opqe | imgs_trnp
             missing_images = [t for t in imgs if not os.path.exists(os.path.join(self.tempdir, t)) and imgs[t] in bbs]
@@ -840,7 +1115,7 @@ class Exporter():
                 cfile = tmpstp
 
         if do_rasterizations:
-            svg = get_svg(cfile)
+            svg = self.read_svg(cfile)
             vds = dh.visible_descendants(svg)
             els = [el for el in vds if el.get_id() in list(set(raster_ids + image_ids))]
             if len(els) > 0:
@@ -879,11 +1154,11 @@ class Exporter():
                             )
 
                 tmp = self.tempbase + "_eimg.svg"
-                self.check(dh.overwrite_svg, svg, tmp)
+                self.write_svg(svg, tmp)
                 cfile = tmp
 
         if do_stroketopaths:
-            svg = get_svg(cfile)
+            svg = self.read_svg(cfile)
             # Remove temporary groups
             if self.stroketopath:
                 for elid in dgroups:
@@ -892,33 +1167,81 @@ class Exporter():
                         dh.ungroup(elem)
 
             tmp = self.tempbase + "_poststp.svg"
-            self.check(dh.overwrite_svg, svg, tmp)
+            self.write_svg(svg, tmp)
             cfile = tmp
-
-        # self.terminal_message("Preprocessing done ("
-        # + str(round(1000 * (time.time() - timestart)) / 1000)
-        # + " s)")
         return cfile
 
     def check(self, func, *args, finalization=False, **kwargs):
         """Wraps a call with a stopped-thread check; if stopped, clear temp and exit.
         Different semas are used for finalization and export.
         dh.overwrite_svg is pure-Python and bypasses semaphores entirely."""
-        def stopcheck():
-            if hasattr(self, "aeThread") and self.aeThread.stopped is True:
-                self.clear_temp()
-                sys.exit()
         if func == dh.overwrite_svg:
-            stopcheck()
+            self.stopcheck()
             ret = func(*args, **kwargs)
-            stopcheck()
+            self.stopcheck()
+            self.count_stat("files_written")
+            if os.path.exists(args[1]):
+                self.count_stat("bytes_written", os.path.getsize(args[1]))
             return ret
         with sema_finalize if finalization else sema_export:
-            stopcheck()
+            self.stopcheck()
             ret = func(*args, **kwargs)
-            stopcheck()
+            self.stopcheck()
             return ret
 
+    def count_stat(self, key, num=1):
+        """Add to one of the current document's counters."""
+        stats = getattr(self, "stats", None)
+        if stats is not None:
+            stats.count(key, num)
+
+    def report_stats(self, stats, total):
+        """Log a finished document's stats and summarize them."""
+        if not STATS_LOG or getattr(self, "testmode", False):
+            return
+        stats.write(os.path.join(os.path.dirname(dh.shared_temp()), "si_ae_stats.jsonl"))
+        self.terminal_message(stats.summary(total))
+
+    def stopcheck(self):
+        """If the Autoexporter thread was stopped, clear temp and exit."""
+        if hasattr(self, "aeThread") and self.aeThread.stopped is True:
+            self.clear_temp()
+            sys.exit()
+
+    def read_svg(self, fin):
+        """
+        Load a document for a stage. If an earlier stage handed it off with
+        write_svg, a copy of the live tree is returned instead of reparsing.
+        """
+        svg = getattr(self, "live_docs", dict()).get(fin)
+        if svg is None:
+            self.count_stat("files_read")
+            self.count_stat("bytes_read", os.path.getsize(fin))
+            return get_svg(fin)
+        self.count_stat("memory_handoffs")
+        return copy.deepcopy(svg.getroottree()).getroot()
+
+    def write_svg(self, svg, fout):
+        """
+        Hand a document off to later stages. In pipeline mode it is only
+        written to disk when the binary needs it (see materialize).
+        The tree should not be modified afterwards.
+        """
+        if not PIPELINE or not hasattr(self, "live_docs"):
+            self.check(dh.overwrite_svg, svg, fout)
+            return
+        self.stopcheck()
+        self.live_docs[fout] = svg
+        self.unwritten = getattr(self, "unwritten", set()) | {fout}
+
+    def materialize(self, fin):
+        """Make sure a handed-off document exists on disk."""
+        if fin in getattr(self, "unwritten", set()):
+            self.check(dh.overwrite_svg, self.live_docs[fin], fin)
+            self.unwritten.discard(fin)
+        return fin
+
+    @export_stats.timed("split_acts")
     def split_acts(self, fnm, acts, reserved=None, get_bbs=True):
         """Split actions and run."""
         if reserved is None:
@@ -926,8 +1249,9 @@ class Exporter():
 
         eargs = ["--actions", "".join([str(a) for a in acts])]
         bbs = None
+        self.materialize(fnm)
         try:
-            bbs = self.check(dh.wrapped_binary,filename=fnm, inkscape_binary=self.bfn, extra_args=eargs, get_bbs = get_bbs, cwd=self.tempdir)
+            bbs = self.check(dh.wrapped_binary,filename=fnm, inkscape_binary=self.bfn, extra_args=eargs, get_bbs = get_bbs, cwd=self.tempdir, svg=getattr(self, "live_docs", dict()).get(fnm))
             fnf_err = False
         except FileNotFoundError:
             fnf_err = True
@@ -1014,9 +1338,41 @@ class Exporter():
         )
         return bbs
 
+    @export_stats.timed("export_file")
+    def output_name(self, fformat):
+        """The output file of a format (before any page suffix)"""
+        myoutput = os.path.splitext(self.outtemplate)[0] + "." + fformat
+        if fformat == "psvg":
+            myoutput = myoutput.replace(".psvg", "_plain.svg")
+        return myoutput
+
+    def remove_stale_outputs(self, myoutput, keep):
+        """Remove previous outputs of a format (e.g. old pages) not in keep"""
+        directory, file_name = os.path.split(myoutput)
+        base_name, extension = os.path.splitext(file_name)
+        if extension == ".svg" and base_name.endswith("_plain"):
+            base_name = base_name[:-6]  # Remove "_plain" from the base name
+            pattern = re.compile(
+                rf"{re.escape(base_name)}(_page_.*)?_plain{re.escape(extension)}$"
+            )
+        else:
+            pattern = re.compile(
+                rf"{re.escape(base_name)}(_page_.*)?{re.escape(extension)}$"
+            )
+        matching_files = []
+        for file in os.listdir(directory):
+            if pattern.match(file):
+                matching_files.append(os.path.join(directory, file))
+        for file in matching_files:
+            if file not in keep:
+                try:
+                    os.remove(file)
+                except PermissionError:
+                    pass
+
     def export_file(self, fin, fformat):
         """Use the Inkscape binary to export the file"""
-        myoutput = os.path.splitext(self.outtemplate)[0] + "." + fformat
+        myoutput = self.output_name(fformat)
         # self.terminal_message("Converting to " + fformat)
         timestart = time.time()
 
@@ -1025,19 +1381,17 @@ class Exporter():
 
         cfile = fin
         if self.thinline and notpng:
-            svg = get_svg(cfile)
+            svg = self.read_svg(cfile)
             if fformat in ["pdf", "eps"]:
                 Exporter.thinline_dehancement(svg, "bezier",self.duplicatelabels)
             else:
                 Exporter.thinline_dehancement(svg, "split",self.duplicatelabels)
             tmp = self.tempbase + "_tld" + fformat[0] + ".svg"
-            self.check(dh.overwrite_svg,svg, tmp)
+            self.write_svg(svg, tmp)
             cfile = copy.copy(tmp)
 
-        if fformat == "psvg":
-            myoutput = myoutput.replace(".psvg", "_plain.svg")
-
         def overwrite_output(filein, fileout):
+            self.materialize(filein)
             if os.path.exists(fileout):
                 os.remove(fileout)
             args = [
@@ -1064,17 +1418,17 @@ class Exporter():
                     + ["--export-plain-svg"]
                     + args[5:]
                 )
-            self.check(dh.subprocess_repeat,args)
+            self.check(dh.run_binary, args)
 
         def make_output(filein, fileout):
             if fileout.endswith(".svg"):
                 if not (self.testmode):
                     overwrite_output(filein, fileout)
                 else:
-                    shutil.copy(filein, fileout)  # skip conversion
+                    shutil.copy(self.materialize(filein), fileout)  # skip conversion
                 self.made_outputs = [fileout]
 
-                osvg = get_svg(filein)
+                osvg = self.read_svg(filein)
 
                 pgs = osvg.cdocsize.pgs
                 haspgs = inkex.installed_haspages
@@ -1086,31 +1440,22 @@ class Exporter():
                     pgiis = (
                         range(len(pgs)) if not (self.testmode) else [self.testpage - 1]
                     )
-                    for i in pgiis:
-                        # match the viewbox to each page and delete them
-                        psvg = get_svg(fileout)
-                        # plain SVG has no pages
+                    # Parse once and bin every element by page with a spatial
+                    # index, so only the off-page content changes between pages
+                    psvg = get_svg(fileout)
+                    if self.testmode:
+                        # plain SVG has no pages, only need to delete in testmode
                         pgs2 = psvg.cdocsize.pgs
-
-                        Exporter.change_viewbox_to_page(psvg, pgs[i])
-                        # Only need to delete other Pages in testmode since
-                        # plain SVGs have none
-                        if self.testmode:
-                            for j in reversed(range(len(pgs2))):
-                                pgs2[j].delete()
-
-                        # Delete content not on current page
-                        pgbb = dh.bbox(psvg.cdocsize.effvb)
-                        for k, bbx in bbs.items():
-                            removeme = not (dh.bbox(bbx).intersect(pgbb))
-                            if k in dlbl:
-                                removeme = not (
-                                    dlbl[k] in bbs
-                                    and dh.bbox(bbs[dlbl[k]]).intersect(pgbb)
-                                )
-                            if removeme and psvg.getElementById(k) is not None:
-                                psvg.getElementById(k).delete()
-
+                        for j in reversed(range(len(pgs2))):
+                            pgs2[j].delete()
+                    newvbs = [osvg.cdocsize.pxtouu(pgs[i].bbpx) for i in pgiis]
+                    pgbbs = []
+                    for newvb in newvbs:
+                        psvg.set_viewbox(newvb)
+                        pgbbs.append(dh.bbox(psvg.cdocsize.effvb))
+                    pages = Exporter.detach_offpage(psvg, bbs, pgbbs, dlbl)
+                    for ii, i in zip(pages, pgiis):
+                        psvg.set_viewbox(newvbs[ii])
                         pname = pgs[i].get("inkscape:label")
                         pname = str(i + 1) if pname is None else pname
                         addendum = (
@@ -1124,34 +1469,47 @@ class Exporter():
                         outputs.append(pgout)
                     self.made_outputs = outputs
             else:
-                svg = get_svg(filein)
+                svg = self.read_svg(filein)
                 pgs = svg.cdocsize.pgs
 
                 haspgs = inkex.installed_haspages
                 if (haspgs or self.testmode) and len(pgs) > 1:
-                    outputs = []
                     pgiis = (
                         range(len(pgs)) if not (self.testmode) else [self.testpage - 1]
                     )
-                    for i in pgiis:
-                        # match the viewbox to each page and delete them
-                        svgpg = get_svg(filein)
-                        pgs2 = svgpg.cdocsize.pgs
-                        Exporter.change_viewbox_to_page(svgpg, pgs[i])
-                        for j in reversed(range(len(pgs2))):
-                            pgs2[j].delete()
-
-                        pname = pgs[i].get("inkscape:label")
+                    # Split into per-page SVGs in a single pass: compute every
+                    # page's viewbox before the Pages are deleted, then only
+                    # the viewbox changes between writes
+                    newvbs = [svg.cdocsize.pxtouu(pgs[i].bbpx) for i in pgiis]
+                    pnames = [pgs[i].get("inkscape:label") for i in pgiis]
+                    for pgv in reversed(pgs):
+                        pgv.delete()
+
+                    jobs = []
+                    for i, newvb, pname in zip(pgiis, newvbs, pnames):
                         pname = str(i + 1) if pname is None else pname
                         addendum = "_page_" + pname if not (self.testmode) else ""
                         svgpgfn = self.tempbase + addendum + ".svg"
-                        self.check(dh.overwrite_svg, svgpg, svgpgfn)
+                        svg.set_viewbox(newvb)
+                        self.check(dh.overwrite_svg, svg, svgpgfn)
 
                         outparts = fileout.split(".")
                         pgout = ".".join(outparts[:-1]) + addendum + "." + outparts[-1]
-                        overwrite_output(svgpgfn, pgout)
-                        outputs.append(pgout)
-                    self.made_outputs = outputs
+                        jobs.append((svgpgfn, pgout))
+
+                    # Convert the pages concurrently
+                    nworkers = min(len(jobs), MAX_PAGE_WORKERS)
+                    self.page_message = " ({0} pages, {1} at a time)".format(
+                        len(jobs), nworkers
+                    )
+                    with ThreadPoolExecutor(max_workers=nworkers) as pool:
+                        futs = [
+                            export_stats.submit(pool, overwrite_output, *job)
+                            for job in jobs
+                        ]
+                        for fut in futs:
+                            fut.result()
+                    self.made_outputs = [pgout for _, pgout in jobs]
                 else:
                     overwrite_output(filein, fileout)
                     self.made_outputs = [fileout]
@@ -1177,37 +1535,27 @@ class Exporter():
                 self.check(dh.overwrite_svg,svg, finalname)
                 finalnames.append(finalname)
 
+        self.exported_files = getattr(self, "exported_files", []) + finalnames
+        if fformat == "pdf" and self.latexpdf:
+            self.exported_files += [
+                f + "_tex" for f in finalnames if os.path.exists(f + "_tex")
+            ]
+
         # Remove any previous outputs that we did not just make
-        directory, file_name = os.path.split(myoutput)
-        base_name, extension = os.path.splitext(file_name)
-        if extension == ".svg" and base_name.endswith("_plain"):
-            base_name = base_name[:-6]  # Remove "_plain" from the base name
-            pattern = re.compile(
-                rf"{re.escape(base_name)}(_page_.*)?_plain{re.escape(extension)}$"
-            )
-        else:
-            pattern = re.compile(
-                rf"{re.escape(base_name)}(_page_.*)?{re.escape(extension)}$"
-            )
-        matching_files = []
-        for file in os.listdir(directory):
-            if pattern.match(file):
-                matching_files.append(os.path.join(directory, file))
-        for file in matching_files:
-            if file not in finalnames:
-                try:
-                    os.remove(file)
-                except PermissionError:
-                    pass
+        self.remove_stale_outputs(myoutput, finalnames)
 
         toc = time.time() - timestart
         self.terminal_message("Conversion to "
         + fformat
         + " done ("
         + str(round(1000 * toc) / 1000)
-        + " s)")
+        + " s)"
+        + getattr(self, "page_message", ""))
+        self.page_message = ""
+
         return True, myoutput
 
+    @export_stats.timed("postprocessing")
     def postprocessing(self, svg):
         """Postprocessing of SVGs, mainly for overcoming bugs in Office products"""
         vds = dh.visible_descendants(svg)
@@ -1317,6 +1665,7 @@ class Exporter():
         tel.set("style", "display:none")
         dh.clean_up_document(svg)  # Clean up
         
+    @export_stats.timed("finalize", report=True)
     def finalize(self):
         self.tempdir, self.temphead = dh.shared_temp('ae')
         self.tempbase = joinmod(self.tempdir,self.temphead)
@@ -1328,7 +1677,7 @@ class Exporter():
         
         uzo_path = self.tempbase + '_uzo'
         from office import Unzipped_Office
-        uzo = Unzipped_Office(original,uzo_path,aecaller=self)
+        uzo = Unzipped_Office(original,uzo_path,aecaller=self,lazy=True)
         uzo.embed_linked()
         
         # self.finalizermode=7
@@ -1826,6 +2175,71 @@ class Exporter():
         newvb = page.croot.cdocsize.pxtouu(page.bbpx)
         svg.set_viewbox(newvb)
 
+    @staticmethod
+    def partition_pages(bbs, pgbbs, dlbl):
+        """
+        Find which pages each element's bounding box intersects, using a
+        spatial index over the page boxes. Elements in dlbl take the pages of
+        the element they label. Returns a dict of id -> set of page indices.
+        """
+        grid = dh.BBoxGrid(pgbbs)
+        ret = dict()
+        for k, bbx in bbs.items():
+            if k in dlbl:
+                bbx = bbs.get(dlbl[k])
+            ret[k] = set(grid.query(dh.bbox(bbx))) if bbx is not None else set()
+        return ret
+
+    @staticmethod
+    def detach_offpage(svg, bbs, pgbbs, dlbl):
+        """
+        For each page in turn, detach the topmost elements of bbs that are not
+        on it and yield the page index, reattaching them before the next page.
+        Elements are grouped under their nearest ancestor in bbs once, so each
+        page only visits the children of the elements kept on it.
+        """
+        onpage = Exporter.partition_pages(bbs, pgbbs, dlbl)
+        keeps = [set() for _ in pgbbs]
+        for k, pgiis in onpage.items():
+            for ii in pgiis:
+                keeps[ii].add(k)
+
+        kids = dict()  # nearest ancestor id in bbs -> elements, in order
+        near = {svg: None}  # element -> its nearest id in bbs (or its own)
+        order = dict()
+        for n, el in enumerate(svg.iter("*")):
+            order[el] = n
+            if el is svg:
+                continue
+            pkey = near[el.getparent()]
+            elid = el.get("id")
+            if elid in bbs:
+                kids.setdefault(pkey, []).append(el)
+                near[el] = elid
+            else:
+                near[el] = pkey
+
+        for ii, keep in enumerate(keeps):
+            removed = []
+            stack = [None]
+            while stack:
+                for el in kids.get(stack.pop(), ()):
+                    if el.get("id") in keep:
+                        stack.append(el.get("id"))
+                    else:
+                        removed.append(el)
+            removed.sort(key=lambda el: order[el], reverse=True)
+            detached = []
+            for elem in removed:
+                par = elem.getparent()
+                detached.append((elem, par, par.index(elem)))
+                elem.delete()
+            yield ii
+
+            # Reattach in document order for the next page
+            for elem, par, idx in reversed(detached):
+                par.insert(idx, elem)
+
     @staticmethod
     def get_markers(elem):
         """Returns valid marker keys and corresponding elements"""
@@ -2013,114 +2427,70 @@ class Exporter():
                 el.cstyle['fill'] = ssty.get('fill', dsa.get('fill'))
                 el.cstyle['stroke'] = ssty.get('stroke', dsa.get('stroke'))
 
-        pagecolor = None
+        # Gather the colors to convert, then convert all at once
+        found = []
+        parsed = dict()
         for el in els:
             for attr in ('stroke','fill','stop-color'):
                 color_sty = el.ccascaded_style.get(attr)
                 color_att = el.get(attr)
                 color = color_sty or color_att
                 if color and 'url' not in color and color!='none':
-                    # dh.idebug((el.get_id(),attr,color))
-                    try:
-                        color = inkex.Color(color).to_rgb()
-                        icolor = Exporter.invert_color(color)
-                        el.cstyle[attr] = str(icolor)
-                        el.pop(attr,None)
-                        
-                        if 'filter' in el.ccascaded_style:
-                            filt = el.ccascaded_style.get_link('filter', el.croot)
-                            if filt is not None:
-                                filt.cstyle['color-interpolation-filters']='auto'
-                    except inkex.colors.ColorError:
-                        pass
-                    
+                    if color not in parsed:
+                        try:
+                            parsed[color] = inkex.Color(color).to_rgb()
+                        except inkex.colors.ColorError:
+                            parsed[color] = None
+                    if parsed[color] is not None:
+                        found.append((el, attr, color))
             if el.tag == nvtag:
                 color = el.get("pagecolor", "#ffffff")
-                color = inkex.Color(color).to_rgb()
-                if color:
-                    pagecolor = Exporter.invert_color(color)
-                    el.set("pagecolor",str(pagecolor))
+                parsed[color] = inkex.Color(color).to_rgb()
+                if parsed[color]:
+                    found.append((el, "pagecolor", color))
+        ucolors = [c for c in parsed if parsed[c]]
+        icolors = Exporter.invert_colors([parsed[c] for c in ucolors])
+        inverted = dict(zip(ucolors, icolors))
+
+        # Apply them
+        pagecolor = None
+        for el, attr, color in found:
+            if attr == "pagecolor":
+                pagecolor = inverted[color]
+                el.set("pagecolor", str(pagecolor))
+                continue
+            el.cstyle[attr] = str(inverted[color])
+            el.pop(attr,None)
+
+            if 'filter' in el.ccascaded_style:
+                filt = el.ccascaded_style.get_link('filter', el.croot)
+                if filt is not None:
+                    filt.cstyle['color-interpolation-filters']='auto'
         return pagecolor
 
     @staticmethod
     def invert_color(color):
-        def rgb_to_hsl_255(r, g, b):
-            r /= 255.0
-            g /= 255.0
-            b /= 255.0
-        
-            cmax = max(r, g, b)
-            cmin = min(r, g, b)
-            delta = cmax - cmin
-        
-            # Lightness
-            l = (cmax + cmin) / 2.0
-        
-            # Saturation
-            if delta == 0:
-                s = 0.0
-                h = 0.0
-            else:
-                s = delta / (1.0 - abs(2.0*l - 1.0))
-        
-                if cmax == r:
-                    h = ((g - b) / delta) % 6.0
-                elif cmax == g:
-                    h = (b - r) / delta + 2.0
-                else:
-                    h = (r - g) / delta + 4.0
-        
-                h *= 60.0
-        
-            # Scale to 0–255
-            h = h * 255.0 / 360.0
-            s = s * 255.0
-            l = l * 255.0
-        
-            return h, s, l
-        def hsl_to_rgb_255(h, s, l):
-            h = (h * 360.0 / 255.0) % 360.0
-            s /= 255.0
-            l /= 255.0
-        
-            c = (1.0 - abs(2.0*l - 1.0)) * s
-            x = c * (1.0 - abs((h / 60.0) % 2.0 - 1.0))
-            m = l - c / 2.0
-        
-            if h < 60:
-                rp, gp, bp = c, x, 0
-            elif h < 120:
-                rp, gp, bp = x, c, 0
-            elif h < 180:
-                rp, gp, bp = 0, c, x
-            elif h < 240:
-                rp, gp, bp = 0, x, c
-            elif h < 300:
-                rp, gp, bp = x, 0, c
-            else:
-                rp, gp, bp = c, 0, x
-        
-            r = int(round((rp + m) * 255.0))
-            g = int(round((gp + m) * 255.0))
-            b = int(round((bp + m) * 255.0))
-        
-            # Hard clamp (defensive, but should never trigger)
-            r = max(0, min(255, r))
-            g = max(0, min(255, g))
-            b = max(0, min(255, b))
-        
-            return r, g, b
-        
-        r, g, b, a = color.to_rgba()
-        h, s, l = rgb_to_hsl_255(r, g, b)
+        return Exporter.invert_colors([color])[0]
 
-        # l = 255-l
-        # r2, g2, b2 = hsl_to_rgb_255(h, s, linv)
-        
+    @staticmethod
+    def invert_colors(colors):
+        """
+        Dark-mode versions of a list of colors. Unique colors are converted
+        together and remembered across documents, and dark_mode_colors from
+        the config take precedence.
+        """
+        rgbs = [tuple(c.to_rgba()[:3]) for c in colors]
+        known = {rgb: _inverted_colors.get(rgb) for rgb in set(rgbs)}
+        todo = [rgb for rgb, inv in known.items() if inv is None]
+        if todo:
+            inv = Exporter.invert_rgb255_lab_d50_array(todo)
+            new = {rgb: tuple(int(v) for v in irgb) for rgb, irgb in zip(todo, inv)}
+            known.update(new)
+            if len(_inverted_colors) + len(new) > MAX_INVERTED_COLORS:
+                _inverted_colors.clear()
+            _inverted_colors.update(new)
         dmc = dh.si_config.dark_mode_colors
-        r2, g2, b2 = dmc.get((r,g,b),Exporter.invert_rgb255_lab_d50(r, g, b))
-        
-        return inkex.colors.Color([r2, g2, b2])
+        return [inkex.colors.Color(list(dmc.get(rgb, known[rgb]))) for rgb in rgbs]
 
     @staticmethod
     def invert_rgb255_lab_d50(r, g, b):
@@ -2277,6 +2647,68 @@ class Exporter():
             int(round(gf2 * 255.0)),
             int(round(bf2 * 255.0)),
         )
+
+    @staticmethod
+    def invert_rgb255_lab_d50_array(rgbs):
+        """
+        Vectorized invert_rgb255_lab_d50 for an (n, 3) array of 0–255 ints.
+        Returns an (n, 3) int array.
+        """
+        import numpy as np
+
+        D50 = np.array([0.964212, 1.0, 0.825188])
+        D65 = np.array([0.95042855, 1.0, 1.0889004])
+        BRADFORD = np.array(
+            [
+                [0.8951, 0.2664, -0.1614],
+                [-0.7502, 1.7135, 0.0367],
+                [0.0389, 0.0685, 1.0296],
+            ]
+        )
+        XYZ_FROM_LINEAR_SRGB = np.array(
+            [
+                [0.41238642, 0.3575915, 0.18045056],
+                [0.21263677, 0.715183, 0.07218022],
+                [0.019330615, 0.11919712, 0.95037293],
+            ]
+        )
+        scale = (BRADFORD @ D50) / (BRADFORD @ D65)
+        ADAPT_D65_TO_D50 = np.linalg.inv(BRADFORD) @ (scale[:, None] * BRADFORD)
+        RGB_TO_XYZ_D50 = ADAPT_D65_TO_D50 @ XYZ_FROM_LINEAR_SRGB
+        XYZ_D50_TO_RGB = np.linalg.inv(RGB_TO_XYZ_D50)
+        sigma = 6.0 / 29.0
+        sigma2 = 36.0 / 841.0
+        sigma3 = 216.0 / 24389.0
+
+        # sRGB -> linear -> XYZ (D50) -> Lab
+        u = np.asarray(rgbs, dtype=float).reshape(-1, 3) / 255.0
+        lin = np.where(u < 0.04045, u / 12.92, ((u + 0.055) / 1.055) ** 2.4)
+        t = (lin @ RGB_TO_XYZ_D50.T) / D50
+        f = np.where(
+            t > sigma3, np.cbrt(np.maximum(t, 0)), t / (3.0 * sigma2) + 4.0 / 29.0
+        )
+        L = np.clip(116.0 * f[:, 1] - 16.0, 0.0, 100.0)
+        a = np.clip(500.0 * (f[:, 0] - f[:, 1]), -128.0, 128.0)
+        b = np.clip(200.0 * (f[:, 1] - f[:, 2]), -128.0, 128.0)
+
+        # Lightness mapping, then Lab -> XYZ -> linear
+        L2 = np.minimum(110.0 - L, 100.0)
+        fy = (L2 + 16.0) / 116.0
+        f2 = np.stack([fy + a / 500.0, fy, fy - b / 200.0], axis=1)
+        xyz = np.where(f2 > sigma, f2**3, 3.0 * sigma2 * (f2 - 4.0 / 29.0)) * D50
+        lin2 = np.clip(xyz @ XYZ_D50_TO_RGB.T, 0.0, 1.0)
+
+        # linear -> sRGB
+        u2 = np.where(
+            lin2 < 0.0031308, 12.92 * lin2, 1.055 * lin2 ** (1.0 / 2.4) - 0.055
+        )
+        u2 = np.clip(u2, 0.0, 1.0)
+
+        # Small near-gray tweak in a narrow band
+        gray = (np.abs(u2[:, 0] - u2[:, 1]) < 1e-7) & (np.abs(u2[:, 0] - u2[:, 2]) < 1e-7)
+        band = gray & (u2[:, 0] > 18.0 / 255.0) & (u2[:, 0] < 32.0 / 255.0)
+        u2[band] = 18.0 / 255.0
+        return np.round(u2 * 255.0).astype(int)
     
     @staticmethod
     def find_image_overlaps(svg, min_frac=0.4):
@@ -2309,8 +2741,8 @@ class Exporter():
 
         img_bbs = [bbs[ii] for ii in img_iis]
 
-        # One big intersects matrix (same as removerectw)
-        intrscts = dh.bb_intersects(bbs, img_bbs)
+        # Spatial index so each image only tests nearby elements
+        grid = dh.BBoxGrid(bbs)
 
         selected_full = np.zeros(len(vds), dtype=bool)
         text_hits = {}  # key: ngs3 index -> set(char_indices)
@@ -2377,14 +2809,14 @@ class Exporter():
             return out
 
 
-        # Per-image loop, but using the Flattener removerectw slice trick for "on top"
+        # Per-image loop, keeping only hits after the image ("on top")
         for jj, img_row in enumerate(img_iis):
             start = img_row + 1
             if start >= len(vds):
                 continue
 
-            hit_rows = np.nonzero(intrscts[start:, jj])[0] + start
-            if hit_rows.size == 0:
+            hit_rows = [k for k in grid.query(img_bbs[jj]) if k >= start]
+            if not hit_rows:
                 continue
 
             ib = img_bbs[jj]
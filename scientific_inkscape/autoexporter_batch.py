@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Copyright (c) 2025 David Burghoff <burghoff@utexas.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Headless batch export with the Autoexporter.
+
+Exports every SVG in the given files and directories using a pool of
+processes, then prints a JSON summary with each file's status, time, and
+outputs. Export options use the same names as the extension dialog:
+
+    python autoexporter_batch.py figures/ --usepdf=true --usepng=true
+        --dpi=300 --writedir=out --jobs=4 --summary=summary.json
+
+The exit code is 1 if any file failed.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import traceback
+import concurrent.futures
+
+import dhelpers as dh  # noqa # puts the packaged inkex on the path
+import inkex
+import autoexporter
+import inkscape_shell
+from autoexporter import Exporter
+
+FORMATS = ["pdf", "png", "emf", "eps", "psvg"]
+EXCLUDES = re.compile(
+    r"(_portable|_plain)(?: \(\d+\))?\.svg$"
+    r"|\.\d{4}_\d{2}_\d{2}_\d{2}_\d{2}_\d{2}\.\d{1,6}\.svg$"
+)
+
+
+def is_target_file(fname):
+    """SVGs that are not Autoexporter outputs or Inkscape backups"""
+    flower = os.path.basename(fname).lower()
+    return flower.endswith(".svg") and EXCLUDES.search(flower) is None
+
+
+def collect_files(paths):
+    """Returns (file, root) pairs, root being the directory it was found under"""
+    ret = []
+    for pth in paths:
+        pth = os.path.abspath(pth)
+        if os.path.isdir(pth):
+            for root, _, files in os.walk(pth):
+                ret += [
+                    (os.path.join(root, f), pth)
+                    for f in sorted(files)
+                    if is_target_file(f)
+                ]
+        elif os.path.isfile(pth):
+            ret.append((pth, os.path.dirname(pth)))
+    return ret
+
+
+def parse_options(argv):
+    """Split batch options from export options, which use the extension's parser"""
+    pars = argparse.ArgumentParser(description="Batch export SVGs")
+    pars.add_argument("paths", nargs="+", help="SVG files or directories")
+    pars.add_argument(
+        "--jobs", type=int, default=None, help="Number of export processes"
+    )
+    pars.add_argument("--summary", default=None, help="Write JSON summary here")
+    pars.add_argument("--inkscape", default=None, help="Inkscape binary")
+    pars.add_argument(
+        "--verbose", action="store_true", help="Print progress to stderr"
+    )
+    bopts, rest = pars.parse_known_args(argv)
+
+    opts, unknown = autoexporter.AutoExporter().arg_parser.parse_known_args(rest)
+    unknown = [u for u in unknown if u.startswith("-")]
+    if unknown:
+        pars.error("unrecognized arguments: " + " ".join(unknown))
+    opts.formats = [
+        fmt for fmt in FORMATS if getattr(opts, "use" + fmt, False)
+    ] or ["pdf"]
+    opts.reduce_images = opts.imagemode2
+    opts.dpi = float(opts.dpi)
+    opts.exportnow = False
+    opts.testmode = False
+    opts.debug = False
+    opts.guitype = "terminal"
+    opts.bfn = bopts.inkscape or inkex.inkscape_system_info.binary_location
+    for att in ("output", "input_file"):
+        if hasattr(opts, att):
+            delattr(opts, att)
+    return bopts, opts
+
+
+def outtemplate(fname, root, writedir):
+    """Output location, mirroring the input tree under writedir"""
+    if not writedir:
+        return fname
+    rel = os.path.relpath(fname, start=root)
+    outdir = os.path.join(os.path.abspath(writedir), os.path.dirname(rel))
+    os.makedirs(outdir, exist_ok=True)
+    return os.path.join(outdir, os.path.basename(rel))
+
+
+def init_worker():
+    # Keep one Inkscape running per process between files
+    inkscape_shell.enable(1)
+
+
+def export_one(fname, root, opts, verbose):
+    """Export one file in a worker process and report the result"""
+    tic = time.time()
+    opts.original_file = fname
+    opts.outtemplate = outtemplate(fname, root, opts.writedir)
+    opts.prints = (lambda *a, **k: print(*a, file=sys.stderr)) if verbose else False
+    ret = {"file": fname, "status": "ok", "outputs": [], "error": None}
+    try:
+        exp = Exporter(fname, opts)
+        exp.export_all()
+        ret["outputs"] = getattr(exp, "exported_files", [])
+    except (Exception, SystemExit):  # pylint: disable=broad-except
+        ret["status"] = "error"
+        ret["error"] = traceback.format_exc()
+    ret["time"] = round(time.time() - tic, 3)
+    return ret
+
+
+def main(argv=None):
+    bopts, opts = parse_options(sys.argv[1:] if argv is None else argv)
+    files = collect_files(bopts.paths)
+    njobs = bopts.jobs or min(len(files), os.cpu_count() or 1) or 1
+
+    tic = time.time()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=njobs, initializer=init_worker
+    ) as pool:
+        futs = {
+            pool.submit(export_one, f, root, opts, bopts.verbose): f
+            for f, root in files
+        }
+        for fut in concurrent.futures.as_completed(futs):
+            try:
+                res = fut.result()
+            except Exception:  # pylint: disable=broad-except
+                # Worker process died
+                res = {
+                    "file": futs[fut],
+                    "status": "error",
+                    "outputs": [],
+                    "error": traceback.format_exc(),
+                    "time": None,
+                }
+            results.append(res)
+            if bopts.verbose:
+                print(res["file"] + ": " + res["status"], file=sys.stderr)
+
+    results.sort(key=lambda r: r["file"])
+    summary = {
+        "files": results,
+        "ok": sum(r["status"] == "ok" for r in results),
+        "failed": sum(r["status"] != "ok" for r in results),
+        "time": round(time.time() - tic, 3),
+        "jobs": njobs,
+        "formats": opts.formats,
+    }
+    out = json.dumps(summary, indent=2)
+    if bopts.summary:
+        with open(bopts.summary, "w", encoding="utf-8") as f:
+            f.write(out)
+    else:
+        print(out)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
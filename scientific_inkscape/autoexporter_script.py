@@ -33,6 +33,10 @@ import inkex.text.parser  # noqa # needed to prevent GTK crashing
 
 import autoexporter
 from autoexporter import Exporter, write_autoexporter_bat
+import inkscape_shell
+from export_scheduler import ExportScheduler
+
+inkscape_shell.enable()  # keep Inkscape running between exports
 
 global mprint
 def mprint(*args, **kwargs):
@@ -174,6 +178,7 @@ if packages not in sys.path:
 import os
 from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
+import file_observers
 
 class Watcher(FileSystemEventHandler):
     """Class that watches a folder for changes to SVGs"""
@@ -187,13 +192,21 @@ class Watcher(FileSystemEventHandler):
         self.deletefcn = deletefcn
         self.debounce_timers = {}
         self.file_mod_times = {}
-        self.observer = PollingObserver(timeout=0.5)
+        self.observer = file_observers.make_observer(directory_to_watch)
         self.start()
 
     def start(self):
         self.initialize_mod_times(self.directory_to_watch)
-        self.observer.schedule(self, self.directory_to_watch, recursive=True)
-        self.observer.start()
+        try:
+            self.observer.schedule(self, self.directory_to_watch, recursive=True)
+            self.observer.start()
+        except OSError:
+            # Native watch failed (e.g. inotify watch limit), poll instead
+            if isinstance(self.observer, PollingObserver):
+                raise
+            self.observer = PollingObserver(timeout=0.5)
+            self.observer.schedule(self, self.directory_to_watch, recursive=True)
+            self.observer.start()
 
     def stop(self):
         self.observer.stop()
@@ -209,7 +222,7 @@ class Watcher(FileSystemEventHandler):
     def initialize_mod_times(self, directory):
         for root, dirs, files in os.walk(directory):
             for file in files:
-                file_path = os.path.join(root, file)
+                file_path = os.path.abspath(os.path.join(root, file))
                 if os.path.isfile(file_path) and is_target_file(file_path):
                     mod_time = self.get_mod_time(file_path)
                     if mod_time is not None:
@@ -247,7 +260,8 @@ class Watcher(FileSystemEventHandler):
     def handle_event(self, event):
         if event.is_directory:
             return
-        file_path = event.src_path
+        # Native and polling observers can report paths differently
+        file_path = os.path.abspath(event.src_path)
         if not is_target_file(file_path):
             return
 
@@ -297,16 +311,15 @@ class FileCheckerThread(threading.Thread):
         self.watcher = None
         self.watchdir = input_options.watchdir
         self.writedir = input_options.writedir
-        self.thread_queue = []
-        self.running_threads = []
-        self.finished_threads = []
+        # Jobs run on a fixed pool, newest files first and finalization last.
+        # Requeuing a file supersedes its queued or running job.
+        self.scheduler = ExportScheduler()
+        self.ncompleted = 0
 
     def queue_thread(self, f):
-        for t in self.thread_queue + self.running_threads:
-            if t.file == f:
-                t.stopped = True
-        fthr = AutoExporterThread()
+        fthr = AutoExporterJob()
         fthr.file = f
+        fthr.scheduler = self.scheduler
         
         # Compute output directory, making them if necessary
         f_abs       = os.path.abspath(f)
@@ -328,7 +341,7 @@ class FileCheckerThread(threading.Thread):
             os.makedirs(outdir, exist_ok=True)
             fthr.outtemplate = autoexporter.joinmod(outdir, base_name)
         
-        self.thread_queue.append(fthr)
+        self.scheduler.submit(f, fthr, priority=ExportScheduler.priority(f))
         
     def delete_exports_for(self, f):
         """
@@ -423,29 +436,33 @@ class FileCheckerThread(threading.Thread):
                 for f in sorted(updatefiles):
                     self.queue_thread(f)
 
-                while len(self.thread_queue) > 0 and not self.stopped:
-                    self.thread_queue[0].start()
-                    self.running_threads.append(self.thread_queue[0])
-                    self.thread_queue.remove(self.thread_queue[0])
-
-                for thr in reversed(self.running_threads):
-                    if not thr.is_alive():
-                        self.running_threads.remove(thr)
-                        self.finished_threads.append(thr)
-                        self.promptpending = True
+                if self.scheduler.completed != self.ncompleted:
+                    self.promptpending = True
                 loopme = self.dm
 
-            if self.promptpending and len(self.running_threads) + len(self.thread_queue) == 0:
+            if self.promptpending and self.scheduler.idle():
                 if guitype == "terminal":
+                    self.print_latency()
                     mprint(promptstring)
+                self.ncompleted = self.scheduler.completed
                 self.promptpending = False
+            self.scheduler.wait(0.25)
 
         self.watcher.stop()
-        for t in self.running_threads:
-            t.stopped = True
-        for thr in reversed(self.running_threads):
-            self.running_threads.remove(thr)
-            self.finished_threads.append(thr)
+        self.scheduler.close()
+
+    def print_latency(self):
+        """Summarize jobs finished since the last prompt"""
+        done = self.scheduler.completed - self.ncompleted
+        lats = self.scheduler.latencies()[-done:] if done > 0 else []
+        if len(lats) > 1:
+            mprint(
+                "{0} jobs done, mean wait {1:.1f} s, mean run {2:.1f} s".format(
+                    len(lats),
+                    sum(l[1] for l in lats) / len(lats),
+                    sum(l[2] for l in lats) / len(lats),
+                )
+            )
 
 class PromptThread(threading.Thread):
     def __init__(self):
@@ -456,11 +473,12 @@ class PromptThread(threading.Thread):
         self.ui = input("")
 
 
-class AutoExporterThread(threading.Thread):
+class AutoExporterJob:
+    """An export or finalization run on a FileCheckerThread scheduler worker"""
     def __init__(self):
-        threading.Thread.__init__(self)
         self.file = None
         self.outtemplate = None
+        self.scheduler = None
         self.stopped = False
 
     def run(self):
@@ -479,12 +497,14 @@ class AutoExporterThread(threading.Thread):
         except:
             offset = 40
         fname = fname + " " * max(0, offset - len(fname))
+        depth = self.scheduler.depth if self.scheduler is not None else 0
+        queued = " ({0} queued)".format(depth) if depth > 0 else ""
         if self.file.lower().endswith(".svg"):
             if not opts.formats: # finalization only
                 return
-            mprint(fname + ": Beginning export")
+            mprint(fname + ": Beginning export" + queued)
         else:
-            mprint(fname + ": Beginning finalization")
+            mprint(fname + ": Beginning finalization" + queued)
         
         opts.debug = DEBUG
         opts.prints = mprint
@@ -59,6 +59,7 @@ import speedups  # noqa
 
 from inkex import Style
 from inkex.text.cache import BaseElementCache
+from inkex.text.metrics_cache import cache_dir, prune_cache
 
 from inkex.text.utils import (
     composed_width,
@@ -72,8 +73,8 @@ from inkex.text.utils import (
 
 from inkex import Tspan, Transform, Path, PathElement, BaseElement
 from applytransform_mod import fuseTransform
-import lxml, math, re, os, random, sys
-from functools import lru_cache
+from inkscape_shell import run_binary
+import lxml, math, re, os, random, sys, weakref
 
 # Parsed Inkex version, with extension back to v0.92.4
 if not hasattr(inkex, "__version__"):
@@ -606,10 +607,10 @@ def wrapped_binary(
 
     if get_bbs:
         arg2 = [inkscape_binary, "--query-all"] + extra_args + [filename]
-        proc = subprocess_repeat(arg2, cwd=cwd)
+        proc = run_binary(arg2, cwd=cwd)
     else:
         arg2 = [inkscape_binary] + extra_args + [filename]
-        proc = subprocess_repeat(arg2, cwd=cwd)
+        proc = run_binary(arg2, cwd=cwd)
         return None
     tfstr = proc.stdout
 
@@ -623,7 +624,10 @@ def wrapped_binary(
         if str(line)[2:52] == "WARNING: Requested update while update in progress":
             continue
             # skip warnings (version 1.0 only?)
-        data = [float(x.strip("'")) for x in str(line).split(",")[1:]]
+        try:
+            data = [float(x.strip("'")) for x in str(line).split(",")[1:]]
+        except ValueError:
+            continue  # shell-mode messages
         if keyv != "'":  # sometimes happens in v1.3
             bbs[keyv] = data
 
@@ -639,24 +643,64 @@ def wrapped_binary(
     return bbs
 
 
+# Results of hasbbox and isdrawn are cached per document in svg.elcache,
+# which is cleared on deletion, insertion, and appending. Changes to display
+# remove the affected subtree from the isdrawn cache. All documents' caches
+# are cleared together once MAX_ELCACHE entries have been added to them.
+MAX_ELCACHE = 100000
+_elcache_docs = weakref.WeakSet()
+_elcache_adds = 0
+
+
+def elcache(el, name):
+    """The document's cache for a property, or None if el is not in a document"""
+    svg = el.croot
+    if svg is None:
+        return None
+    _elcache_docs.add(svg)
+    return svg.elcache.setdefault(name, dict())
+
+
+def elcache_store(cache, el, val):
+    """Add a cache entry, enforcing the MAX_ELCACHE cap across documents"""
+    global _elcache_adds
+    if cache is None:
+        return
+    _elcache_adds += 1
+    if _elcache_adds > MAX_ELCACHE:
+        for svg in list(_elcache_docs):
+            for props in svg.elcache.values():
+                props.clear()  # in place, as callers may hold them
+        _elcache_adds = 1
+    cache[el] = val
+
+
 # Determine if object has a bbox
-@lru_cache(maxsize=None)
 def hasbbox(el):
+    cache = elcache(el, "hasbbox")
+    if cache is not None and el in cache:
+        return cache[el]
     myp = el.getparent()
     if myp is None:
-        return el.tag == svgtag
+        ret = el.tag == svgtag
     else:
-        return el.tag not in unrendered if hasbbox(myp) else False
+        ret = el.tag not in unrendered if hasbbox(myp) else False
+    elcache_store(cache, el, ret)
+    return ret
 
 
 # Determine if object itself is drawn
-@lru_cache(maxsize=None)
 def isdrawn(el):
-    return (
+    cache = elcache(el, "isdrawn")
+    if cache is not None and el in cache:
+        return cache[el]
+    ret = (
         el.tag not in grouplike_tags
         and hasbbox(el)
         and el.cspecified_style.get("display") != "none"
     )
+    elcache_store(cache, el, ret)
+    return ret
 
 
 # A wrapper that replaces get_bounding_boxes with Pythonic calls only if possible
@@ -689,6 +733,7 @@ def BB2(svg, els=None, forceupdate=False, roughpath=False, parsed=False):
                 ptl = parser.ParsedTextList(tels)
                 ptl.precalcs()
         ret = dict()
+        batch_bounding_boxes(allds, roughpath=roughpath, parsed=parsed)
         for d in els:
             if d.tag in bb2_support_tags and hasbbox(d):
                 mbbox = bounding_box2(d, roughpath=roughpath, parsed=parsed)
@@ -707,7 +752,10 @@ def BB2(svg, els=None, forceupdate=False, roughpath=False, parsed=False):
             tname = os.path.abspath(temp.name)
         try:
             overwrite_svg(svg, tname)
-            ret = wrapped_binary(filename=tname, svg=svg)
+            ret = cached_query(tname)
+            if ret is None:
+                ret = wrapped_binary(filename=tname, svg=svg)
+                cached_query(tname, ret)
         finally:
             if os.path.exists(tname):
                 os.remove(tname)
@@ -715,6 +763,42 @@ def BB2(svg, els=None, forceupdate=False, roughpath=False, parsed=False):
     return ret
 
 
+USE_QUERY_CACHE = True
+MAX_CACHED_QUERIES = 1000
+
+
+def cached_query(fname, bbs=None):
+    """
+    Persistent cache of --query-all results, keyed on the bytes of the
+    queried file and the Inkscape version. Returns the cached bounding boxes,
+    or stores bbs if they are given.
+    """
+    if not USE_QUERY_CACHE:
+        return None
+    import hashlib
+    import json
+
+    try:
+        hsh = hashlib.sha256()
+        hsh.update(repr((vstr, inkex.inkscape_system_info.binary_location)).encode())
+        with open(fname, "rb") as f:
+            hsh.update(f.read())
+        cfile = os.path.join(cache_dir("bboxes"), hsh.hexdigest() + ".json")
+        if bbs is None:
+            with open(cfile, "r", encoding="utf-8") as f:
+                ret = json.load(f)
+            os.utime(cfile)  # mark as recently used
+            return ret
+        tmp = cfile + ".{0}.tmp".format(os.getpid())
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(bbs, f)
+        os.replace(tmp, cfile)
+        prune_cache(cache_dir("bboxes"), MAX_CACHED_QUERIES)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
 # For diagnosing BB2
 def Check_BB2(svg):
     bb2 = BB2(svg)
@@ -772,27 +856,109 @@ def bb_intersects(bbs, bb2s=None):
         )
 
 
+class BBoxGrid:
+    """
+    Uniform-grid spatial index over a list of bboxes. Each box is binned into
+    the cells it overlaps, so a query only tests boxes in nearby cells. Boxes
+    that would span too many cells are kept in a short list tested directly.
+    """
+
+    MAXCELLS = 64  # boxes covering more cells than this are not binned
+
+    def __init__(self, bbs, cellsize=None):
+        self.bbs = bbs
+        valid = [bb for bb in bbs if not bb.isnull]
+        if cellsize is None:
+            # Median box size keeps typical boxes in one to four cells
+            szs = sorted(max(bb.w, bb.h) for bb in valid)
+            cellsize = szs[len(szs) // 2] if szs else 0
+        self.cellsize = cellsize if cellsize > 0 else 1
+        self.cells = dict()
+        self.large = []
+        for i, bb in enumerate(bbs):
+            if bb.isnull:
+                continue
+            if not all(map(math.isfinite, (bb.x1, bb.x2, bb.y1, bb.y2))):
+                self.large.append(i)
+                continue
+            xr, yr = self.span(bb)
+            if len(xr) * len(yr) > BBoxGrid.MAXCELLS:
+                self.large.append(i)
+                continue
+            for cx in xr:
+                for cy in yr:
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def span(self, bb):
+        """Ranges of cell indices covered by a bbox"""
+        csz = self.cellsize
+        return (
+            range(math.floor(bb.x1 / csz), math.floor(bb.x2 / csz) + 1),
+            range(math.floor(bb.y1 / csz), math.floor(bb.y2 / csz) + 1),
+        )
+
+    def candidates(self, bb):
+        """Indices of boxes sharing a cell with bb (superset of hits)"""
+        ret = set(self.large)
+        if not all(map(math.isfinite, (bb.x1, bb.x2, bb.y1, bb.y2))):
+            return set(range(len(self.bbs)))
+        xr, yr = self.span(bb)
+        if len(xr) * len(yr) > len(self.cells):
+            for v in self.cells.values():
+                ret.update(v)
+            return ret
+        for cx in xr:
+            for cy in yr:
+                ret.update(self.cells.get((cx, cy), ()))
+        return ret
+
+    def query(self, bb):
+        """Sorted indices of boxes intersecting bb"""
+        if bb.isnull:
+            return []
+        return sorted(
+            i
+            for i in self.candidates(bb)
+            if not self.bbs[i].isnull and self.bbs[i].intersect(bb)
+        )
+
+
+def bb_intersect_pairs(bbs, bb2s=None):
+    """
+    Sparse version of bb_intersects: a list of (i, j) such that bbs[i]
+    intersects bb2s[j], in row-major order like np.argwhere.
+    """
+    grid = BBoxGrid(bbs if bb2s is None else bb2s)
+    return [(i, j) for i, bb in enumerate(bbs) for j in grid.query(bb)]
+
+
 # Return list of objects on top of other objects
-def overlapping_els(svg, tocheck):
+def overlapping_els(svg, tocheck, underlying=False):
+    """
+    Returns a dict of each element in tocheck -> drawn elements on top of it.
+    If underlying is True, also returns a dict of the intersecting elements
+    underneath it (including its ancestors).
+    """
     els = [el for el in svg.iter('*') if isdrawn(el)]
     bbs = BB2(svg, els, roughpath=True, parsed=True)
     bbs = [bbox(bbs.get(el.get_id())) for el in els]
-
-    chki = [i for i, el in enumerate(els) if el in tocheck]
-    bbs_check = [bbs[i] for i in chki]
-    intrscts = bb_intersects(bbs, bbs_check)
+    grid = BBoxGrid(bbs)
 
     ret = {el: [] for el in tocheck}
-    for j, ci in enumerate(chki):
-        elj = els[ci]
-        for i in range(ci + 1, len(els)):
-            eli = els[i]
-            ds = elj.descendants2()
-            if intrscts[i, j] and eli not in ds:
-                ret[elj].append(eli)
+    und = {el: [] for el in tocheck}
+    for ci, elj in enumerate(els):
+        if elj not in ret:
+            continue
+        hits = grid.query(bbs[ci])
+        ds = set(elj.descendants2())
+        ret[elj] = [els[i] for i in hits if i > ci and els[i] not in ds]
+        if underlying:
+            und[elj] = [els[i] for i in hits if i < ci]
 
     # for k,v in ret.items():
     #     dh.idebug(k.get_id()+': '+str([v2.get_id() for v2 in v]))
+    if underlying:
+        return ret, und
     return ret
 
 
@@ -1552,10 +1718,152 @@ def bounding_box2(
     return self._cbbox[inputs]
 
 
+def cubic_extents(segs):
+    """
+    Exact extents of many cubic Beziers at once. segs is an (n, 4, 2) array
+    of control points; returns (n, 2) arrays of minima and maxima.
+    """
+    import numpy as np
+
+    p0, p1, p2, p3 = segs[:, 0], segs[:, 1], segs[:, 2], segs[:, 3]
+    mins = np.minimum(p0, p3)
+    maxs = np.maximum(p0, p3)
+
+    # Roots of the derivative a*t^2 + b*t + c (divided by 3)
+    a = -p0 + 3 * p1 - 3 * p2 + p3
+    b = 2 * (p0 - 2 * p1 + p2)
+    c = p1 - p0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        quad = np.abs(a) > 1e-12
+        disc = np.sqrt(np.where(quad, b * b - 4 * a * c, np.nan))
+        lin = np.where(np.abs(b) > 1e-12, -c / b, np.nan)
+        roots = (
+            np.where(quad, (-b + disc) / (2 * a), lin),
+            np.where(quad, (-b - disc) / (2 * a), np.nan),
+        )
+    for t in roots:
+        ok = (t > 0) & (t < 1)
+        t = np.where(ok, t, 0)
+        mt = 1 - t
+        val = mt**3 * p0 + 3 * mt**2 * t * p1 + 3 * mt * t**2 * p2 + t**3 * p3
+        mins = np.where(ok, np.minimum(mins, val), mins)
+        maxs = np.where(ok, np.maximum(maxs, val), maxs)
+    return mins, maxs
+
+
+def batch_bounding_boxes(els, roughpath=False, parsed=False):
+    """
+    Populates the _cbbox cache of many path-like elements at once, as
+    bounding_box2 would with its default arguments. Control points of every
+    path are gathered into arrays and their extents, stroke padding, and
+    transforms are computed in bulk. Paths sharing a d attribute (e.g.
+    markers) are only parsed once. Elements with clips or masks, and any
+    whose path, stroke width, or transform cannot be parsed here (e.g.
+    percentage stroke widths), are left for bounding_box2.
+    """
+    import numpy as np
+
+    todo = []
+    for el in els:
+        if (
+            el.tag in cpath_support_tags
+            and el.tag != line_tag
+            and not (hasattr(el, "_cbbox") and el._cbbox)
+            and el.get_link("clip-path", llget=True) is None
+            and el.get_link("mask", llget=True) is None
+        ):
+            todo.append(el)
+    if len(todo) == 0:
+        return
+
+    # Untransformed extents of each distinct path
+    byd = dict()
+    segs, nodes, segi, nodei = [], [], [], []
+    elkeys = []
+    for i, el in enumerate(todo):
+        key = el.get("d") if el.tag == inkex.PathElement.ctag else i
+        if key not in byd:
+            idx = byd[key] = len(byd)
+            try:
+                pth = el.cpath
+                csp = inkex.CubicSuperPath(pth) if len(pth) > 0 else []
+            except Exception:  # pylint: disable=broad-except
+                csp = []
+            for sub in csp:
+                for nd in sub:
+                    # all control points for rough bboxes, only nodes otherwise
+                    pts = nd if roughpath else [nd[1]]
+                    nodes.extend(pts)
+                    nodei.extend([idx] * len(pts))
+                if not roughpath:
+                    for k in range(len(sub) - 1):
+                        segs.append([sub[k][1], sub[k][2], sub[k + 1][0], sub[k + 1][1]])
+                        segi.append(idx)
+        elkeys.append(byd[key])
+
+    npth = len(byd)
+    mins = np.full((npth, 2), np.inf)
+    maxs = np.full((npth, 2), -np.inf)
+    if nodes:
+        nodes = np.asarray(nodes, dtype=float)
+        nodei = np.asarray(nodei)
+        np.minimum.at(mins, nodei, nodes)
+        np.maximum.at(maxs, nodei, nodes)
+    if segs:
+        smin, smax = cubic_extents(np.asarray(segs, dtype=float))
+        segi = np.asarray(segi)
+        np.minimum.at(mins, segi, smin)
+        np.maximum.at(maxs, segi, smax)
+
+    # Stroke padding and composed transforms
+    elkeys = np.asarray(elkeys)
+    swds = np.zeros(len(todo))
+    tfs = np.zeros((len(todo), 6))
+    valid = np.isfinite(mins[elkeys]).all(axis=1)
+    # empty or unparsable paths are left to bounding_box2
+    for i, el in enumerate(todo):
+        try:
+            sty = el.cspecified_style
+            if sty.get("stroke") not in NONES:
+                swd = ipx(sty.get("stroke-width", "0px"))
+                if swd is None:
+                    valid[i] = False
+                    continue
+                swds[i] = swd
+            trf = el.ccomposed_transform
+            tfs[i] = (trf.a, trf.b, trf.c, trf.d, trf.e, trf.f)
+        except Exception:  # pylint: disable=broad-except
+            valid[i] = False
+    x1 = mins[elkeys, 0] - swds / 2
+    y1 = mins[elkeys, 1] - swds / 2
+    x2 = maxs[elkeys, 0] + swds / 2
+    y2 = maxs[elkeys, 1] + swds / 2
+
+    # Transform the four corners
+    cxs = np.stack([x1, x2, x1, x2], axis=1)
+    cys = np.stack([y1, y2, y2, y1], axis=1)
+    a, b, c, d, e, f = (tfs[:, i : i + 1] for i in range(6))
+    txs = a * cxs + c * cys + e
+    tys = b * cxs + d * cys + f
+    tx1, tx2 = txs.min(axis=1), txs.max(axis=1)
+    ty1, ty2 = tys.min(axis=1), tys.max(axis=1)
+
+    for i, el in enumerate(todo):
+        if not valid[i]:
+            continue
+        loc = bbox([x1[i], y1[i], x2[i] - x1[i], y2[i] - y1[i]])
+        glb = bbox([tx1[i], ty1[i], tx2[i] - tx1[i], ty2[i] - ty1[i]])
+        if not hasattr(el, "_cbbox"):
+            el._cbbox = dict()
+        for inc in (True, False):
+            el._cbbox[(False, True, roughpath, parsed, inc)] = loc
+            el._cbbox[(True, True, roughpath, parsed, inc)] = glb
+
+
 def set_cbbox(self, val):
-    """Invalidates the cached bounding box."""
-    if val is None and hasattr(self, "_cbbox"):
-        delattr(self, "_cbbox")
+    """Invalidates the cached bounding box and the boxes that depend on it."""
+    if val is None:
+        BaseElementCache.invalidate_cbbox(self)
 
 
 inkex.BaseElement.cbbox = property(bounding_box2, set_cbbox)
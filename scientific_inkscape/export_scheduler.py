@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Copyright (c) 2025 David Burghoff <burghoff@utexas.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A bounded, prioritized scheduler for Autoexporter jobs.
+
+A fixed pool of worker threads pulls jobs from a priority queue. Each job is
+identified by a key (its file); submitting a key that is already queued
+replaces the queued job, and submitting a key that is running marks the
+running job as stopped so that it exits at its next check. A job is any
+object with a `stopped` attribute and a `run()` method:
+
+    sched = ExportScheduler()
+    sched.submit(fname, job, priority=ExportScheduler.priority(fname))
+"""
+
+import os
+import sys
+import time
+import heapq
+import threading
+import collections
+import traceback
+
+MAX_WORKERS = max(1, os.cpu_count() or 1)
+MAX_HISTORY = 100  # number of finished jobs kept for latency stats
+
+
+class ExportScheduler:
+    """Fixed-size worker pool with a coalescing priority queue."""
+
+    def __init__(self, nworkers=None):
+        self.nworkers = max(1, nworkers or MAX_WORKERS)
+        self.heap = []
+        self.queued = dict()  # key -> queued job
+        self.running = dict()  # key -> list of running jobs
+        self.history = collections.deque(maxlen=MAX_HISTORY)
+        self.completed = 0
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.workers = []
+
+    @staticmethod
+    def priority(fname, finalization=None):
+        """
+        Default priority: exports before Office finalization, then the most
+        recently modified file first. Lower sorts first.
+        """
+        if finalization is None:
+            finalization = not fname.lower().endswith(".svg")
+        try:
+            mtime = os.path.getmtime(fname)
+        except OSError:
+            mtime = 0
+        return (1 if finalization else 0, -mtime)
+
+    def submit(self, key, job, priority=(0, 0)):
+        """Queue a job, superseding any queued or running job with the same key."""
+        with self.cond:
+            if self.closed:
+                return
+            old = self.queued.pop(key, None)
+            if old is not None:
+                old.stopped = True  # dropped lazily from the heap
+            for rjob in self.running.get(key, []):
+                rjob.stopped = True
+            job.queued_at = time.time()
+            job.started_at = job.finished_at = None
+            self.queued[key] = job
+            self.seq += 1
+            heapq.heappush(self.heap, (priority, self.seq, key, job))
+            if len(self.workers) < self.nworkers and len(self.workers) < (
+                len(self.queued) + self.nrunning
+            ):
+                wthr = threading.Thread(target=self._work, daemon=True)
+                self.workers.append(wthr)
+                wthr.start()
+            self.cond.notify()
+
+    def _next(self):
+        """Pop the highest-priority live job, waiting for one if needed."""
+        with self.cond:
+            while True:
+                while self.heap:
+                    _, _, key, job = heapq.heappop(self.heap)
+                    if self.queued.get(key) is job:
+                        del self.queued[key]
+                        self.running.setdefault(key, []).append(job)
+                        return key, job
+                if self.closed:
+                    return None, None
+                self.cond.wait()
+
+    def _work(self):
+        while True:
+            key, job = self._next()
+            if job is None:
+                return
+            job.started_at = time.time()
+            try:
+                if not job.stopped:
+                    job.run()
+            except Exception:  # pylint: disable=broad-except
+                # Keep the worker alive for later jobs
+                job.error = traceback.format_exc()
+                sys.stderr.write(job.error)
+            finally:
+                job.finished_at = time.time()
+                with self.cond:
+                    rjobs = self.running[key]
+                    rjobs.remove(job)
+                    if not rjobs:
+                        del self.running[key]
+                    self.history.append((key, job))
+                    self.completed += 1
+                    self.cond.notify_all()
+
+    @property
+    def depth(self):
+        """Number of jobs waiting for a worker."""
+        return len(self.queued)
+
+    @property
+    def nrunning(self):
+        return sum(len(v) for v in self.running.values())
+
+    def idle(self):
+        with self.cond:
+            return not self.queued and not self.running
+
+    def wait(self, timeout=None):
+        """Wait until a job finishes or is submitted, or until timeout."""
+        with self.cond:
+            self.cond.wait(timeout)
+
+    def latencies(self):
+        """(key, wait, run) times in seconds for recently finished jobs."""
+        with self.cond:
+            return [
+                (
+                    key,
+                    job.started_at - job.queued_at,
+                    job.finished_at - job.started_at,
+                )
+                for key, job in self.history
+                if not job.stopped
+            ]
+
+    def cancel_all(self):
+        """Stop every queued and running job."""
+        with self.cond:
+            for job in self.queued.values():
+                job.stopped = True
+            for rjobs in self.running.values():
+                for job in rjobs:
+                    job.stopped = True
+            self.queued.clear()
+            self.heap = []
+
+    def close(self):
+        """Cancel everything and let the workers exit."""
+        self.cancel_all()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
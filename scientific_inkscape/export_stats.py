@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Copyright (c) 2025 David Burghoff <burghoff@utexas.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Per-stage instrumentation for the Autoexporter.
+
+Exporter methods decorated with timed(name) accumulate wall time per stage in
+the Exporter's ExportStats, and code can add counters (binary calls, bytes
+read and written, cache hits, ...) with self.stats.count. The outermost
+decorated call (report=True) hands the stats to the Exporter, which appends
+one JSON line per document to a log file and prints a short summary.
+
+While a decorated method runs, its stats are also active in the current
+context, so code without access to the Exporter (e.g. run_binary) can add to
+them with count. Work handed to a thread pool should be submitted with submit
+so that it runs in the same context.
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+import contextvars
+import collections
+
+MAX_LOG_BYTES = 5 * 2**20  # the log is rotated to <log>.1 at this size
+
+_log_lock = threading.Lock()
+_current = contextvars.ContextVar("export_stats", default=None)
+
+
+class ExportStats:
+    """Stage times and counters for the export of one document."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.stages = dict()  # name -> [total time, number of calls]
+        self.counts = collections.Counter()
+        self.active = collections.Counter()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a stage. Recursive calls are only counted once."""
+        with self.lock:
+            outer = self.active[name] == 0
+            self.active[name] += 1
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            toc = time.perf_counter() - tic
+            with self.lock:
+                self.active[name] -= 1
+                if outer:
+                    stg = self.stages.setdefault(name, [0.0, 0])
+                    stg[0] += toc
+                    stg[1] += 1
+
+    def count(self, key, num=1):
+        with self.lock:
+            self.counts[key] += num
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "file": self.name,
+                "started": self.started,
+                "stages": {
+                    k: {"time": round(v[0], 4), "calls": v[1]}
+                    for k, v in self.stages.items()
+                },
+                "counts": dict(self.counts),
+            }
+
+    def summary(self, total):
+        """One-line summary of the slowest stages and the main counters"""
+        with self.lock:
+            stgs = sorted(
+                ((k, v[0]) for k, v in self.stages.items() if k != total),
+                key=lambda kv: -kv[1],
+            )
+            ret = "{0:.2f} s".format(self.stages.get(total, [0.0])[0])
+            if stgs:
+                ret += " (" + ", ".join(
+                    "{0} {1:.2f} s".format(k, v) for k, v in stgs[:3]
+                ) + ")"
+            cnts = ", ".join(
+                "{0} {1}".format(v, k.replace("_", " "))
+                for k, v in sorted(self.counts.items())
+                if not k.startswith("bytes")
+            )
+        return "Timing: " + ret + ("; " + cnts if cnts else "")
+
+    def write(self, logfile):
+        """Append this document's stats to a JSON lines file"""
+        line = json.dumps(self.as_dict(), sort_keys=True)
+        with _log_lock:
+            try:
+                if os.path.getsize(logfile) > MAX_LOG_BYTES:
+                    os.replace(logfile, logfile + ".1")
+            except OSError:
+                pass
+            try:
+                with open(logfile, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+
+
+def count(key, num=1):
+    """Add to a counter of the stats active in the current context, if any"""
+    stats = _current.get()
+    if stats is not None:
+        stats.count(key, num)
+
+
+def submit(pool, func, *args, **kwargs):
+    """Submit to an executor, running func in the current context"""
+    return pool.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+def timed(name, report=False):
+    """
+    Decorator for Exporter methods that records the method as a stage of
+    self.stats, creating it if needed. With report=True, the stats are
+    passed to self.report_stats when the method returns.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            stats = getattr(self, "stats", None)
+            if stats is None:
+                stats = self.stats = ExportStats(self.display_name)
+            token = _current.set(stats)
+            try:
+                with stats.stage(name):
+                    return func(self, *args, **kwargs)
+            finally:
+                _current.reset(token)
+                if report:
+                    self.stats = None
+                    self.report_stats(stats, name)
+
+        return wrapper
+
+    return decorator
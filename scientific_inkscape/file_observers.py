@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Copyright (c) 2025 David Burghoff <burghoff@utexas.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Observer selection for the Autoexporter and Gallery Viewer watchers.
+
+Native observers (inotify on Linux, ReadDirectoryChangesW on Windows, FSEvents
+on macOS) are notified by the OS and cost nothing while idle. The polling
+observer rescans the whole tree on every interval, so it is only used when no
+native observer is available, when the directory is on a network or cloud
+mount that does not deliver native events, or when scheduling a native watch
+fails (e.g. the inotify watch limit is reached). Requires the vendored
+packages directory to be on sys.path.
+"""
+
+import os
+import sys
+import warnings
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from watchdog.observers import Observer as NativeObserver
+from watchdog.observers.polling import PollingObserver
+
+# kqueue needs one file descriptor per watched file, which is worse than
+# polling for large trees
+HAS_NATIVE = NativeObserver.__name__ not in ("PollingObserver", "KqueueObserver")
+
+# Linux filesystem types that do not deliver inotify events for remote changes
+NETWORK_FS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p",
+    "sshfs", "davfs", "fuse", "fuseblk", "glusterfs", "ceph",
+}
+
+
+def linux_fstype(path):
+    """Type of the filesystem containing path, from the longest mount prefix"""
+    path = os.path.realpath(path)
+    best, fstype = "", None
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mnt = parts[1].replace("\\040", " ")
+                if (
+                    path == mnt or path.startswith(mnt.rstrip("/") + "/")
+                ) and len(mnt) > len(best):
+                    best, fstype = mnt, parts[2]
+    except OSError:
+        pass
+    return fstype
+
+
+def is_remote(path):
+    """Whether path is on a network or cloud mount"""
+    if sys.platform.startswith("linux"):
+        fstype = linux_fstype(path)
+        return fstype is not None and (
+            fstype in NETWORK_FS or fstype.startswith("fuse.")
+        )
+    if sys.platform == "win32":
+        import ctypes
+
+        drive = os.path.splitdrive(os.path.abspath(path))[0]
+        if drive.startswith("\\\\"):
+            return True  # UNC share
+        DRIVE_REMOTE = 4
+        try:
+            return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == DRIVE_REMOTE
+        except (AttributeError, OSError):
+            return False
+    return False
+
+
+def use_polling(path):
+    return not HAS_NATIVE or is_remote(path)
+
+
+def make_observer(path, timeout=0.5):
+    """Make an observer suited to watching path"""
+    if use_polling(path):
+        return PollingObserver(timeout=timeout)
+    return NativeObserver(timeout=timeout)
@@ -37,6 +37,9 @@ import inkex
 from autoexporter import ORIG_KEY
 from autoexporter import DUP_KEY
 from autoexporter import hash_file
+import inkscape_shell
+
+inkscape_shell.enable()  # keep Inkscape running between thumbnail conversions
 
 WHILESLEEP = 0.25
 IMAGE_WIDTH = 175
@@ -455,7 +458,7 @@ class ConversionThread(threading.Thread):
                 with conv_sema:
                     print('Inkscape export of '+fname)
                     try:
-                        dh.subprocess_repeat(args)
+                        dh.run_binary(args)
                     except subprocess.CalledProcessError:
                         ws = os.path.join(dh.si_dir,'pngs','cannot_display.png')
                         shutil.copy(ws, conv_path)
@@ -800,17 +803,27 @@ if packages not in sys.path:
     sys.path.append(packages)
 from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
+import file_observers
 from collections import defaultdict
 class Watcher(FileSystemEventHandler):
     def __init__(self):
         super().__init__()
-        self.observer = PollingObserver(timeout=0.5)
+        # Native observer where possible, polling for remote directories
+        self.observers = {False: None, True: None}  # use_polling -> observer
         self.dir_processors = defaultdict(list)  # dirpath -> list of Processor
         self.dir_refs = defaultdict(int)       # dirpath -> number of watchers
         self.dir_watches = {}                  # dirpath -> Watch object
         self.debounce_timers = {}              # (watcher, path) -> timer
         self.file_mod_times = {}               # full file path -> last mtime
-        self.observer.start()
+
+    def get_observer(self, polling):
+        if self.observers[polling] is None:
+            if polling:
+                self.observers[polling] = PollingObserver(timeout=0.5)
+            else:
+                self.observers[polling] = file_observers.NativeObserver(timeout=0.5)
+            self.observers[polling].start()
+        return self.observers[polling]
 
     def add_watch(self, fp):
         path = os.path.abspath(fp.fof)
@@ -829,8 +842,17 @@ class Watcher(FileSystemEventHandler):
                     self.file_mod_times[os.path.abspath(f)] = mtime
 
         if self.dir_refs[dir_path] == 0:
-            watch = self.observer.schedule(self, dir_path, recursive=False)
-            self.dir_watches[dir_path] = watch
+            polling = file_observers.use_polling(dir_path)
+            try:
+                obs = self.get_observer(polling)
+                watch = obs.schedule(self, dir_path, recursive=False)
+            except OSError:
+                # Native watch failed (e.g. inotify watch limit), poll instead
+                if polling:
+                    raise
+                obs = self.get_observer(True)
+                watch = obs.schedule(self, dir_path, recursive=False)
+            self.dir_watches[dir_path] = (obs, watch)
             print(f"Scheduled observer for {dir_path}")
 
         self.dir_processors[dir_path].append(fp)
@@ -846,15 +868,17 @@ class Watcher(FileSystemEventHandler):
 
         if self.dir_refs[dir_path] <= 0:
             print(f"Unscheduling observer for {dir_path}")
-            watch = self.dir_watches.pop(dir_path, None)
+            obs, watch = self.dir_watches.pop(dir_path, (None, None))
             if watch:
-                self.observer.unschedule(watch)
+                obs.unschedule(watch)
             self.dir_processors.pop(dir_path, None)
             self.dir_refs.pop(dir_path, None)
 
     def stop(self):
-        self.observer.stop()
-        self.observer.join()
+        for obs in self.observers.values():
+            if obs is not None:
+                obs.stop()
+                obs.join()
 
     @staticmethod
     def get_mod_time(path):
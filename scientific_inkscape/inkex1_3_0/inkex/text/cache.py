@@ -120,6 +120,7 @@ class BaseElementCache(BaseElement):
             EBset(self, att, val)
             if self.croot is not None:
                 self.croot.iddict.add_to_linkdict(self, att)
+        BaseElementCache.invalidate_cbbox(self)
 
     class CStyle(Style):
         """
@@ -141,19 +142,20 @@ class BaseElementCache(BaseElement):
                 # OrderedDict sets items during initialization, use super()
                 super().__setitem__(args[0], args[1])
             else:
-                changedvalue = False
+                changed = set()
                 for i in range(0, len(args), 2):
                     key = args[i]
                     value = args[i + 1]
                     if value is None:
                         if key in self:
                             del self[key]
-                            changedvalue = True
+                            changed.add(key)
                     else:
                         if key not in self or self[key] != value:
                             super().__setitem__(key, value)
-                            changedvalue = True
-                if changedvalue:
+                            changed.add(key)
+                if changed:
+                    self.changed = changed
                     self.elem.cstyle = self
 
     class CStyleDescriptor:
@@ -170,12 +172,27 @@ class BaseElementCache(BaseElement):
             else:
                 elem.attrib.pop("style", None)
 
+            # Find which properties changed, if we can
+            old = elem.__dict__.get("_cstyle")
+            changed = None
+            if old is not None and value is old:
+                changed = old.__dict__.pop("changed", None)
             try:
                 elem._cstyle = BaseElementCache.CStyle(value.copy(), elem)
             except AttributeError: # strings
                 elem._cstyle = BaseElementCache.CStyle(value, elem)
+            if old is not None and value is not old:
+                new = elem._cstyle
+                changed = {
+                    k for k in set(old) | set(new) if old.get(k) != new.get(k)
+                }
             elem.ccascaded_style = None
-            elem.cspecified_style = None
+            BaseElementCache.invalidate_style(
+                elem,
+                boxes=changed is None
+                or any(BaseElementCache.affects_bbox(a) for a in changed),
+                drawn=changed is None or "display" in changed,
+            )
 
     cstyle = CStyleDescriptor()
 
@@ -199,9 +216,7 @@ class BaseElementCache(BaseElement):
     def set_cspecified_style(self, svi):
         """Invalidates the cached specified style."""
         if svi is None:
-            if hasattr(self, "_cspecified_style"):
-                for d in self.iter('*'):
-                    d.__dict__.pop("_cspecified_style", None)
+            BaseElementCache.invalidate_style(self)
         else:
             # Set the specified style by setting the local style
             # Change local style only as needed
@@ -224,6 +239,54 @@ class BaseElementCache(BaseElement):
 
     cspecified_style = property(get_cspecified_style, set_cspecified_style)
 
+    def invalidate_style(self, boxes=True, drawn=True):
+        """
+        Invalidates the specified style of an element and its descendants.
+        If boxes is set, their bounding boxes (which depend on the stroke,
+        font, etc.) and the boxes depending on them are also invalidated.
+        If drawn is set (display may have changed), their entries in the
+        document's isdrawn cache are removed.
+        """
+        if drawn:
+            BaseElementCache.forget_drawn(self)
+        # Boxes can outlive the specified styles they were computed with
+        if hasattr(self, "_cspecified_style") or boxes:
+            visited = set()
+            if boxes:
+                BaseElementCache.invalidate_cbbox(self, visited)
+            for d in self.iter('*'):
+                d.__dict__.pop("_cspecified_style", None)
+                if boxes and "_cbbox" in d.__dict__:
+                    BaseElementCache.invalidate_cbbox(d, visited)
+
+    # Style properties that can change an element's bounding box
+    bbox_style_atts = {
+        "stroke",
+        "stroke-width",
+        "clip-path",
+        "mask",
+        "font",
+        "letter-spacing",
+        "word-spacing",
+        "line-height",
+        "text-anchor",
+        "text-align",
+        "writing-mode",
+        "direction",
+        "baseline-shift",
+        "white-space",
+        "shape-inside",
+        "shape-padding",
+        "inline-size",
+        "display",
+        "-inkscape-font-specification",
+    }
+
+    @staticmethod
+    def affects_bbox(att):
+        """Whether changing a style property can change bounding boxes"""
+        return att in BaseElementCache.bbox_style_atts or att.startswith("font-")
+
     shorthand_font_pattern = re.compile(
         r"^(?:(italic|oblique|normal)\s+)?"  # font-style
         r"(?:(small-caps)\s+)?"  # font-variant
@@ -387,6 +450,12 @@ class BaseElementCache(BaseElement):
         """Invalidates the cached composed transform."""
         if svi is None and hasattr(self, "_ccomposed_transform"):
             delattr(self, "_ccomposed_transform")  # invalidate
+            # Boxes in document coordinates (dotransform=True) are now wrong,
+            # boxes in the element's own coordinates are not
+            cbb = self.__dict__.get("_cbbox")
+            if cbb:
+                for key in [key for key in cbb if key[0]]:
+                    del cbb[key]
             for k in list2(self):
                 k.ccomposed_transform = None  # invalidate descendants
 
@@ -406,6 +475,8 @@ class BaseElementCache(BaseElement):
         self.transform = newt
         self._ctransform = newt
         self.ccomposed_transform = None
+        # The parent's box and those of clones include this transform
+        BaseElementCache.invalidate_cbbox(self, keepself=True)
 
     ctransform = property(get_ctransform, set_ctransform)
 
@@ -484,8 +555,38 @@ class BaseElementCache(BaseElement):
         """Invalidates the cached path."""
         if svi is None:
             self.__dict__.pop("_cpath",None)
+            BaseElementCache.invalidate_cbbox(self)
 
     cpath = property(get_path2, set_cpath_fcn)
+
+    # Bounding boxes cached by cbbox depend on an element's path, specified
+    # style, and composed transform, on the boxes of its children, and on the
+    # boxes of whatever it links to (clones, clips, masks). Edits walk these
+    # dependencies in reverse so that only the affected boxes are cleared.
+    def invalidate_cbbox(self, visited=None, keepself=False):
+        """
+        Invalidates the cached bounding boxes of an element, its ancestors,
+        and any elements that clone, or are clipped or masked by, any of them.
+        """
+        visited = set() if visited is None else visited
+        stack = [self]
+        while stack:
+            elem = stack.pop()
+            if elem in visited:
+                continue
+            if not keepself or elem is not self:
+                visited.add(elem)
+                elem.__dict__.pop("_cbbox", None)
+            myp = elem.getparent()
+            if myp is not None:
+                stack.append(myp)
+            svg = elem.croot
+            eid = EBget(elem, "id")
+            if eid is not None and svg is not None and hasattr(svg, "_iddict"):
+                idd = svg._iddict
+                for ldict in (idd.linked_by, idd.clips, idd.masks):
+                    stack.extend(ldict.get(eid, ()))
+
     cpath_support = (
         inkex.Rectangle,
         inkex.Ellipse,
@@ -679,12 +780,38 @@ class BaseElementCache(BaseElement):
     # updated or invalidated. These functions do that while preserving the original
     # base functionality
 
+    @staticmethod
+    def clear_elcaches(*roots):
+        """Clears the per-document element caches of the given roots."""
+        for root in roots:
+            if root is not None and hasattr(root, "_elcache"):
+                root._elcache.clear()
+
+    @staticmethod
+    def forget_drawn(elem):
+        """Removes an element and its descendants from the isdrawn cache."""
+        root = elem.croot
+        cache = getattr(root, "_elcache", dict()).get("isdrawn")
+        if cache:
+            for d in elem.iter("*"):
+                cache.pop(d, None)
+
+    @staticmethod
+    def moved(elem, oldparent):
+        """Invalidates the boxes of an element's old and new ancestors."""
+        visited = set()
+        if oldparent is not None:
+            BaseElementCache.invalidate_cbbox(oldparent, visited)
+        if elem.getparent() is not None:
+            BaseElementCache.invalidate_cbbox(elem.getparent(), visited)
+
     # Deletion
     BE_delete = inkex.BaseElement.delete
 
     def delete(self, deleteup=False):
         """Deletes the element and optionally cleans up empty parent groups."""
         svg = self.croot
+        BaseElementCache.clear_elcaches(svg)
         for ddv in reversed(list(self.iter('*'))):
             did = ddv.get_id()
             if svg is not None:
@@ -706,6 +833,8 @@ class BaseElementCache(BaseElement):
             ddv.croot = None
         if hasattr(svg, "_cd2"):
             svg.cdescendants2.delel(self)
+        if self.getparent() is not None:
+            BaseElementCache.invalidate_cbbox(self.getparent())
 
         if deleteup:
             # If set, remove empty ancestor groups
@@ -723,8 +852,11 @@ class BaseElementCache(BaseElement):
         """Inserts an element at a specified index, managing caching."""
         oldroot = elem.croot
         newroot = self.croot
+        oldparent = elem.getparent()
 
         BaseElementCache.BE_insert(self, index, elem)
+        BaseElementCache.moved(elem, oldparent)
+        BaseElementCache.clear_elcaches(oldroot, newroot)
         elem.ccascaded_style = None
         elem.cspecified_style = None
         elem.ccomposed_transform = None
@@ -757,8 +889,11 @@ class BaseElementCache(BaseElement):
         """Appends an element, managing caching and ID conflicts."""
         oldroot = elem.croot
         newroot = self.croot
+        oldparent = elem.getparent()
 
         BaseElementCache.BE_append(self, elem)
+        BaseElementCache.moved(elem, oldparent)
+        BaseElementCache.clear_elcaches(oldroot, newroot)
         elem.ccascaded_style = None
         elem.cspecified_style = None
         elem.ccomposed_transform = None
@@ -786,8 +921,11 @@ class BaseElementCache(BaseElement):
         """Adds an element next to the specified element, managing caching (non-recursive)."""
         oldroot = elem.croot
         newroot = self.croot
+        oldparent = elem.getparent()
     
         BaseElementCache.BE_addnext(self, elem)
+        BaseElementCache.moved(elem, oldparent)
+        BaseElementCache.clear_elcaches(oldroot, newroot)
         elem.ccascaded_style = None
         elem.cspecified_style = None
         elem.ccomposed_transform = None
@@ -814,8 +952,12 @@ class BaseElementCache(BaseElement):
         """Appends multiple elements, managing caching and ID conflicts."""
         oldroots = [elem.croot for elem in elems]
         newroot = self.croot
+        oldparents = [elem.getparent() for elem in elems]
 
         BaseElementCache.BE_extend(self, elems)
+        for elem, oldparent in zip(elems, oldparents):
+            BaseElementCache.moved(elem, oldparent)
+        BaseElementCache.clear_elcaches(newroot, *oldroots)
         for elem, oldroot in zip(elems,oldroots):
             elem.ccascaded_style = None
             elem.cspecified_style = None
@@ -1464,6 +1606,25 @@ class SvgDocumentElementCache(SvgDocumentElement):
 
     char_table = property(get_char_table, set_char_table)
 
+    # Per-document caches of properties derived from the tree structure, such
+    # as dhelpers' hasbbox and isdrawn. Keeping them on the document frees
+    # them along with it, and BaseElementCache clears them on tree edits.
+
+    def get_elcache(self):
+        """Returns the element cache, a dict of per-property dicts."""
+        try:
+            return self._elcache
+        except AttributeError:
+            self._elcache = dict()
+            return self._elcache
+
+    def set_elcache(self, svi):
+        """Invalidates the element cache."""
+        if svi is None and hasattr(self, "_elcache"):
+            delattr(self, "_elcache")
+
+    elcache = property(get_elcache, set_elcache)
+
 
 class StyleCache(Style):
     """Caches and manages style data with enhanced functionality."""
@@ -35,9 +35,19 @@ import sys
 import re
 import ctypes
 from functools import lru_cache
+import json
+import hashlib
 import threading
 import inkex
 from inkex.text.utils import default_style_atts
+from inkex.text.metrics_cache import (
+    MAX_CACHED_FACES,
+    MAX_CACHED_INSTANCES,
+    font_cache_dir,
+    prune_cache,
+    read_json,
+    write_json,
+)
 from inkex import Style
 
 _font_lock = threading.RLock()
@@ -217,6 +227,28 @@ class FontConfig:
                 )[0]
             return self.truefontsfn[fontsty]
 
+    def get_font_key(self, fontsty):
+        """
+        Identifies the face a style is drawn with by its file, modification
+        time, size, face index, and variation location. Returns None if the
+        face has no file.
+        """
+        with _font_lock:
+            if fontsty not in self.truefontsfc:
+                self.get_true_font(fontsty)
+            found = self.truefontsfc[fontsty]
+            fname = found.get(fc.PROP.FILE, 0)[0]
+            if not isinstance(fname, str):
+                return None
+            try:
+                stat = os.stat(fname)
+            except OSError:
+                return None
+            return [os.path.abspath(fname), stat.st_mtime, stat.st_size] + [
+                found.get(prop, 0)[0]
+                for prop in (fc.PROP.INDEX, fc.PROP.WEIGHT, fc.PROP.WIDTH, fc.PROP.SLANT)
+            ]
+
     def get_true_font_by_char(self, fontsty, chars):
         """
         Sometimes, a font will not have every character and a different one is
@@ -843,6 +875,34 @@ def has_pango():
         return PangoRenderer().HASPANGO
 
 
+_face_indices = dict()  # collection face lookups
+_font_instances = dict()  # instantiated variable fonts
+
+
+def open_ttfont(fname, lazy=True, **kwargs):
+    """
+    Open a FontTools font on a read-only memory map of its file. With lazy
+    loading, tables are only read and decompiled when they are accessed, so
+    large fonts and collections open almost instantly. The map stays open
+    (and on Windows, locks the file) until the font is closed. Otherwise the
+    file is copied into memory and the map is released immediately.
+    """
+    from fontTools.ttLib import TTFont  # pylint: disable=import-outside-toplevel
+    import mmap  # pylint: disable=import-outside-toplevel
+
+    with open(fname, "rb") as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # empty file, or no mmap support
+            return TTFont(fname, lazy=lazy, **kwargs)
+    if lazy:
+        return TTFont(data, lazy=lazy, **kwargs)
+    try:
+        return TTFont(data, lazy=lazy, **kwargs)
+    finally:
+        data.close()
+
+
 # pylint:disable=import-outside-toplevel
 class FontToolsFontInstance:
     """
@@ -867,20 +927,23 @@ class FontToolsFontInstance:
 
     @staticmethod
     def font_from_fc(found):
-        """Find a FontTools font from a FontConfig font."""
+        """
+        Find a FontTools font from a FontConfig font. The file is opened lazily
+        on a memory map, so only the tables that are used get read. The face
+        picked from a collection and instantiated variable fonts are cached.
+        """
         fname = found.get(fc.PROP.FILE, 0)[0]
 
-        from fontTools.ttLib import TTFont, TTLibFileIsCollectionError  # pylint: disable=no-name-in-module
+        from fontTools.ttLib import TTLibFileIsCollectionError  # pylint: disable=no-name-in-module
         import logging
 
         logging.getLogger("fontTools").setLevel(logging.ERROR)
         try:
-            font = TTFont(fname)
+            font = open_ttfont(fname)
 
             # If font has variants, get them
             if "fvar" in font:
                 fcwgt = found.get(fc.PROP.WEIGHT, 0)[0]
-                fcsln = found.get(fc.PROP.SLANT, 0)[0]
                 fcwdt = found.get(fc.PROP.WIDTH, 0)[0]
                 location = dict()
                 for axis in font["fvar"].axes:
@@ -889,9 +952,8 @@ class FontToolsFontInstance:
                     elif axis.axisTag == "wdth":
                         location["wdth"] = fcwdt
                 if len(location) > 0:
-                    from fontTools.varLib import mutator
-
-                    font = mutator.instantiateVariableFont(font, location)
+                    font.close()  # release the map before using the instance
+                    font = FontToolsFontInstance.instantiate(fname, location)
 
         except TTLibFileIsCollectionError:
             # is TT collection
@@ -899,52 +961,136 @@ class FontToolsFontInstance:
             fcwgt = found.get(fc.PROP.WEIGHT, 0)[0]
             fcsln = found.get(fc.PROP.SLANT, 0)[0]
             fcwdt = found.get(fc.PROP.WIDTH, 0)[0]
+            fontnum = FontToolsFontInstance.collection_index(
+                fname, fcfam, fcwgt, fcsln, fcwdt
+            )
+            font = open_ttfont(fname, fontNumber=fontnum)
+        return font
 
-            from fontTools.ttLib import TTCollection
+    @staticmethod
+    def collection_index(fname, fcfam, fcwgt, fcsln, fcwdt):
+        """
+        Index of the face in a TT collection that best matches a FontConfig
+        font. Results are cached in memory and in si_cache/fontfaces.
+        """
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            stat = None
+        key = json.dumps(
+            [os.path.abspath(fname), stat and stat.st_mtime, stat and stat.st_size,
+             fcfam, fcwgt, fcsln, fcwdt],
+            default=str,
+        )
+        cdir = font_cache_dir("fontfaces")
+        cfile = os.path.join(cdir, "faces.json") if cdir is not None else None
+        if not _face_indices and cfile is not None:
+            _face_indices.update(read_json(cfile) or dict())
+        if key in _face_indices:
+            return _face_indices[key]
+
+        from fontTools.ttLib.sfnt import readTTCHeader
+
+        with open(fname, "rb") as file:
+            num_fonts = readTTCHeader(file).numFonts
+        num_match = []
+        for i in range(num_fonts):
+            tfont = open_ttfont(fname, fontNumber=i)
+            try:
+                match = FontToolsFontInstance.face_match(
+                    tfont, fcfam, fcwgt, fcsln, fcwdt
+                )
+            finally:
+                tfont.close()
+            num_match.append(match)
+            if num_match[-1] == 4:
+                break
+        # First perfect match, or the first of the best matches
+        ret = num_match.index(max(num_match))
+
+        _face_indices[key] = ret
+        if cfile is not None:
+            faces = read_json(cfile) or dict()
+            faces[key] = ret
+            if len(faces) > MAX_CACHED_FACES:
+                faces = dict(list(faces.items())[-MAX_CACHED_FACES:])
+            write_json(cfile, faces)
+        return ret
 
-            collection = TTCollection(fname)
-            num_fonts = len(collection)
-            collection.close()
-            num_match = []
-            for i in range(num_fonts):
-                tfont = TTFont(fname, fontNumber=i)
-                font_weight = tfont["OS/2"].usWeightClass
-                font_width = tfont["OS/2"].usWidthClass
+    @staticmethod
+    def face_match(tfont, fcfam, fcwgt, fcsln, fcwdt):
+        """Number of properties of a FontConfig font that a face matches (0-4)"""
+        font_weight = tfont["OS/2"].usWeightClass
+        font_width = tfont["OS/2"].usWidthClass
+
+        subfamily = tfont["name"].getName(2, 3, 1, 1033)
+        subfamily = subfamily.toUnicode() if subfamily is not None else "Unknown"
+        font_italic = (
+            (tfont["OS/2"].fsSelection & 1) != 0
+            or "italic" in subfamily.lower()
+            or "oblique" in subfamily.lower()
+        )
 
-                subfamily = tfont["name"].getName(2, 3, 1, 1033)
-                subfamily = (
-                    subfamily.toUnicode() if subfamily is not None else "Unknown"
-                )
-                font_italic = (
-                    (tfont["OS/2"].fsSelection & 1) != 0
-                    or "italic" in subfamily.lower()
-                    or "oblique" in subfamily.lower()
-                )
+        # nameID=1: font family name
+        familymatch = any(
+            fcfam in n.toUnicode() for n in tfont["name"].names if n.nameID == 1
+        )
+        widthmatch = C.OS2WDT_FCWDT[font_width] == fcwdt
+        weightmatch = interpolate_dict(C.OS2WGT_FCWGT, font_weight, None) == fcwgt
+        slantmatch = (
+            font_italic and fcsln in [FC.SLANT_ITALIC, FC.SLANT_OBLIQUE]
+        ) or (not font_italic and fcsln == FC.SLANT_ROMAN)
+        return sum([weightmatch, widthmatch, slantmatch, familymatch])
 
-                # nameID=1: font family name
-                familymatch = any(
-                    fcfam in n.toUnicode() for n in tfont["name"].names if n.nameID == 1
-                )
-                widthmatch = C.OS2WDT_FCWDT[font_width] == fcwdt
-                weightmatch = (
-                    interpolate_dict(C.OS2WGT_FCWGT, font_weight, None) == fcwgt
-                )
-                slantmatch = (
-                    font_italic and fcsln in [FC.SLANT_ITALIC, FC.SLANT_OBLIQUE]
-                ) or (not font_italic and fcsln == FC.SLANT_ROMAN)
-                num_match.append(
-                    sum([weightmatch, widthmatch, slantmatch, familymatch])
-                )
-                if num_match[-1] == 4:
-                    font = tfont
-                    break
-            if max(num_match) < 4:
-                # Did not find a perfect match
-                font = [
-                    TTFont(fname, fontNumber=i)
-                    for i in range(num_fonts)
-                    if num_match[i] == max(num_match)
-                ][0]
+    @staticmethod
+    def instantiate(fname, location):
+        """
+        Instantiate a variable font at a location. Instances are cached in
+        memory and saved to si_cache/fontinstances, so later runs only have
+        to open them. Cached files are read into memory rather than mapped,
+        since they may be replaced or pruned by other processes.
+        """
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            stat = None
+        keyv = json.dumps(
+            [os.path.abspath(fname), stat and stat.st_mtime, stat and stat.st_size,
+             sorted(location.items())],
+            default=str,
+        )
+        key = hashlib.sha256(keyv.encode("utf-8")).hexdigest()
+        if key in _font_instances:
+            return _font_instances[key]
+
+        cdir = font_cache_dir("fontinstances")
+        cfile = os.path.join(cdir, key + ".ttf") if cdir is not None else None
+        font = None
+        if cfile is not None and os.path.exists(cfile):
+            try:
+                font = open_ttfont(cfile, lazy=None)
+                font["head"]  # pylint: disable=pointless-statement
+                os.utime(cfile)
+            except Exception:  # pylint: disable=broad-except
+                font = None  # corrupt or being replaced
+        if font is None:
+            from fontTools.varLib import mutator
+
+            varfont = open_ttfont(fname, lazy=None)
+            font = mutator.instantiateVariableFont(varfont, location)
+            varfont.close()
+            if cfile is not None:
+                tmp = "{0}.{1}.tmp".format(cfile, os.getpid())
+                try:
+                    font.save(tmp)
+                    os.replace(tmp, cfile)
+                    prune_cache(cdir, MAX_CACHED_INSTANCES)
+                except OSError:
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+        _font_instances[key] = font
         return font
 
     def find_font_metrics(self):
@@ -1014,7 +1160,11 @@ class FontToolsFontInstance:
         if self.hmtx is None:
             self.hmtx = self.font["hmtx"]
         if self.kern is None:
-            self.kern = self.font["kern"] if "kern" in self.font else None
+            # Flatten the kern subtables into one pair table, earlier subtables first
+            self.kern = dict()
+            if "kern" in self.font:
+                for subtable in reversed(self.font["kern"].kernTables):
+                    self.kern.update(getattr(subtable, "kernTable", dict()))
         if self.gsub is None:
             self.gsub = self.font["GSUB"] if "GSUB" in self.font else None
         if self.glyf is None:
@@ -1110,11 +1260,7 @@ class FontToolsFontInstance:
                     aw2, _ = self.hmtx.metrics[glyph2]
                     kerning_value = awlig - aw1 - aw2
                 else:
-                    if self.kern is not None:
-                        for subtable in self.kern.kernTables:
-                            kerning_value = subtable.kernTable.get((glyph1, glyph2))
-                            if kerning_value is not None:
-                                break
+                    kerning_value = self.kern.get((glyph1, glyph2))
                 if kerning_value is None:
                     kerning_value = 0
                 dadvs[(pchar, c)] = kerning_value / units_per_em
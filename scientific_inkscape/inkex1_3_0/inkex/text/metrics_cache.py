@@ -0,0 +1,217 @@
+# coding=utf-8
+#
+# Copyright (c) 2025 David Burghoff <burghoff@utexas.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+A persistent store of character metrics, shared between processes.
+
+Measuring characters with Pango or fontTools is one of the slowest parts of
+parsing text, and the same few fonts are measured on every run. CharacterTable
+saves what it measures per style, keyed by the style and by the file,
+modification time, face index, and variation location of the face it is drawn
+with (see FontConfig.get_font_key), so later runs only measure characters and
+pairs they have not seen before. The style is part of the key because a face
+can be drawn differently for different styles (e.g., synthetic bold).
+
+Entries are JSON files in si_cache/fonts, next to SI's temp folder. Writes are
+atomic and merge with whatever another process wrote in the meantime. The
+si_cache helpers here (cache_dir, prune_cache) are also used by dhelpers for
+SI's other persistent caches.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+
+USE_METRICS_CACHE = True  # save character metrics and font data between runs
+MAX_CACHED_FONTS = 2000
+MAX_CACHED_FACES = 5000  # collection face indices
+MAX_CACHED_INSTANCES = 200  # instantiated variable fonts
+
+
+def cache_dir(name):
+    """
+    A persistent cache directory in si_cache, next to the shared temp folder
+    used by dhelpers. Unlike si_temp, it is not swept of day-old files by the
+    Autoexporter. Raises OSError if it cannot be created.
+    """
+    if sys.executable[0:4] == "/tmp" or sys.executable[0:5] == "/snap":
+        # tempfile does not always work with Linux Snap distributions
+        textdir = os.path.dirname(os.path.realpath(__file__))
+        base = os.path.dirname(os.path.dirname(os.path.dirname(textdir)))
+        # SI's directory
+    else:
+        base = tempfile.gettempdir()
+    cdir = os.path.join(os.path.abspath(base), "si_cache", name)
+    os.makedirs(cdir, exist_ok=True)
+    return cdir
+
+
+def font_cache_dir(name):
+    """
+    The cache directory for font data, or None if the metrics cache is
+    disabled or the directory cannot be created.
+    """
+    if not USE_METRICS_CACHE:
+        return None
+    try:
+        return cache_dir(name)
+    except OSError:
+        return None
+
+
+def prune_cache(cdir, max_entries):
+    """Remove the least-recently used entries of a cache directory"""
+    try:
+        entries = [os.path.join(cdir, f) for f in os.listdir(cdir)]
+        if len(entries) <= max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+    except OSError:  # modified by another process
+        return
+    for ent in entries[: len(entries) - max_entries]:
+        try:
+            if os.path.isdir(ent):
+                shutil.rmtree(ent, ignore_errors=True)
+            else:
+                os.remove(ent)
+        except OSError:
+            pass
+
+
+def write_json(fname, data):
+    """Atomically write a JSON file. Returns True on success."""
+    tmp = "{0}.{1}.tmp".format(fname, os.getpid())
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, fname)
+    except (OSError, TypeError, ValueError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def read_json(fname):
+    """Read a JSON file, or None if it is missing or corrupt"""
+    try:
+        with open(fname, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class FontMetrics:
+    """
+    The stored metrics of one style's face, in units of the font size:
+      chars:  char -> [advance, ink bbox]
+      pairs:  (preceding char, char) -> differential advance
+      spacew: space width
+      caph:   cap height
+    """
+
+    __slots__ = ("fname", "chars", "pairs", "spacew", "caph", "dirty")
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.chars = dict()
+        self.pairs = dict()
+        self.spacew = None
+        self.caph = None
+        self.dirty = False
+        self.merge(read_json(fname) if fname is not None else None)
+
+    def merge(self, data):
+        """Add entries loaded from disk, keeping any already present"""
+        if not isinstance(data, dict):
+            return
+        try:
+            for c, val in data.get("chars", dict()).items():
+                self.chars.setdefault(c, val)
+            for pchr, c, val in data.get("pairs", []):
+                self.pairs.setdefault((pchr, c), val)
+            if self.spacew is None:
+                self.spacew = data.get("spacew")
+            if self.caph is None:
+                self.caph = data.get("caph")
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+    def update(self, chars, pairs, spacew, caph):
+        """Add newly measured characters and pairs"""
+        self.chars.update(chars)
+        self.pairs.update(pairs)
+        self.spacew = spacew
+        self.caph = caph
+        self.dirty = True
+
+    def save(self):
+        """Write to disk, merging with anything written by other processes"""
+        if not self.dirty or self.fname is None:
+            return
+        self.merge(read_json(self.fname))
+        data = {
+            "chars": self.chars,
+            "pairs": [[k[0], k[1], v] for k, v in self.pairs.items()],
+            "spacew": self.spacew,
+            "caph": self.caph,
+        }
+        if write_json(self.fname, data):
+            self.dirty = False
+
+
+class MetricsStore:
+    """Loads and saves FontMetrics by key"""
+
+    def __init__(self):
+        self.cdir = font_cache_dir("fonts")
+        self.entries = dict()
+
+    def get(self, keyparts):
+        """
+        Get the metrics for a key, a JSON-able list identifying the font
+        and measurement method. Missing entries are returned empty.
+        """
+        keyv = json.dumps(keyparts, sort_keys=True, default=str)
+        key = hashlib.sha256(keyv.encode("utf-8")).hexdigest()
+        if key not in self.entries:
+            fname = None
+            if self.cdir is not None:
+                fname = os.path.join(self.cdir, key + ".json")
+                if os.path.exists(fname):
+                    try:
+                        os.utime(fname)
+                    except OSError:
+                        pass
+            self.entries[key] = FontMetrics(fname)
+        return self.entries[key]
+
+    def save(self):
+        """Write all changed entries"""
+        changed = False
+        for ent in self.entries.values():
+            changed |= ent.dirty
+            ent.save()
+        if changed and self.cdir is not None:
+            prune_cache(self.cdir, MAX_CACHED_FONTS)
@@ -78,12 +78,17 @@ from inkex.text.font_properties import (
     true_style,
     has_pango,
 )
+from inkex.text.metrics_cache import USE_METRICS_CACHE, MetricsStore
 from inkex.utils import debug
 
 DIFF_ADVANCES = True  # generate a differential advances table for each font?
 TEXTSIZE = 100  # size of rendered text
 DEPATHOLOGIZE = True  # clean up pathological atts not normally made by Inkscape
 XY_TOL = 1e-6
+PARALLEL_MEASURE = False  # measure font styles in a pool of processes?
+MIN_PARALLEL_STYLES = 8  # fewest styles worth starting a pool for
+MAX_MEASURE_WORKERS = 4
+MIN_BULK_DADVS = 16  # shortest line whose differential advances are found in bulk
 
 EBget = lxml.etree.ElementBase.get
 EBset = lxml.etree.ElementBase.set
@@ -94,6 +99,86 @@ TEtags = {TEtag, TStag}
 FRtags = {FRtag, FlowRegion.ctag, FlowPara.ctag, FlowSpan.ctag}
 SPR = inkex.addNS("role", "sodipodi")
 
+class ChunkArrays:
+    """
+    Struct-of-arrays storage of the characters of a list of chunks.
+    Per-character attributes are flat arrays in chunk order, per-chunk
+    attributes are arrays indexed by chunk, and widx maps each character to
+    its chunk. Positions can then be calculated for all chunks at once
+    instead of character by character.
+    """
+
+    CHAR_ATTRS = ("cwd", "dx", "dxlsp", "dy", "bshft", "caph", "dadv")
+
+    def __init__(self, chks):
+        self.chks = chks
+        nchk = len(chks)
+        ncs = np.fromiter((chk.ncs for chk in chks), int, nchk)
+        self.stops = np.cumsum(ncs)
+        self.starts = self.stops - ncs
+        self.nchrs = int(self.stops[-1]) if nchk else 0
+        self.widx = np.repeat(np.arange(nchk), ncs)
+        # chunk of each character
+
+        for att in ChunkArrays.CHAR_ATTRS:
+            # dx and dxlsp are one longer than the number of chars
+            vals = itertools.chain.from_iterable(
+                itertools.islice(getattr(chk, att), chk.ncs) for chk in chks
+            )
+            setattr(self, att, np.fromiter(vals, float, self.nchrs))
+
+        self.unsp = np.array([chk.unrenderedspace for chk in chks], dtype=float)
+        self.anfr = np.array([chk.line.anchfrac for chk in chks], dtype=float)
+        self.rtls = np.array([chk.line.rtl for chk in chks], dtype=float)
+        self.chkx = np.array([chk.x for chk in chks], dtype=float)
+        self.chky = np.array([chk.y for chk in chks], dtype=float)
+        mats = np.array([chk.transform.matrix for chk in chks], dtype=float)
+        mats = mats.reshape((nchk, 2, 3))
+        self.mat = tuple(tuple(mats[:, i, j] for j in (0, 1, 2)) for i in (0, 1))
+        # per-chunk transform, in the form used by vmult
+
+    def char_mat(self):
+        """The transform of each character's chunk, in the form used by vmult"""
+        return tuple(tuple(m[self.widx] for m in row) for row in self.mat)
+
+    def positions(self):
+        """
+        Calculates the untransformed character extents (lftx, rgtx, btmy,
+        topy) and chunk extents (lx2, rx2, by2, ty2) of every chunk.
+        """
+        widx = self.widx
+        fidx = self.starts[widx]
+        lidx = (self.stops - 1)[widx]
+        # first and last character of each character's chunk
+
+        wds = self.cwd + self.dx + self.dxlsp + self.dadv * (self.dx == 0)
+        # any dx value overrides differential advances
+        cstop = np.cumsum(wds)
+        cstop += wds[fidx] - cstop[fidx]
+        cstrt = cstop - self.cwd
+
+        adyl = np.cumsum(self.dy)
+        adyl += self.dy[fidx] - adyl[fidx]
+
+        anfr = self.anfr[widx]
+        offx = -anfr * (cstop[lidx] - self.unsp[widx] * self.cwd[lidx])
+        offx += (
+            2 * anfr * np.add.reduceat(self.dx, self.starts)[widx] * self.rtls[widx]
+        )  # rtl differential correction
+        lftx = self.chkx[widx] + cstrt + offx
+        rgtx = self.chkx[widx] + cstop + offx
+        btmy = self.chky[widx] + adyl - self.bshft
+        topy = btmy - self.caph
+
+        subtract_ufunc = np.frompyfunc(lambda a, b: a - b, 2, 1)
+        lx_minus_dx = subtract_ufunc(lftx, self.dx + self.dxlsp)
+        lx2 = np.minimum.reduceat(lx_minus_dx, self.starts).astype(float)
+        rx2 = lx2 + cstop[self.stops - 1]
+        by2 = np.maximum.reduceat(btmy, self.starts)
+        ty2 = np.minimum.reduceat(topy, self.starts)
+        return lftx, rgtx, btmy, topy, lx2, rx2, by2, ty2
+
+
 class ParsedTextList(list):
     """
     A list of parsed text whose coordinates are computed
@@ -112,141 +197,45 @@ class ParsedTextList(list):
         simultaneously
         """
         tws = [chk for ptxt in self for line in ptxt.lns for chk in line.chks]
-        nchrs = sum(chk.ncs for chk in tws)
-
-        # Preallocate arrays
-        dadv, cwd, dx, dxlsp, dy, bshft, caph, unsp, anfr = np.zeros(
-            (9, nchrs), dtype=float
-        )
-        fidx, lidx, widx = np.zeros((3, nchrs)).astype(int)
-
-        unsp = np.array([chk.unrenderedspace for chk in tws], dtype=float)
-        anfr = np.array([chk.line.anchfrac for chk in tws], dtype=float)
-        rtls = np.array([chk.line.rtl for chk in tws], dtype=float)
-        chkx = np.array([chk.x for chk in tws], dtype=float)
-        chky = np.array([chk.y for chk in tws], dtype=float)
-        m00, m01, m02, m10, m11, m12 = (
-            np.array([chk.transform.matrix[i][j] for chk in tws], dtype=float)
-            for i in (0, 1)
-            for j in (0, 1, 2)
-        )
-        lx2, rx2, by2, ty2 = np.zeros((4, len(tws))).astype(float)
-
-        # Collect values for dadv, cwd, dx, dy, bshft, and caph
-        idx = 0
-        for j, chk in enumerate(tws):
-            # if DIFF_ADVANCES:
-            #     for i in range(1, chk.ncs):
-            #         dadv[idx + i] = chk.chrs[i].dadvs(chk.chrs[i - 1], chk.chrs[i])
-
-            for i in range(chk.ncs):
-                cwd[idx + i] = chk.cwd[i]
-                dx[idx + i] = chk.dx[i]
-                dxlsp[idx + i] = chk.dxlsp[i]
-                dy[idx + i] = chk.dy[i]
-                bshft[idx + i] = chk.bshft[i]
-                caph[idx + i] = chk.caph[i]
-                dadv[idx + i] = chk.dadv[i]
-            fidx[idx : idx + chk.ncs] = idx
-            lidx[idx : idx + chk.ncs] = idx + chk.ncs - 1
-            widx[idx : idx + chk.ncs] = j
-            idx += chk.ncs
-
-        # Calculate wds, cstop, and cstrt
-        wds = cwd + dx + dxlsp + dadv*(dx==0)
-        cstop = np.array(list(itertools.accumulate(wds)), dtype=float)
-        cstop += wds[fidx] - cstop[fidx]
-        cstrt = cstop - cwd
-
-        # # Calculate adyl
-        adyl = np.array(list(itertools.accumulate(dy)), dtype=float)
-        adyl += dy[fidx] - adyl[fidx]
-        
-        idx_ncs = np.cumsum([0] + [chk.ncs for chk in tws])
-        starts = idx_ncs[:-1]
-
-        # Calculate chkw, offx, lftx, and rgtx
-        offx = -anfr[widx] * (cstop[lidx] - unsp[widx] * cwd[lidx])
-        offx += 2*anfr[widx]*np.add.reduceat(dx, starts)[widx]*rtls[widx] # rtl differential correction
-        lftx = chkx[widx] + cstrt + offx
-        rgtx = chkx[widx] + cstop + offx
-        btmy = chky[widx] + adyl - bshft
-        topy = btmy - caph
-
+        if not tws:
+            return
+        arrs = ChunkArrays(tws)
+        lftx, rgtx, btmy, topy, lx2, rx2, by2, ty2 = arrs.positions()
+
+        # Corners (bottom-left, top-left, top-right, bottom-right) of every
+        # character and chunk, as (x, y) pairs of flat arrays
+        cols = (lftx, rgtx, btmy, topy)
+        cpts_ut = [(lftx, btmy), (lftx, topy), (rgtx, topy), (rgtx, btmy)]
+        mat = arrs.char_mat()
+        cpts_t = [vmult(mat, x, y) for x, y in cpts_ut]
+        pts_ut = [(lx2, by2), (lx2, ty2), (rx2, ty2), (rx2, by2)]
+        pts_t = [vmult(arrs.mat, x, y) for x, y in pts_ut]
+
+        def tuples(pts):
+            """Converts corners to lists of (x, y) tuples of Python floats"""
+            return [
+                [(x0, y0), (x1, y1), (x2, y2), (x3, y3)]
+                for x0, y0, x1, y1, x2, y2, x3, y3 in zip(
+                    *(v.tolist() for pt in pts for v in pt)
+                )
+            ]
 
-        subtract_ufunc = np.frompyfunc(lambda a, b: a - b, 2, 1)
-        lx_minus_dx = subtract_ufunc(lftx, dx+dxlsp)
-        lx2 = np.minimum.reduceat(lx_minus_dx, starts)
-        rx2 = lx2 + cstop[idx_ncs[1:] - 1]
-        by2 = np.maximum.reduceat(btmy, starts)
-        ty2 = np.minimum.reduceat(topy, starts)
-
-        cpts_ut = [
-            np.hstack((lftx[:, np.newaxis], btmy[:, np.newaxis])),
-            np.hstack((lftx[:, np.newaxis], topy[:, np.newaxis])),
-            np.hstack((rgtx[:, np.newaxis], topy[:, np.newaxis])),
-            np.hstack((rgtx[:, np.newaxis], btmy[:, np.newaxis])),
-        ]
-        mat = ((m00[widx], m01[widx], m02[widx]), (m10[widx], m11[widx], m12[widx]))
-        cpts_t = [
-            np.vstack(vmult(mat, lftx, btmy)).T,
-            np.vstack(vmult(mat, lftx, topy)).T,
-            np.vstack(vmult(mat, rgtx, topy)).T,
-            np.vstack(vmult(mat, rgtx, btmy)).T,
-        ]
-        pts_ut = [
-            np.vstack((lx2, by2)),
-            np.vstack((lx2, ty2)),
-            np.vstack((rx2, ty2)),
-            np.vstack((rx2, by2)),
-        ]
-        mat = ((m00, m01, m02), (m10, m11, m12))
-        pts_t = [
-            np.vstack(vmult(mat, lx2, by2)),
-            np.vstack(vmult(mat, lx2, ty2)),
-            np.vstack(vmult(mat, rx2, ty2)),
-            np.vstack(vmult(mat, rx2, by2)),
-        ]
+        chrs = [c for chk in tws for c in chk.chrs]
+        for c, put, pt in zip(chrs, tuples(cpts_ut), tuples(cpts_t)):
+            c.parsed_pts_ut = put
+            c.parsed_pts_t = pt
 
         # pylint:disable=protected-access
-        # Split outputs into lists of column vectors
-        # maxerr = float('-inf')
-        for i, chk in enumerate(tws):
-            # Extract the slices of the relevant arrays for this TChunk
-            lxw = lftx[idx_ncs[i] : idx_ncs[i + 1], np.newaxis]
-            rxw = rgtx[idx_ncs[i] : idx_ncs[i + 1], np.newaxis]
-            byw = btmy[idx_ncs[i] : idx_ncs[i + 1], np.newaxis]
-            tyw = topy[idx_ncs[i] : idx_ncs[i + 1], np.newaxis]
-
-            chk._charpos = (lxw, rxw, byw, tyw, lx2[i], rx2[i], by2[i], ty2[i])
-            chk._cpts_ut = [cpv[idx_ncs[i] : idx_ncs[i + 1], :] for cpv in cpts_ut]
-            chk._cpts_t = [cpv[idx_ncs[i] : idx_ncs[i + 1], :] for cpv in cpts_t]
-            chk._pts_ut = [
-                (float(pts_ut[0][0][i]), float(pts_ut[0][1][i])),
-                (float(pts_ut[1][0][i]), float(pts_ut[1][1][i])),
-                (float(pts_ut[2][0][i]), float(pts_ut[2][1][i])),
-                (float(pts_ut[3][0][i]), float(pts_ut[3][1][i])),
-            ]
-            chk._pts_t = [
-                (float(pts_t[0][0][i]), float(pts_t[0][1][i])),
-                (float(pts_t[1][0][i]), float(pts_t[1][1][i])),
-                (float(pts_t[2][0][i]), float(pts_t[2][1][i])),
-                (float(pts_t[3][0][i]), float(pts_t[3][1][i])),
-            ]
-
-            for j, c in enumerate(chk.chrs):
-                c.parsed_pts_ut = [
-                    (float(chk._cpts_ut[0][j][0]), float(chk._cpts_ut[0][j][1])),
-                    (float(chk._cpts_ut[1][j][0]), float(chk._cpts_ut[1][j][1])),
-                    (float(chk._cpts_ut[2][j][0]), float(chk._cpts_ut[2][j][1])),
-                    (float(chk._cpts_ut[3][j][0]), float(chk._cpts_ut[3][j][1])),
-                ]
-                c.parsed_pts_t = [
-                    (float(chk._cpts_t[0][j][0]), float(chk._cpts_t[0][j][1])),
-                    (float(chk._cpts_t[1][j][0]), float(chk._cpts_t[1][j][1])),
-                    (float(chk._cpts_t[2][j][0]), float(chk._cpts_t[2][j][1])),
-                    (float(chk._cpts_t[3][j][0]), float(chk._cpts_t[3][j][1])),
-                ]
+        # Split outputs into views of each TChunk's slice
+        cpts_ut = [np.column_stack(pt) for pt in cpts_ut]
+        cpts_t = [np.column_stack(pt) for pt in cpts_t]
+        bounds = zip(arrs.starts.tolist(), arrs.stops.tolist())
+        for chk, (i0, i1), put, pt in zip(tws, bounds, tuples(pts_ut), tuples(pts_t)):
+            chk._charpos = tuple(v[i0:i1, np.newaxis] for v in cols)
+            chk._cpts_ut = [cpv[i0:i1] for cpv in cpts_ut]
+            chk._cpts_t = [cpv[i0:i1] for cpv in cpts_t]
+            chk._pts_ut = put
+            chk._pts_t = pt
         # pylint:enable=protected-access
     
     def make_next_chain(self):
@@ -1713,23 +1702,20 @@ class ParsedText:
         """Gets the untransformed extent of each character."""
         exts = []
         if self.lns is not None and self.lns and self.lns[0].xsrc is not None:
-            for c in self.chrs:
-                pt1 = c.pts_ut[0]
-                pt2 = c.pts_ut[2]
-                if not math.isnan(pt1[1]):
-                    exts.append(bbox((pt1, pt2)))
+            lftx, rgtx, btmy, topy = char_positions(self.chrs)
+            exts = corner_bboxes(lftx, btmy, rgtx, topy)
         return exts
 
     def get_chunk_extents(self):
         """Gets the untransformed extent of each chunk."""
         exts = []
         if self.lns is not None and self.lns and self.lns[0].xsrc is not None:
-            for line in self.lns:
-                for chk in line.chks:
-                    pt1 = chk.pts_ut[0]
-                    pt2 = chk.pts_ut[2]
-                    if not math.isnan(pt1[1]):
-                        exts.append(bbox((pt1, pt2)))
+            pts = [chk.pts_ut for line in self.lns for chk in line.chks]
+            if pts:
+                lx2, by2, rx2, ty2 = np.array(
+                    [p[0] + p[2] for p in pts], dtype=float
+                ).T
+                exts = corner_bboxes(lx2, by2, rx2, ty2)
         return exts
 
     def get_line_extents(self):
@@ -2701,6 +2687,7 @@ class TLine:
         """
         chk = None
         self.chks = []
+        dadvs = self.pair_dadvs()
         for i in range(len(self.chrs)):
             if i == 0:
                 chk = TChunk(i, self.x[0], self.y[0], self)
@@ -2710,11 +2697,35 @@ class TLine:
                 chk = TChunk(i, self.x[min(i,len(self.x)-1)], self.y[min(i,len(self.y)-1)], self)
                 # open new chunk
             else:
-                chk.addc(i)
+                chk.addc(i, None if dadvs is None else dadvs[i])
                 # add to existing chunk
         if chk is not None:
             self.addw(chk)
 
+    def pair_dadvs(self):
+        """
+        Differential advance of each character relative to the one before it,
+        found in bulk with the character table's kerning indexes. Returns None
+        for short lines, for which per-pair lookups are faster.
+        """
+        chrs = self.chrs
+        if len(chrs) < MIN_BULK_DADVS:
+            return None
+        ctable = self.ptxt.ctable
+        groups = dict()  # kerning table -> indices of the characters using it
+        for i in range(1, len(chrs)):
+            cL, cR = chrs[i - 1].loc, chrs[i].loc
+            # default to 0 for chars of different style
+            if cL.elem == cR.elem and cL.typ == cR.typ:
+                groups.setdefault(id(chrs[i].prop.dadvs), []).append(i)
+        ret = np.zeros(len(chrs))
+        for inds in groups.values():
+            kidx = ctable.kerning_index(chrs[inds[0]].prop.dadvs)
+            ret[inds] = kidx.pairs(
+                [chrs[i - 1].c for i in inds], [chrs[i].c for i in inds]
+            ) * np.array([chrs[i].utfs for i in inds])
+        return ret.tolist()
+
     def dell(self):
         """Deletes the whole line."""
         self.write_xy(self.x[:1])
@@ -2957,8 +2968,11 @@ class TChunk:
         ret.line = memo[self.line]
         return ret
 
-    def addc(self, i):
-        """Adds an existing character to a chunk based on line index."""
+    def addc(self, i, dadv=None):
+        """
+        Adds an existing character to a chunk based on line index. Its
+        differential advance can be passed if it was already computed.
+        """
         c = self.line.chrs[i]
         c.chk = None  # avoid problems in character properties
         self.chrs.append(c)
@@ -2976,7 +2990,7 @@ class TChunk:
         self.dy.append(c.dy)
         self.caph.append(c.caph)
         self.bshft.append(c.bshft)
-        self.dadv.append(c.dadvs(self.chrs[-2], c))
+        self.dadv.append(c.dadvs(self.chrs[-2], c) if dadv is None else dadv)
         c.chk = self
 
     def removec(self, c):
@@ -3759,7 +3773,6 @@ class TChar:
         "loc", "caph", "spw",
         "line", "lnindex", "chk", "windex",
         "_dx", "_dy", "_ax", "_ay",
-        "dadvs",
         "parsed_pts_t", "parsed_pts_ut",
         "_lsp", "_bshft",
         "lhs"
@@ -3800,8 +3813,6 @@ class TChar:
         self._dy = dy
         self._ax = None
         self._ay = None
-        self.dadvs = lambda cL, cR: prop.dadvs.get((cL.c, cR.c), 0) * utfs * (cL.loc.elem==cR.loc.elem and cL.loc.typ==cR.loc.typ)
-        # default to 0 for chars of different style
         self.parsed_pts_t = None
         self.parsed_pts_ut = None
         # for merging later
@@ -3842,7 +3853,6 @@ class TChar:
         ret._dy = self._dy
         ret._ax = self._ax
         ret._ay = self._ay
-        ret.dadvs = self.dadvs
         ret.parsed_pts_t = self.parsed_pts_t
         ret.parsed_pts_ut = self.parsed_pts_ut
         ret._lsp = self._lsp
@@ -3851,6 +3861,12 @@ class TChar:
 
         return ret
 
+    def dadvs(self, cL, cR):
+        """Differential advance between two characters, in my style"""
+        if cL.loc.elem != cR.loc.elem or cL.loc.typ != cR.loc.typ:
+            return 0  # default to 0 for chars of different style
+        return self.prop.dadvs.get((cL.c, cR.c), 0) * self.utfs
+
     @property
     def dx(self):
         """Returns the dx property."""
@@ -4287,6 +4303,43 @@ class CProp:
         }
 
 
+class KerningIndex:
+    """
+    A table of differential advances flattened to arrays, for looking up many
+    pairs at once. Characters are numbered, and the pair keys
+    (left number * n + right number) are stored sorted next to their values,
+    so a whole string's adjustments take a single searchsorted.
+    """
+
+    __slots__ = ("ids", "num", "keys", "vals")
+
+    def __init__(self, dadvs):
+        """Builds the index from a CProp dadvs table"""
+        chars = {c for pair in dadvs for c in pair}
+        self.ids = {c: i for i, c in enumerate(sorted(chars))}
+        self.num = max(len(chars), 1)
+        ids, num = self.ids, self.num
+        keys = np.fromiter(
+            (ids[cL] * num + ids[cR] for cL, cR in dadvs), np.int64, len(dadvs)
+        )
+        vals = np.fromiter(dadvs.values(), float, len(dadvs))
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.vals = vals[order]
+
+    def pairs(self, lefts, rights):
+        """Advances for each pair (lefts[i], rights[i]), 0 for unknown pairs"""
+        ids = self.ids
+        lid = np.fromiter((ids.get(c, -1) for c in lefts), np.int64, len(lefts))
+        rid = np.fromiter((ids.get(c, -1) for c in rights), np.int64, len(rights))
+        keys = lid * self.num + rid
+        if len(self.keys) == 0:
+            return np.zeros(len(keys))
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = (lid >= 0) & (rid >= 0) & (self.keys[pos] == keys)
+        return np.where(hit, self.vals[pos], 0.0)
+
+
 class CLoc:
     """Represents the location of a single character in the SVG."""
 
@@ -4336,18 +4389,20 @@ class CharacterTable:
 
         hp = has_pango()
         # hp = False; import os; os.environ["HASPANGO"]='False'
-        if hp:
-            # Prefer to measure with Pango if we have it (faster, most accurate)
-            self.ctable = self.measure_characters()
+        # Prefer to measure with Pango if we have it (faster, most accurate)
+        # Can also extract directly using fonttools, which is pure Python
+        # Currently is almost identical to Pango, although some rare
+        # differential kerning differences persist, e.g. in between
+        # the characters 'b' and 'y' in the Noto Sans font
+        self.method = "pango" if hp else "fonttools"
+        if USE_METRICS_CACHE:
+            self.ctable = self.cached_characters()
         else:
-            # Can also extract directly using fonttools, which is pure Python
-            # Currently is almost identical to Pango, although some rare 
-            # differential kerning differences persist, e.g. in between
-            # the characters 'b' and 'y' in the Noto Sans font
-            self.ctable = self.extract_characters()
+            self.ctable = self.measure(self.tstyset, self.pchrset)
 
         self.mults = dict()
         self._ftable = None
+        self._kidxs = dict()
 
     def collect_characters(self):
         """Finds all the characters in a list of elements."""
@@ -4397,14 +4452,161 @@ class CharacterTable:
                         tsbfs[fsty]= true_style(sty)
         return tsbfs
 
-    def extract_characters(self):
+    def measure(self, tstyset, pchrset):
+        """Measures characters with Pango if available, otherwise fonttools"""
+        if (
+            PARALLEL_MEASURE
+            and sum(sty is not None for sty in tstyset) >= MIN_PARALLEL_STYLES
+        ):
+            ctable = self.measure_parallel(tstyset, pchrset)
+            if ctable is not None:
+                return ctable
+        if self.method == "pango":
+            return self.measure_characters(tstyset, pchrset)
+        return self.extract_characters(tstyset, pchrset)
+
+    def measure_parallel(self, tstyset, pchrset):
+        """
+        Measures the styles in a pool of processes, each with its own Pango
+        and fonttools state, and merges their tables. Styles are split into
+        groups of roughly equal numbers of strings to render. Workers are
+        spawned, so the main script must be safe to import, and must set up
+        inkex as SI's scripts do by importing dhelpers. Returns None if the
+        pool could not be used, in which case the caller measures serially.
+        """
+        import os
+        import multiprocessing
+        import concurrent.futures
+
+        def cost(sty):
+            return len(tstyset[sty]) * (
+                1 + sum(len(v) for v in pchrset.get(sty, dict()).values())
+            )
+
+        stys = sorted((sty for sty in tstyset if sty is not None), key=cost, reverse=True)
+        nworkers = min(MAX_MEASURE_WORKERS, os.cpu_count() or 1, len(stys))
+        if nworkers < 2:
+            return None
+        groups = [[] for _ in range(nworkers)]
+        loads = [0] * nworkers
+        for sty in stys:
+            i = loads.index(min(loads))
+            groups[i].append(sty)
+            loads[i] += cost(sty)
+        jobs = [
+            [
+                (
+                    str(sty),
+                    sorted(tstyset[sty]),
+                    {c: sorted(v) for c, v in pchrset.get(sty, dict()).items()},
+                )
+                for sty in grp
+            ]
+            for grp in groups
+        ]
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=nworkers, mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                results = list(pool.map(_measure_styles, [self.method] * nworkers, jobs))
+        except Exception:  # pylint: disable=broad-except
+            return None
+
+        if any(method != self.method for method, _ in results):
+            # Pango could not load a font in some worker
+            self.method = "fonttools"
+            return self.extract_characters(tstyset, pchrset)
+        ctable = dict()
+        for grp, (_, tables) in zip(groups, results):
+            for i, sty in enumerate(grp):
+                chars, pairs = tables[i]
+                dadvs = {(pchr, c): val for pchr, c, val in pairs}
+                ctable[sty] = {
+                    c: CProp(c, cwd, spw, caph, dadvs, inkbb)
+                    for c, (cwd, spw, caph, inkbb) in chars.items()
+                }
+        if None in tstyset:
+            ctable[None] = dict()
+            for c in tstyset[None]:
+                ctable[None][c] = CProp(c, 0, 0, 0, dict(), [0, 0, 0, 0])
+        return ctable
+
+    def cached_characters(self):
+        """
+        Gets character properties from the persistent metrics cache, only
+        measuring the characters and differential advances it has not seen.
+        Entries are per style, not per face: the key includes the style,
+        since the same face can be rendered differently (e.g., synthetic
+        bold or oblique). An entry is shared by every document using the style.
+        """
+        usepairs = DIFF_ADVANCES or self.method == "fonttools"
+        store = MetricsStore()
+        method = self.method
+        ents = dict()
+        tstyset, pchrset = dict(), dict()  # what still needs to be measured
+        for sty, chrs in self.tstyset.items():
+            fkey = fcfg.get_font_key(sty) if sty is not None else None
+            if fkey is None:
+                tstyset[sty] = chrs
+                if sty in self.pchrset:
+                    pchrset[sty] = self.pchrset[sty]
+                continue
+            ent = ents[sty] = store.get([method, TEXTSIZE, fkey, str(sty)])
+            need = {c for c in chrs if c not in ent.chars}
+            npairs = dict()
+            if usepairs:
+                for c, pchrs in self.pchrset.get(sty, dict()).items():
+                    npchrs = {pchr for pchr in pchrs if (pchr, c) not in ent.pairs}
+                    if npchrs:
+                        npairs[c] = npchrs
+                        need.update(npchrs)
+                        need.add(c)
+            if need or ent.caph is None:
+                tstyset[sty] = need | {" "}
+                pchrset[sty] = npairs
+
+        ctable = self.measure(tstyset, pchrset) if tstyset else dict()
+        if self.method != method:
+            # Pango could not load a font, so everything is extracted instead
+            return self.extract_characters()
+
+        for sty, ent in ents.items():
+            if sty in tstyset:
+                new = ctable[sty]
+                pairs = dict()
+                for dadvs in {id(prop.dadvs): prop.dadvs for prop in new.values()}.values():
+                    pairs.update(dadvs)
+                ent.update(
+                    {c: [new[c].charw, list(new[c].inkbb)] for c in tstyset[sty]},
+                    pairs,
+                    new[" "].spacew,
+                    new[" "].caph,
+                )
+            dadvs = dict()
+            if usepairs:
+                for c, pchrs in self.pchrset.get(sty, dict()).items():
+                    for pchr in pchrs:
+                        if (pchr, c) in ent.pairs:
+                            dadvs[pchr, c] = ent.pairs[pchr, c]
+            ctable[sty] = {
+                c: CProp(
+                    c, ent.chars[c][0], ent.spacew, ent.caph, dadvs, list(ent.chars[c][1])
+                )
+                for c in self.tstyset[sty]
+            }
+        store.save()
+        return ctable
+
+    def extract_characters(self, tstyset=None, pchrset=None):
         """
         Direct extraction of character metrics from the font file using fonttools
         fonttools is pure Python, so this usually works
         """
+        tstyset = self.tstyset if tstyset is None else tstyset
+        pchrset = self.pchrset if pchrset is None else pchrset
         badchars = {"\n", "\r"}
         ret = dict()
-        for sty, chrs in self.tstyset.items():
+        for sty, chrs in tstyset.items():
             if sty is not None:
                 bdcs = {c for c in chrs if c in badchars}  # unusual chars
                 gcs = {c for c in chrs if c not in badchars}
@@ -4421,9 +4623,9 @@ class CharacterTable:
                 ret[sty] = dict()
                 for fnt, chs in fntcs.items():
                     ftfnt = fcfg.get_fonttools_font(fnt)
-                    if sty in self.pchrset:
+                    if sty in pchrset:
                         pct2 = {
-                            k: val for k, val in self.pchrset[sty].items() if k in chs
+                            k: val for k, val in pchrset[sty].items() if k in chs
                         }
                     else:
                         pct2 = dict()
@@ -4444,21 +4646,24 @@ class CharacterTable:
                     )
             else:
                 ret[sty] = dict()
-                for c in self.tstyset[None]:
+                for c in tstyset[None]:
                     ret[sty][c] = CProp(c, 0, 0, 0, dict(), [0, 0, 0, 0])
         return ret
 
-    def measure_characters(self):
+    def measure_characters(self, tstyset=None, pchrset=None):
         """
         Uses Pango to measure character properties by rendering them on an unseen
         context. Requires GTK Python bindings, generally present in Inkscape 1.1 and
         later. If Pango is absent, extract_characters will be called instead.
+        tstyset and pchrset default to all of the table's characters.
 
         Generates prefixed, suffixed copies of each string, compares them to a blank
         version without any character. This measures the logical advance, i.e., the
         width including intercharacter space. Width corresponds to a character with
         a composed font size of 1 uu.
         """
+        tstyset = self.tstyset if tstyset is None else tstyset
+        pchrset = self.pchrset if pchrset is None else pchrset
         cnt = 0
         pstrings = dict()
 
@@ -4484,7 +4689,7 @@ class CharacterTable:
 
         ixes = dict()
         validtstyset = {
-            sty: chrs for sty, chrs in self.tstyset.items() if sty is not None
+            sty: chrs for sty, chrs in tstyset.items() if sty is not None
         }
         for sty in validtstyset:
             chrs = [chr(c) for c in fcfg.fontcharsets[sty]]
@@ -4520,9 +4725,9 @@ class CharacterTable:
                 if DIFF_ADVANCES:
                     for pchr in chrs:
                         if (
-                            sty in self.pchrset
-                            and myc in self.pchrset[sty]
-                            and pchr in self.pchrset[sty][myc]
+                            sty in pchrset
+                            and myc in pchrset[sty]
+                            and pchr in pchrset[sty][myc]
                         ):
                             tpc = make_string(
                                 prefix + effc(pchr) + effc(myc) + suffix, sty
@@ -4565,7 +4770,8 @@ class CharacterTable:
             needexts2 = "0".join(needexts) + "1" + "1" * len(prefix)
             success, metrics, exts = pngr.measure_text(sty, joinedstr, needexts2)
             if not success:
-                return self.extract_characters()
+                self.method = "fonttools"
+                return self.extract_characters(tstyset, pchrset)
 
             spw = exts[-len(prefix) - 1][0][2]
             cnt = 0
@@ -4647,9 +4853,9 @@ class CharacterTable:
                     dadvscl,
                     [val / TEXTSIZE for val in inkbb],
                 )
-        if None in self.tstyset:
+        if None in tstyset:
             ctbl[None] = dict()
-            for c in self.tstyset[None]:
+            for c in tstyset[None]:
                 ctbl[None][c] = CProp(c, 0, 0, 0, dict(), [0, 0, 0, 0])
         return ctbl
 
@@ -4664,6 +4870,13 @@ class CharacterTable:
                 ret += "    " + str(val.dadvs)
         return ret
 
+    def kerning_index(self, dadvs):
+        """The KerningIndex of a dadvs table, built on first use"""
+        kidx = self._kidxs.get(id(dadvs))
+        if kidx is None or kidx[0] is not dadvs:
+            kidx = self._kidxs[id(dadvs)] = (dadvs, KerningIndex(dadvs))
+        return kidx[1]
+
     @staticmethod
     def flowy(sty):
         """Returns the font's ascent value for the given style."""
@@ -4710,6 +4923,52 @@ class CharacterTable:
             return self.mults[(char, sty, scl)]
 
 
+def _measure_styles(method, styles):
+    """
+    Worker for CharacterTable.measure_parallel. Measures a group of
+    (style string, chars, preceding chars) and returns the method used and,
+    for each entry by index, its style's characters' (width, space width, cap
+    height, ink bbox) and differential advance pairs, as plain values that
+    pickle reliably. Entries with the same style string are measured together.
+    """
+    stys = []
+    tstyset, pchrset = dict(), dict()
+    for stystr, chrs, pchrs in styles:
+        sty = Style(stystr)
+        tfnt = fcfg.get_true_font(sty)
+        if tfnt != sty:
+            fcfg.fontcharsets.setdefault(sty, fcfg.fontcharsets[tfnt])
+        stys.append(sty)
+        tstyset.setdefault(sty, set()).update(chrs)
+        spchrs = pchrset.setdefault(sty, dict())
+        for c, v in pchrs.items():
+            spchrs.setdefault(c, set()).update(v)
+    tbl = CharacterTable.__new__(CharacterTable)
+    tbl.method = method
+    tbl.tstyset, tbl.pchrset = tstyset, pchrset
+    if method == "pango":
+        ctable = tbl.measure_characters()
+    else:
+        ctable = tbl.extract_characters()
+
+    ret = []
+    for sty in stys:
+        props = ctable[sty]
+        pairs = dict()
+        for dadvs in {id(prop.dadvs): prop.dadvs for prop in props.values()}.values():
+            pairs.update(dadvs)
+        ret.append(
+            (
+                {
+                    c: (prop.charw, prop.spacew, prop.caph, list(prop.inkbb))
+                    for c, prop in props.items()
+                },
+                [[k[0], k[1], v] for k, v in pairs.items()],
+            )
+        )
+    return tbl.method, ret
+
+
 def wstrip(txt):
     """strip whitespaces"""
     return txt.translate({ord(c): None for c in " \n\t\r"})
@@ -4958,10 +5217,7 @@ def calc_parsed_pts_ut(cs,transform):
     Compute parsed_pts_ut for a character reexpressed in the coord
     system of another transform
     '''
-    pts = []; idx = []
-    for c in cs:
-        idx.append((c, len(c.parsed_pts_t)))
-        pts.extend(c.parsed_pts_t)
+    pts = [p for c in cs for p in c.parsed_pts_t]
     if pts:
         M = transform.matrix
         a00, a01, a02 = M[0]; a10, a11, a12 = M[1]
@@ -4972,8 +5228,39 @@ def calc_parsed_pts_ut(cs,transform):
         syv = P[:, 1] - a12
         Ux = (a11 * sxv - a01 * syv) * inv_det
         Uy = (a00 * syv - a10 * sxv) * inv_det
-        U  = np.column_stack((Ux, Uy))               # (K,2)
+        U = list(zip(Ux.tolist(), Uy.tolist()))     # (K,2)
         k = 0
-        for c, n in idx:
-            c.parsed_pts_ut = [tuple(p) for p in U[k:k+n]]
-            k += n
\ No newline at end of file
+        for c in cs:
+            n = len(c.parsed_pts_t)
+            c.parsed_pts_ut = U[k:k+n]
+            k += n
+
+def char_positions(chrs):
+    '''
+    The untransformed extents (lftx, rgtx, btmy, topy) of a list of
+    characters as flat arrays, gathered from their chunks' positions
+    '''
+    offs = dict(); cols = []; n = 0
+    for chk in dict.fromkeys(c.chk for c in chrs):
+        offs[chk] = n
+        cols.append(chk.charpos)
+        n += chk.ncs
+    if not cols:
+        return np.zeros((4, 0))
+    ind = np.fromiter((offs[c.chk] + c.windex for c in chrs), int, len(chrs))
+    return [np.concatenate([cp[k] for cp in cols])[ind, 0] for k in range(4)]
+
+def corner_bboxes(x1s, y1s, x2s, y2s):
+    '''
+    Bounding boxes of the points (x1,y1) and (x2,y2), as made by
+    bbox(((x1,y1),(x2,y2))), skipping those where y1 is NaN
+    '''
+    keep = ~np.isnan(y1s)
+    x1s, y1s, x2s, y2s = x1s[keep], y1s[keep], x2s[keep], y2s[keep]
+    sbbs = np.column_stack((
+        np.where(x2s < x1s, x2s, x1s),  # same as min(x1, x2)
+        np.where(y2s < y1s, y2s, y1s),
+        np.abs(x1s - x2s),
+        np.abs(y1s - y2s),
+    ))
+    return [bbox(sbb) for sbb in sbbs.tolist()]
\ No newline at end of file
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Copyright (c) 2025 David Burghoff <burghoff@utexas.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A pool of long-lived Inkscape shell-mode workers.
+
+Every call to the Inkscape binary normally pays several seconds of startup.
+Long-running processes (the Autoexporter and Gallery Viewer) can instead
+enable a pool of `inkscape --shell` workers, which are started lazily, health
+checked, and restarted if they crash. Command-line calls are translated into
+an equivalent action list and dispatched to an idle worker:
+
+    inkscape_shell.enable()
+    proc = inkscape_shell.run_binary([bfn, "--export-filename", "a.pdf", "a.svg"])
+
+run_binary is a drop-in replacement for subprocess_repeat. When the pool is
+not enabled, the arguments cannot be expressed as actions, a worker fails, or
+an export does not produce its file, it falls back to a one-shot
+subprocess_repeat call, which raises CalledProcessError if Inkscape fails.
+"""
+
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+import subprocess
+
+import inkex
+import export_stats
+from inkex.text.utils import subprocess_repeat
+
+STARTUP_TIMEOUT = 120  # s, time allowed for a worker to reach its first prompt
+JOB_TIMEOUT = 600  # s, time allowed for a single job
+PING_TIMEOUT = 10  # s, time allowed for a health check
+PING_INTERVAL = 60  # s, idle workers are pinged before reuse after this long
+MAX_JOBS = 200  # workers are recycled after this many jobs to bound memory
+MAX_WORKERS = 4
+
+# Command-line options that map directly onto an action with a value
+VALUE_OPTIONS = {
+    "--export-background": "export-background",
+    "--export-background-opacity": "export-background-opacity",
+    "--export-dpi": "export-dpi",
+    "--export-width": "export-width",
+    "--export-height": "export-height",
+    "--export-id": "export-id",
+    "--export-type": "export-type",
+    "--export-filename": "export-filename",
+}
+# Command-line options that map onto a boolean export setting
+BOOL_OPTIONS = {
+    "--export-plain-svg": "export-plain-svg",
+    "--export-latex": "export-latex",
+    "--export-area-drawing": "export-area-drawing",
+    "--export-area-page": "export-area-page",
+    "--export-id-only": "export-id-only",
+    "--export-text-to-path": "export-text-to-path",
+}
+# Command-line options that map onto a document action
+DOC_OPTIONS = {
+    "--vacuum-defs": "vacuum-defs",
+    "--query-all": "query-all",
+}
+
+# Defaults of the valued export settings (Inkscape's InkFileExportCmd)
+VALUE_DEFAULTS = {
+    "export-background": "",
+    "export-background-opacity": "-1",
+    "export-dpi": "0",
+    "export-width": "0",
+    "export-height": "0",
+    "export-id": "",
+    "export-type": "",
+}
+
+# Export settings persist between documents in shell mode, so each job
+# starts by resetting every setting a command line can change
+RESET_ACTIONS = "".join(
+    "{0}:false; ".format(v) for v in BOOL_OPTIONS.values()
+) + "".join(
+    "{0}:{1}; ".format(v, VALUE_DEFAULTS[v])
+    for v in VALUE_OPTIONS.values()
+    if v != "export-filename"
+)
+
+
+class ShellError(Exception):
+    """Raised when a shell worker crashes, hangs, or cannot be started."""
+
+
+def shell_actions(args):
+    """
+    Translate a command-line argument list (binary first, document last) into
+    a shell action string. Returns None if any argument has no shell equivalent.
+    """
+    if len(args) < 2:
+        return None
+    opts = list(args[1:-1])
+    filename = str(args[-1])
+    if filename.startswith("-") or ";" in filename:
+        return None
+
+    docacts, actions, exports = [], [], []
+    export = False
+    i = 0
+    while i < len(opts):
+        opt = str(opts[i])
+        val = None
+        if "=" in opt:
+            opt, val = opt.split("=", 1)
+        if opt in VALUE_OPTIONS or opt == "--actions":
+            if val is None:
+                i += 1
+                if i >= len(opts):
+                    return None
+                val = str(opts[i])
+            if opt == "--actions":
+                actions.append(val.strip())
+            else:
+                if ";" in val:
+                    return None
+                exports.append("{0}:{1}; ".format(VALUE_OPTIONS[opt], val))
+                export |= opt == "--export-filename"
+        elif opt in BOOL_OPTIONS:
+            exports.append("{0}:true; ".format(BOOL_OPTIONS[opt]))
+        elif opt in DOC_OPTIONS:
+            docacts.append(DOC_OPTIONS[opt] + "; ")
+        else:
+            return None
+        i += 1
+
+    ret = "file-open:{0}; ".format(filename) + RESET_ACTIONS
+    ret += "".join(docacts)
+    ret += "".join(a if a.endswith(";") else a + ";" for a in actions)
+    ret += " " if actions else ""
+    ret += "".join(exports)
+    ret += "export-do; " if export else ""
+    return ret + "file-close"
+
+
+def export_filenames(args, cwd=None):
+    """The files a command line exports to, as absolute paths."""
+    ret = []
+    opts = [str(a) for a in args[1:-1]]
+    for i, opt in enumerate(opts):
+        if opt.startswith("--export-filename="):
+            fname = opt.split("=", 1)[1]
+        elif opt == "--export-filename" and i + 1 < len(opts):
+            fname = opts[i + 1]
+        else:
+            continue
+        ret.append(os.path.abspath(os.path.join(cwd or os.getcwd(), fname)))
+    return ret
+
+
+def clear_outputs(fnames):
+    """
+    Remove existing export targets, so that after a job their existence
+    shows they were written. Returns False if any could not be removed.
+    """
+    for fname in fnames:
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+    return True
+
+
+def outputs_written(fnames):
+    """Whether every file exists."""
+    return all(os.path.isfile(fname) for fname in fnames)
+
+
+class ShellWorker:
+    """A single `inkscape --shell` process."""
+
+    def __init__(self, binary, cwd=None):
+        self.binary = binary
+        self.cwd = cwd
+        self.proc = None
+        self.njobs = 0
+        self.last_used = time.time()
+        self.start()
+
+    def start(self):
+        """Launch the process and wait for its first prompt."""
+        env = dict(os.environ)
+        env["SELF_CALL"] = "true"  # seems to be needed for 1.3
+        kwargs = dict()
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+        try:
+            self.proc = subprocess.Popen(
+                [self.binary, "--shell"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.cwd,
+                env=env,
+                **kwargs
+            )
+        except OSError as excp:
+            raise ShellError("Could not start Inkscape shell: " + str(excp)) from excp
+        self.chunks = queue.Queue()
+        self.errs = queue.Queue()
+        for stream, chunks in (
+            (self.proc.stdout, self.chunks),
+            (self.proc.stderr, self.errs),
+        ):
+            reader = threading.Thread(
+                target=ShellWorker._reader, args=(stream, chunks)
+            )
+            reader.daemon = True
+            reader.start()
+        self.njobs = 0
+        self.read_until_prompt(STARTUP_TIMEOUT)
+
+    @staticmethod
+    def _reader(stream, chunks):
+        """Move stdout into a queue so reads can time out."""
+        while True:
+            try:
+                data = stream.read1(4096)
+            except (OSError, ValueError):
+                data = b""
+            if not data:
+                chunks.put(None)
+                return
+            chunks.put(data)
+
+    def read_until_prompt(self, timeout):
+        """Returns everything printed before the next prompt."""
+        buf = b""
+        deadline = time.time() + timeout
+        while True:
+            stripped = buf.replace(b"\r\n", b"\n")
+            if stripped == b"> " or stripped.endswith(b"\n> "):
+                return stripped[:-2]
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.kill()
+                raise ShellError("Inkscape shell timed out")
+            try:
+                data = self.chunks.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if data is None:
+                self.kill()
+                raise ShellError("Inkscape shell exited unexpectedly")
+            buf += data
+
+    def read_errors(self):
+        """Returns everything printed to stderr since the last call."""
+        buf = b""
+        while True:
+            try:
+                data = self.errs.get_nowait()
+            except queue.Empty:
+                return buf
+            if data is not None:
+                buf += data
+
+    def run(self, actions, timeout=JOB_TIMEOUT):
+        """Send one line of actions and return its output and errors."""
+        if not self.alive:
+            raise ShellError("Inkscape shell is not running")
+        self.read_errors()  # discard anything left from earlier jobs
+        try:
+            self.proc.stdin.write((actions + "\n").encode("utf-8"))
+            self.proc.stdin.flush()
+        except (OSError, ValueError) as excp:
+            self.kill()
+            raise ShellError("Could not write to Inkscape shell") from excp
+        out = self.read_until_prompt(timeout)
+        self.njobs += 1
+        self.last_used = time.time()
+        return out, self.read_errors()
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def healthy(self):
+        """Check that the process is running and responding."""
+        if not self.alive:
+            return False
+        if time.time() - self.last_used < PING_INTERVAL:
+            return True
+        try:
+            self.run("inkscape-version", timeout=PING_TIMEOUT)
+            return True
+        except ShellError:
+            return False
+
+    def kill(self):
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                self.proc.kill()
+                self.proc.wait(5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+
+    def close(self):
+        """Ask the shell to quit, killing it if it does not."""
+        if self.alive:
+            try:
+                self.proc.stdin.write(b"quit\n")
+                self.proc.stdin.flush()
+                self.proc.wait(5)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+
+class ShellPool:
+    """
+    A bounded pool of shell workers sharing a binary and working directory.
+    Workers are started on demand, checked before reuse, and restarted after
+    a crash or after MAX_JOBS jobs.
+    """
+
+    def __init__(self, binary, size=MAX_WORKERS, cwd=None):
+        self.binary = binary
+        self.size = max(1, size)
+        self.cwd = cwd
+        self.idle = queue.Queue()
+        self.nworkers = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def acquire(self):
+        """Get an idle worker, starting one if the pool is not full."""
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.lock:
+                spawn = self.nworkers < self.size
+                if spawn:
+                    self.nworkers += 1
+            if spawn:
+                try:
+                    return ShellWorker(self.binary, self.cwd)
+                except ShellError:
+                    with self.lock:
+                        self.nworkers -= 1
+                    raise
+            try:
+                # Wake periodically in case a worker was discarded
+                return self.idle.get(timeout=1)
+            except queue.Empty:
+                pass
+
+    def release(self, worker):
+        if self.closed:
+            worker.close()
+            with self.lock:
+                self.nworkers -= 1
+        else:
+            self.idle.put(worker)
+
+    def discard(self, worker):
+        worker.kill()
+        with self.lock:
+            self.nworkers -= 1
+
+    def submit(self, actions, timeout=JOB_TIMEOUT):
+        """
+        Run an action list on a healthy worker, restarting it once on a crash.
+        Returns the worker's output and errors.
+        """
+        if self.closed:
+            raise ShellError("Pool is closed")
+        worker = self.acquire()
+        try:
+            if worker.njobs >= MAX_JOBS or not worker.healthy():
+                worker.close()
+                worker.start()
+            try:
+                ret = worker.run(actions, timeout)
+            except ShellError:
+                worker.start()
+                ret = worker.run(actions, timeout)
+        except ShellError:
+            self.discard(worker)
+            raise
+        self.release(worker)
+        return ret
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+            with self.lock:
+                self.nworkers -= 1
+
+
+_pools = dict()
+_pools_lock = threading.Lock()
+_pool_size = None
+
+
+def enable(size=None):
+    """
+    Route translatable binary calls through shell workers. Shell actions
+    require Inkscape 1.2 or later; on older versions this does nothing.
+    """
+    global _pool_size
+    if inkex.installed_ivp[0] < 1 or (
+        inkex.installed_ivp[0] == 1 and inkex.installed_ivp[1] < 2
+    ):
+        return False
+    if size is None:
+        size = min(MAX_WORKERS, os.cpu_count() or 1)
+    _pool_size = size
+    return True
+
+
+def disable():
+    """Stop routing calls through the pool and shut down all workers."""
+    global _pool_size
+    _pool_size = None
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(disable)
+
+
+def enabled():
+    return _pool_size is not None
+
+
+def get_pool(binary, cwd=None):
+    """Get the pool for a binary and working directory, creating it if needed."""
+    key = (binary, os.path.abspath(cwd) if cwd is not None else None)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ShellPool(binary, _pool_size, cwd)
+        return _pools[key]
+
+
+def run_binary(args, cwd=None):
+    """
+    Run an Inkscape command line, using a shell worker if possible.
+    Returns a CompletedProcess like subprocess_repeat. Shell mode does not
+    report failures, so export targets are removed beforehand and exports
+    that do not write them are repeated with a one-shot call, which raises
+    CalledProcessError if it fails too.
+    """
+    export_stats.count("binary_calls")
+    actions = shell_actions(args) if enabled() else None
+    err = None
+    fnames = export_filenames(args, cwd)
+    if actions is not None and clear_outputs(fnames):
+        try:
+            out, err = get_pool(args[0], cwd).submit(actions)
+            if outputs_written(fnames):
+                return subprocess.CompletedProcess(args, 0, stdout=out, stderr=err)
+        except ShellError:
+            pass  # fall back to a one-shot call
+    try:
+        return subprocess_repeat(args, cwd=cwd)
+    except subprocess.CalledProcessError as excp:
+        if not excp.stderr and err:
+            excp.stderr = err  # the one-shot call discards stderr
+        raise
@@ -20,9 +20,14 @@
 
 DPI_MIN = 300  # when replacing SVG with PNG, ensure DPI is at least this
 EMU_PER_INCH = 914400  # Office EMUs
+MAX_PNG_BATCH = 20  # SVGs rendered per Inkscape call
+MAX_PNG_WORKERS = 2  # concurrent Inkscape calls when rendering fallback PNGs
 
 import sys
+import subprocess
 import dhelpers as dh
+import export_stats
+import inkscape_shell
 
 bfn = dh.inkex.inkscape_system_info.binary_location
 
@@ -42,7 +47,43 @@ def overwrite_output(filein, fileout):
         fileout,
         filein,
     ]
-    dh.subprocess_repeat(args)
+    dh.run_binary(args)
+
+
+def overwrite_outputs(pairs):
+    """
+    Render several (filein, fileout) pairs like overwrite_output, using a
+    single batch-mode Inkscape call with file-open/export-do actions (Inkscape
+    1.2+). Anything that fails to render is retried on its own. When shell
+    workers are enabled every pair is sent to one, since there is no startup
+    to amortize.
+    """
+    for _, fileout in pairs:
+        if os.path.exists(fileout):
+            os.remove(fileout)
+    batch = [p for p in pairs if ";" not in p[0] + p[1]]  # action separators
+    if (
+        len(batch) > 1
+        and tuple(dh.inkex.installed_ivp[0:2]) >= (1, 2)
+        and not inkscape_shell.enabled()
+    ):
+        acts = (
+            "export-background:#ffffff; export-background-opacity:0.0; "
+            "export-dpi:600; "
+        )
+        for filein, fileout in batch:
+            acts += (
+                f"file-open:{filein}; export-filename:{fileout}; export-do; "
+                "file-close; "
+            )
+        try:
+            # without --batch-process, --actions with no file opens the GUI
+            dh.run_binary([bfn, "--batch-process", "--actions", acts])
+        except (subprocess.CalledProcessError, OSError):
+            pass  # a bad file fails the whole batch, retried one by one below
+    for filein, fileout in pairs:
+        if not os.path.exists(fileout):
+            overwrite_output(filein, fileout)
 
 
 import os
@@ -51,7 +92,7 @@ from zipfile import ZipFile, ZIP_DEFLATED, ZipInfo, BadZipFile
 from urllib.parse import unquote
 from lxml import etree as ET
 import re
-import zlib, struct, binascii, threading
+import zlib, struct, binascii, threading, copy
 
 
 # Drawing-ML namespaces used when locating <a:srcRect> alongside an
@@ -135,7 +176,7 @@ def normalize_and_copy(source_path, media_dir):
 import time
 
 
-def safe_extract_zip(file, temp_dir=None, retries=5, delay=0.5):
+def safe_extract_zip(file, temp_dir=None, retries=5, delay=0.5, members=None):
     for attempt in range(retries):
         try:
             with ZipFile(file, "r") as zip_read:
@@ -149,7 +190,7 @@ def safe_extract_zip(file, temp_dir=None, retries=5, delay=0.5):
                 staging_dir = temp_dir + "_temp"
                 if os.path.exists(staging_dir):
                     shutil.rmtree(staging_dir)
-                zip_read.extractall(staging_dir)
+                zip_read.extractall(staging_dir, members)
 
             os.makedirs(temp_dir, exist_ok=True)
 
@@ -174,12 +215,73 @@ def safe_extract_zip(file, temp_dir=None, retries=5, delay=0.5):
             time.sleep(delay * (2**attempt))  # exponential backoff
 
 
+def _strip_zip64_extra(extra):
+    """Remove any Zip64 field from a zip extra field, since it is regenerated"""
+    ret = b""
+    i = 0
+    while i + 4 <= len(extra):
+        tp, ln = struct.unpack("<HH", extra[i : i + 4])
+        if tp != 1:
+            ret += extra[i : i + 4 + ln]
+        i += 4 + ln
+    return ret
+
+
+def copy_member_raw(zip_read, zip_write, info):
+    """
+    Copy a member's compressed bytes from one archive into another that is
+    open for writing, without decompressing and recompressing them.
+    """
+    fp = zip_read.fp
+    fp.seek(info.header_offset)
+    hdr = fp.read(30)
+    if hdr[:4] != b"PK\x03\x04":
+        raise BadZipFile("Bad local header for " + info.filename)
+    nlen, elen = struct.unpack("<HH", hdr[26:30])
+    fp.seek(info.header_offset + 30 + nlen + elen)
+
+    out = copy.copy(info)
+    out.flag_bits &= ~0x08  # sizes go in the local header, no data descriptor
+    out.extra = _strip_zip64_extra(info.extra)
+    out.header_offset = zip_write.fp.tell()
+    zip_write.fp.write(out.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = fp.read(min(remaining, 1 << 20))
+        if not chunk:
+            raise BadZipFile("Truncated data for " + info.filename)
+        zip_write.fp.write(chunk)
+        remaining -= len(chunk)
+    zip_write.filelist.append(out)
+    zip_write.NameToInfo[out.filename] = out
+    zip_write.start_dir = zip_write.fp.tell()
+    zip_write._didModify = True  # pylint: disable=protected-access
+
+
 class Unzipped_Office:
-    def __init__(self, file, temp_dir=None, aecaller=None):
-        safe_extract_zip(file, temp_dir)
+    def __init__(self, file, temp_dir=None, aecaller=None, lazy=False):
+        """
+        Extracts an Office package to temp_dir. With lazy=True, only the
+        parts that finalization reads or modifies (content types, media, and
+        slides/masters/layouts or the Word document) are extracted; the rest
+        stay in the original and are copied over unchanged by rezip.
+        """
+        with ZipFile(file, "r") as zip_read:
+            names = zip_read.namelist()
+        self.source = file
+        self.type = "ppt" if any(n.startswith("ppt/") for n in names) else "word"
+        if lazy:
+            if self.type == "ppt":
+                needed = ("ppt/media/", "ppt/slides/", "ppt/slideMasters/", "ppt/slideLayouts/")
+            else:
+                needed = ("word/",)
+            names = [
+                n for n in names if n == "[Content_Types].xml" or n.startswith(needed)
+            ]
+        temp_dir = safe_extract_zip(file, temp_dir, members=names)
+        self.extracted = set(names)
 
         self.temp_dir = temp_dir
-        self.type = "ppt" if os.path.isdir(os.path.join(temp_dir, "ppt")) else "word"
         self.media_dir = os.path.join(temp_dir, self.type, "media")
 
         # Two dicts (inverses of each other) track which marker color
@@ -210,6 +312,7 @@ class Unzipped_Office:
 
         self.aecaller = aecaller
         self._queued_png_out = set()
+        self._queued_pngs = []
         self._queued_png_lock = threading.Lock()
 
         if not os.path.exists(self.media_dir):
@@ -255,13 +358,14 @@ class Unzipped_Office:
         for slide in self.slides:
             slide.delete_fallback_png()
 
-    def svg_to_png(self, svg_path, png_path):
-        print(f"Exporting {svg_path}")
+    def svgs_to_pngs(self, pairs):
+        for svg_path, _ in pairs:
+            print(f"Exporting {svg_path}")
 
         if self.aecaller is not None:
-            self.aecaller.check(overwrite_output, svg_path, png_path,finalization=True)
+            self.aecaller.check(overwrite_outputs, pairs, finalization=True)
         else:
-            overwrite_output(svg_path, png_path)
+            overwrite_outputs(pairs)
 
     def queue_svg_to_png(self, svg_path, png_path):
         key = os.path.normcase(os.path.abspath(os.path.normpath(png_path)))
@@ -271,19 +375,29 @@ class Unzipped_Office:
             if key in self._queued_png_out:
                 return
             self._queued_png_out.add(key)
+            self._queued_pngs.append((svg_path, png_path))
 
-        t = threading.Thread(
-            target=self.svg_to_png, args=(svg_path, png_path), daemon=True
+    def render_queued_pngs(self):
+        """Render queued PNGs in batches, a few Inkscape calls at a time"""
+        with self._queued_png_lock:
+            pairs, self._queued_pngs = self._queued_pngs, []
+        if not pairs:
+            return
+        nbatch = max(
+            -(-len(pairs) // MAX_PNG_BATCH), min(MAX_PNG_WORKERS, len(pairs))
         )
-        t.start()
-        self.threads.append(t)
+        batches = [pairs[i::nbatch] for i in range(nbatch)]
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=MAX_PNG_WORKERS) as pool:
+            futs = [export_stats.submit(pool, self.svgs_to_pngs, b) for b in batches]
+            for fut in futs:
+                fut.result()  # re-raise any errors
 
     def leave_fallback_png(self):
-        self.threads = []
         for slide in self.slides:
             slide.leave_fallback_png()
-        for t in self.threads:
-            t.join()
+        self.render_queued_pngs()
 
     def leave_fallback_png_simple(self):
         for slide in self.slides:
@@ -421,28 +535,53 @@ class Unzipped_Office:
         return index
 
     def rezip(self, output):
-        with ZipFile(output, "w") as zip_write:
-            for root, _, files in os.walk(self.temp_dir):
-                for file in files:
-                    abs_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(abs_path, self.temp_dir).replace(
-                        os.sep, "/"
-                    )
-
-                    with open(abs_path, "rb") as f:
-                        data = f.read()
-
-                    zip_info = ZipInfo(rel_path, (1980, 1, 1, 0, 0, 0))
-                    zip_info.compress_type = ZIP_DEFLATED
-                    zip_info.create_system = 0
-                    zip_info.create_version = 45
-                    zip_info.extract_version = 20
-                    zip_info.flag_bits = 6
-                    zip_info.volume = 0
-                    zip_info.internal_attr = 0
-                    zip_info.external_attr = 0
+        """
+        Write the package to output. Parts that are identical to the original
+        (or were never extracted) have their compressed bytes copied as-is;
+        only modified and new parts are compressed.
+        """
+        ondisk = dict()
+        for root, _, files in os.walk(self.temp_dir):
+            for file in files:
+                abs_path = os.path.join(root, file)
+                rel_path = os.path.relpath(abs_path, self.temp_dir).replace(
+                    os.sep, "/"
+                )
+                ondisk[rel_path] = abs_path
 
-                    zip_write.writestr(zip_info, data)
+        with ZipFile(self.source, "r") as zip_read, ZipFile(output, "w") as zip_write:
+            for info in zip_read.infolist():
+                if info.is_dir():
+                    continue
+                abs_path = ondisk.pop(info.filename, None)
+                if abs_path is None:
+                    if info.filename not in self.extracted:
+                        copy_member_raw(zip_read, zip_write, info)
+                    continue  # otherwise deleted
+                with open(abs_path, "rb") as f:
+                    data = f.read()
+                if len(data) == info.file_size and zlib.crc32(data) == info.CRC:
+                    copy_member_raw(zip_read, zip_write, info)
+                else:
+                    Unzipped_Office.write_part(zip_write, info.filename, data)
+
+            for rel_path, abs_path in ondisk.items():
+                with open(abs_path, "rb") as f:
+                    Unzipped_Office.write_part(zip_write, rel_path, f.read())
+
+    @staticmethod
+    def write_part(zip_write, rel_path, data):
+        zip_info = ZipInfo(rel_path, (1980, 1, 1, 0, 0, 0))
+        zip_info.compress_type = ZIP_DEFLATED
+        zip_info.create_system = 0
+        zip_info.create_version = 45
+        zip_info.extract_version = 20
+        zip_info.flag_bits = 6
+        zip_info.volume = 0
+        zip_info.internal_attr = 0
+        zip_info.external_attr = 0
+
+        zip_write.writestr(zip_info, data)
 
     def unrenderable_fonts_to_paths(self):
         """
@@ -24,6 +24,9 @@ from shutil import which
 
 MAX_THREADS_OFFICE = 1
 MAX_THREADS_LIBREOFFICE = 1
+MAX_MARKER_WORKERS = 4  # concurrent marker SVG -> PDF exports
+USE_MARKER_CACHE = True  # reuse marker PDFs from si_cache across documents
+MAX_CACHED_MARKERS = 500
 
 def find_soffice():
     """
@@ -694,6 +697,7 @@ def _inkscape_bin():
     return dh.inkex.inkscape_system_info.binary_location  # noqa
 
 from autoexporter import Exporter, ORIG_KEY, get_svg
+import export_stats
 
 
 def _is_ae_output_svg(svg_path: str) -> bool:
@@ -739,6 +743,38 @@ def _strip_inkscape_pages(in_svg_path: str, out_svg_path: str) -> None:
             parent.remove(pg)
     dh.overwrite_svg(svg, out_svg_path)
     
+def _subexport_options(exporter: Exporter, svg_path: str, pdf_path: str):
+    """
+    Options for a sub-Exporter converting svg_path to pdf_path: the calling
+    exporter's settings, without its per-run state.
+    """
+    from types import SimpleNamespace
+
+    # The sub-export gets its own stats, temp files and live documents, so
+    # it does not report or clean up the parent's run
+    opts = SimpleNamespace(**{
+        k: v for k, v in vars(exporter).items() if k not in Exporter.RUN_STATE
+    })
+    opts.formats = ["pdf"]
+    opts.margin = 0
+    opts.original_file = svg_path
+    opts.outtemplate = pdf_path[:-4] + ".svg"
+    opts.display_name = "{0} in {1}".format(
+        os.path.basename(svg_path), os.path.basename(exporter.filein)
+    )
+
+    # Exporter.__init__ sets self.filein=fin and then does
+    # self.__dict__.update(vars(opts)) — so an inherited `filein` would
+    # overwrite the stripped_svg we pass in. Drop it.
+    opts.__dict__.pop("filein", None)
+
+    # linked_locations from the parent are relative to the docx, not our SVG.
+    # Force the sub-Exporter to scan the SVG for its own linked images.
+    opts.exportnow = False
+    opts.linked_locations = {}
+    return opts
+
+
 def export_svg_to_pdf(svg_path: str, exporter: Exporter) -> str:
     """Export SVG -> PDF next to the SVG.
 
@@ -763,13 +799,12 @@ def export_svg_to_pdf(svg_path: str, exporter: Exporter) -> str:
             "--export-filename", pdf_path,
             svg_path,
         ]
-        exporter.check(dh.subprocess_repeat, args, finalization=True)
+        exporter.check(dh.run_binary, args, finalization=True)
         _debug_copy(pdf_path, label="svg_out_ae")
         return pdf_path
 
     # Full AE pipeline for foreign SVGs.
     import tempfile, shutil as _sh
-    from types import SimpleNamespace
 
     tmp_dir = tempfile.mkdtemp(prefix="si_ae_subexport_")
     try:
@@ -779,27 +814,9 @@ def export_svg_to_pdf(svg_path: str, exporter: Exporter) -> str:
         # Capture the intermediate SVG before tmp_dir is wiped in the finally.
         _debug_copy(stripped_svg, label="svg_stripped")
 
-        # 2. Inherit all of the calling exporter's settings, then override
-        #    the few we need to change for a Word/PPT-bound export.
-        opts = SimpleNamespace(**dict(vars(exporter)))
-        opts.formats = ["pdf"]
-        opts.margin = 0
-        opts.original_file = svg_path
-        opts.outtemplate = pdf_path[:-4] + ".svg"
-        opts.display_name = "{0} in {1}".format(
-            os.path.basename(svg_path), os.path.basename(exporter.filein)
-        )
-        
-        # Exporter.__init__ sets self.filein=fin and then does
-        # self.__dict__.update(vars(opts)) — so an inherited `filein` would
-        # overwrite the stripped_svg we pass in. Drop it.
-        opts.__dict__.pop("filein", None)
-        
-        # linked_locations from the parent are relative to the docx, not our SVG.
-        # Force the sub-Exporter to scan the SVG for its own linked images.
-        opts.exportnow = False
-        opts.linked_locations = {}
-        
+        # 2. Inherit the calling exporter's settings, overriding the few we
+        #    need to change for a Word/PPT-bound export.
+        opts = _subexport_options(exporter, svg_path, pdf_path)
         if exporter.prints:
             exporter.prints("{} : Beginning export".format(opts.display_name))
         Exporter(stripped_svg, opts).export_all()
@@ -858,46 +875,139 @@ def _paeth(a, b, c):
         return a
     return b if pb <= pc else c
 
+def _unfilter_png(raw, w, h, bpp, predictor):
+    """Decode an 8-bit-per-channel image stream into an (h, w*bpp) uint8 array.
+
+    Handles both PNG-style predictors (10..15) and the no-predictor case.
+    Returns ``(array, None)`` on success or ``(None, error_msg)`` when the
+    stream is malformed or uses an unsupported filter.
+
+    None, Sub, and Up rows are vectorized: a run of Up rows is one cumulative
+    sum down the columns and a Sub row is a cumulative sum along each channel.
+    Average and Paeth depend on the reconstructed pixel to their left, so
+    streams using them go to Pillow's decoder when it is available and to a
+    per-row loop otherwise.
+    """
+    import numpy as np
+
+    stride = bpp * w
+    if predictor < 10:
+        # No predictor: stream is just stride*h raw sample bytes.
+        if len(raw) != stride * h:
+            return None, ("data length mismatch (no predictor): got {}, "
+                          "expected {}").format(len(raw), stride * h)
+        return np.frombuffer(raw, np.uint8).reshape(h, stride), None
+
+    # PNG-style predictor: each row is [filter byte][stride sample bytes].
+    if len(raw) != (1 + stride) * h:
+        return None, ("predictor data length mismatch: got {}, "
+                      "expected {} for {}x{}").format(
+                          len(raw), (1 + stride) * h, w, h)
+    data = np.frombuffer(raw, np.uint8).reshape(h, 1 + stride)
+    filters = data[:, 0]
+    lines = data[:, 1:]
+    bad = np.nonzero(filters > 4)[0]
+    if len(bad) > 0:
+        return None, "unknown PNG filter byte {} at row {}".format(
+            filters[bad[0]], bad[0])
+
+    if np.any(filters >= 3):
+        out = _unfilter_png_pil(raw, w, h, bpp)
+        if out is not None:
+            return out, None
+
+    out = np.empty((h, stride), np.uint8)
+    prev = np.zeros(stride, np.uint8)
+    row = 0
+    while row < h:
+        f = filters[row]
+        if f == 2:  # Up, for the whole run of Up rows
+            end = row + 1
+            while end < h and filters[end] == 2:
+                end += 1
+            out[row:end] = np.cumsum(lines[row:end], axis=0, dtype=np.uint8) + prev
+            row = end
+        else:
+            if f == 0:  # None
+                out[row] = lines[row]
+            elif f == 1:  # Sub
+                out[row] = np.cumsum(
+                    lines[row].reshape(w, bpp), axis=0, dtype=np.uint8
+                ).reshape(stride)
+            else:  # Average, Paeth
+                out[row] = _unfilter_row(f, lines[row].tolist(), prev.tolist(), bpp)
+            row += 1
+        prev = out[row - 1]
+    return out, None
+
+
+def _unfilter_row(f, line, prev, bpp):
+    """Undo an Average (3) or Paeth (4) filter on one row of ints"""
+    rec = line
+    for i in range(len(rec)):
+        left = rec[i - bpp] if i >= bpp else 0
+        if f == 3:
+            rec[i] = (rec[i] + ((left + prev[i]) // 2)) & 0xFF
+        else:
+            up_left = prev[i - bpp] if i >= bpp else 0
+            rec[i] = (rec[i] + _paeth(left, prev[i], up_left)) & 0xFF
+    return rec
+
+
+def _unfilter_png_pil(raw, w, h, bpp):
+    """Decode predictor data by wrapping it in a PNG for Pillow, or None"""
+    import numpy as np
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    import io, zlib, struct
+
+    def _chunk(typ, payload):
+        return (struct.pack(">I", len(payload)) + typ + payload
+                + struct.pack(">I", zlib.crc32(typ + payload) & 0xFFFFFFFF))
+
+    ctype = {1: 0, 2: 4, 3: 2, 4: 6}[bpp]
+    png = (b"\x89PNG\r\n\x1a\n"
+           + _chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, ctype, 0, 0, 0))
+           + _chunk(b"IDAT", zlib.compress(raw, 1))
+           + _chunk(b"IEND", b""))
+    try:
+        with Image.open(io.BytesIO(png)) as im:
+            data = im.tobytes()
+    except Exception:
+        return None
+    if len(data) != h * w * bpp:
+        return None
+    return np.frombuffer(data, np.uint8).reshape(h, w * bpp)
+
+
 def _undo_png_predictors_rgb8(data: bytes, width: int, height: int) -> bytes:
     """Return raw RGB (no filter bytes). Handles filters 0..4 for 8-bit, 3-channel."""
-    stride = 3 * width
-    out = bytearray(height * stride)
-    src = memoryview(data)
-    pos = 0
-    prev = bytearray(stride)  # prior row
-    for row in range(height):
-        f = src[pos]; pos += 1
-        row_bytes = bytearray(src[pos:pos+stride]); pos += stride
-        if f == 0:  # None
-            rec = row_bytes
-        elif f == 1:  # Sub
-            rec = bytearray(row_bytes)
-            for i in range(stride):
-                left = rec[i-3] if i >= 3 else 0
-                rec[i] = (rec[i] + left) & 0xFF
-        elif f == 2:  # Up
-            rec = bytearray(row_bytes)
-            for i in range(stride):
-                rec[i] = (rec[i] + prev[i]) & 0xFF
-        elif f == 3:  # Average
-            rec = bytearray(row_bytes)
-            for i in range(stride):
-                left = rec[i-3] if i >= 3 else 0
-                up = prev[i]
-                rec[i] = (rec[i] + ((left + up) // 2)) & 0xFF
-        elif f == 4:  # Paeth
-            rec = bytearray(row_bytes)
-            for i in range(stride):
-                left = rec[i-3] if i >= 3 else 0
-                up = prev[i]
-                up_left = prev[i-3] if i >= 3 else 0
-                rec[i] = (rec[i] + _paeth(left, up, up_left)) & 0xFF
-        else:
-            # Unknown filter -> bail
-            return b""
-        out[row*stride:(row+1)*stride] = rec
-        prev = rec
-    return bytes(out)
+    out, _ = _unfilter_png(data, width, height, 3, 10)
+    return b"" if out is None else out.tobytes()
+
+
+def _sampled_rows_nonuniform(raw, w, h, bpp, predictor, nsample=16):
+    """Cheap check that proves an image is not a single color, without decoding.
+
+    In a uniform image, every pixel of a row after the first is identical,
+    and this stays true after any PNG filter (each filter of a uniform row
+    against a uniform or all-zero row above is constant after its first
+    pixel). Looks at up to ``nsample`` evenly spaced rows of the still
+    filtered stream and returns True if any of them breaks the pattern.
+    """
+    stride = bpp * w
+    rowlen = stride + (1 if predictor >= 10 else 0)
+    if w < 2 or len(raw) != rowlen * h:
+        return False  # leave it to the decoder
+    step = max(1, h // nsample)
+    for row in list(range(0, h, step)) + [h - 1]:
+        start = row * rowlen + rowlen - stride + bpp
+        if raw[start:start + stride - bpp] != raw[start:start + bpp] * (w - 1):
+            return True
+    return False
 
 
 def _is_rgb_colorspace(cs):
@@ -938,60 +1048,12 @@ def _decode_image_rows(raw, w, h, bpp, predictor):
     once when the stream is malformed or uses an unsupported filter; the
     generator stops after a single error yield.
     """
-    stride = bpp * w
-
-    if predictor < 10:
-        # No predictor: stream is just stride*h raw sample bytes.
-        if len(raw) != stride * h:
-            yield None, ("data length mismatch (no predictor): got {}, "
-                         "expected {}").format(len(raw), stride * h)
-            return
-        for r in range(h):
-            yield bytes(raw[r * stride:(r + 1) * stride]), None
+    out, err = _unfilter_png(raw, w, h, bpp, predictor)
+    if out is None:
+        yield None, err
         return
-
-    # PNG-style predictor: each row is [filter byte][stride sample bytes].
-    if len(raw) != (1 + stride) * h:
-        yield None, ("predictor data length mismatch: got {}, "
-                     "expected {} for {}x{}").format(
-                         len(raw), (1 + stride) * h, w, h)
-        return
-
-    prev = bytearray(stride)
-    src = memoryview(raw)
-    for row in range(h):
-        base = row * (1 + stride)
-        f = src[base]
-        line = src[base + 1:base + 1 + stride]
-        if f == 0:
-            rec = bytearray(line)
-        elif f == 1:  # Sub
-            rec = bytearray(stride)
-            for i in range(stride):
-                left = rec[i - bpp] if i >= bpp else 0
-                rec[i] = (line[i] + left) & 0xFF
-        elif f == 2:  # Up
-            rec = bytearray(stride)
-            for i in range(stride):
-                rec[i] = (line[i] + prev[i]) & 0xFF
-        elif f == 3:  # Average
-            rec = bytearray(stride)
-            for i in range(stride):
-                left = rec[i - bpp] if i >= bpp else 0
-                up = prev[i]
-                rec[i] = (line[i] + ((left + up) // 2)) & 0xFF
-        elif f == 4:  # Paeth
-            rec = bytearray(stride)
-            for i in range(stride):
-                left = rec[i - bpp] if i >= bpp else 0
-                up = prev[i]
-                up_left = prev[i - bpp] if i >= bpp else 0
-                rec[i] = (line[i] + _paeth(left, up, up_left)) & 0xFF
-        else:
-            yield None, "unknown PNG filter byte {} at row {}".format(f, row)
-            return
-        yield bytes(rec), None
-        prev = rec
+    for row in out:
+        yield row.tobytes(), None
 
 
 def _try_get_uniform_rgb_hex_from_ximage(ximg, name=None) -> Optional[str]:
@@ -1017,8 +1079,10 @@ def _try_get_uniform_rgb_hex_from_ximage(ximg, name=None) -> Optional[str]:
         edge pixels are ignored. An image with no opaque pixels at all is
         rejected (it's invisible).
 
-    Decoding is row-by-row with early exit so large photographic images get
-    rejected in milliseconds instead of being fully decoded.
+    Without an /SMask, a few rows of the still-filtered stream are sampled
+    first (see _sampled_rows_nonuniform), so large photographic images get
+    rejected in microseconds instead of being decoded. The rest are decoded
+    and compared as NumPy arrays.
 
     ``name`` is an optional XObject reference name (e.g. '/Im5') used purely
     for verbose debug logging when DEBUG_PDF is enabled.
@@ -1052,8 +1116,16 @@ def _try_get_uniform_rgb_hex_from_ximage(ximg, name=None) -> Optional[str]:
     dp = ximg.get("/DecodeParms", {})
     predictor = int(dp.get("/Predictor", 0)) if isinstance(dp, dict) else 0
 
-    # Set up the alpha iterator if there's an SMask of matching dimensions.
-    alpha_iter = None
+    import numpy as np
+
+    # Reject most non-uniform images from a few rows before decoding anything.
+    # Transparent pixels can take any color, so this only applies without an SMask.
+    if smask is None and _sampled_rows_nonuniform(raw, w, h, 3, predictor):
+        _debug_print("{}: rejected (non-uniform sampled row)".format(label))
+        return None
+
+    # Decode the alpha channel if there's an SMask of matching dimensions.
+    alpha = None
     if smask is not None:
         try:
             sm = smask.get_object() if hasattr(smask, "get_object") else smask
@@ -1077,107 +1149,67 @@ def _try_get_uniform_rgb_hex_from_ximage(ximg, name=None) -> Optional[str]:
             return None
         sdp = sm.get("/DecodeParms", {})
         spred = int(sdp.get("/Predictor", 0)) if isinstance(sdp, dict) else 0
-        alpha_iter = _decode_image_rows(sraw, w, h, 1, spred)
-
-    rgb_iter = _decode_image_rows(raw, w, h, 3, predictor)
-
-    target = None      # (r, g, b) of the first opaque pixel
-    target_row = None  # cached `bytes(target) * w` for fast row equality
-    n_opaque = 0
-    n_skipped_alpha = 0
-
-    for row_idx in range(h):
-        rgb_row, err = next(rgb_iter)
-        if rgb_row is None:
-            _debug_print("{}: rejected ({})".format(label, err))
-            return None
-
-        if alpha_iter is None:
-            # No SMask -- every pixel must match the target.
-            if target is None:
-                target = (rgb_row[0], rgb_row[1], rgb_row[2])
-                target_row = bytes(target) * w
-                n_opaque += w
-                # The very first row's first pixel is the target. The rest
-                # of the row still needs to match it.
-                if rgb_row != target_row:
-                    _emit_first_deviation(label, row_idx, target, rgb_row, w)
-                    return None
-                continue
-            if rgb_row == target_row:
-                n_opaque += w
-                continue
-            _emit_first_deviation(label, row_idx, target, rgb_row, w)
-            return None
-
-        # SMask path: only count fully-opaque pixels.
-        alpha_row, err = next(alpha_iter)
-        if alpha_row is None:
+        alpha, err = _unfilter_png(sraw, w, h, 1, spred)
+        if alpha is None:
             _debug_print("{}: rejected (SMask: {})".format(label, err))
             return None
 
-        # Fast path: if the entire alpha row is 255, the row reduces to the
-        # plain comparison above.
-        if alpha_row == b"\xff" * w:
-            if target is None:
-                target = (rgb_row[0], rgb_row[1], rgb_row[2])
-                target_row = bytes(target) * w
-            if rgb_row != target_row:
-                _emit_first_deviation(label, row_idx, target, rgb_row, w,
-                                       through_smask=True)
-                return None
-            n_opaque += w
-            continue
+    rgb, err = _unfilter_png(raw, w, h, 3, predictor)
+    if rgb is None:
+        _debug_print("{}: rejected ({})".format(label, err))
+        return None
+    pix = rgb.reshape(h, w, 3)
 
-        # Slow path: walk the row, ignoring pixels whose alpha is not 255.
-        for c in range(w):
-            if alpha_row[c] != 255:
-                n_skipped_alpha += 1
-                continue
-            base = c * 3
-            r, g, b = rgb_row[base], rgb_row[base + 1], rgb_row[base + 2]
-            if target is None:
-                target = (r, g, b)
-                target_row = bytes(target) * w
-                n_opaque += 1
-                continue
-            if r != target[0] or g != target[1] or b != target[2]:
-                _debug_print(
-                    "{}: rejected (non-uniform opaque pixel at row {}, col {}; "
-                    "target {:02x}{:02x}{:02x}, got "
-                    "{:02x}{:02x}{:02x})".format(
-                        label, row_idx, c,
-                        target[0], target[1], target[2], r, g, b))
-                return None
-            n_opaque += 1
-
-    if target is None:
-        # Image is non-empty but every pixel had alpha != 255 -- effectively
-        # invisible. Don't claim it as a marker.
-        _debug_print("{}: rejected (no fully-opaque pixels: image is invisible "
-                     "via SMask)".format(label))
+    if alpha is None:
+        # No SMask -- every pixel must match the first one.
+        opaque = None
+        n_opaque = w * h
+        first = 0
+    else:
+        # SMask: only fully-opaque pixels count.
+        opaque = alpha.reshape(h, w) == 255
+        n_opaque = int(np.count_nonzero(opaque))
+        if n_opaque == 0:
+            # Image is non-empty but every pixel had alpha != 255 -- effectively
+            # invisible. Don't claim it as a marker.
+            _debug_print("{}: rejected (no fully-opaque pixels: image is invisible "
+                         "via SMask)".format(label))
+            return None
+        first = int(np.argmax(opaque))
+    target = tuple(int(v) for v in pix.reshape(-1, 3)[first])
+
+    bad = np.any(pix != target, axis=2)
+    if opaque is not None:
+        bad &= opaque
+    if bad.any():
+        row_idx = int(np.argmax(bad.any(axis=1)))
+        _emit_first_deviation(label, row_idx, target, rgb[row_idx].tobytes(), w,
+                              through_smask=opaque is not None,
+                              opaque=None if opaque is None else opaque[row_idx])
         return None
 
     result = "{:02x}{:02x}{:02x}".format(target[0], target[1], target[2])
-    if alpha_iter is not None:
+    if alpha is not None:
         _debug_print(
             "{}: uniform color {} at {}x{} ({} opaque px, {} alpha-blended "
             "edge px ignored)".format(
-                label, result, w, h, n_opaque, n_skipped_alpha))
+                label, result, w, h, n_opaque, w * h - n_opaque))
     else:
         _debug_print("{}: uniform color {} at {}x{}".format(label, result, w, h))
     return result
 
 
-def _emit_first_deviation(label, row_idx, target, rgb_row, w, through_smask=False):
+def _emit_first_deviation(label, row_idx, target, rgb_row, w, through_smask=False,
+                          opaque=None):
     """Find the first pixel in ``rgb_row`` that doesn't match ``target`` and
-    emit a debug rejection line that points at it. Used by the no-SMask fast
-    path and the all-alpha-255 fast path so the user gets the same kind of
-    diagnostic they'd get from the per-pixel slow path."""
+    emit a debug rejection line that points at it. If ``opaque`` is given,
+    pixels where it is False are skipped."""
     if not DEBUG_PDF:
         return
     tr, tg, tb = target
     for i in range(0, 3 * w, 3):
+        if opaque is not None and not opaque[i // 3]:
+            continue
         if rgb_row[i] != tr or rgb_row[i + 1] != tg or rgb_row[i + 2] != tb:
             kind = "non-uniform opaque pixel" if through_smask else "non-uniform pixel"
             _debug_print(
@@ -1605,7 +1637,7 @@ def _make_raster_marker_pdf(raster_path: str, out_pdf_path: str) -> None:
 
     - JPEG: raw bytes go in under /DCTDecode (pixel-perfect, byte-identical).
     - PNG (non-interlaced 8-bit, common subset): decoded with this module's
-      pure-Python helpers, re-encoded with /FlateDecode (pixel-perfect;
+      NumPy helpers, re-encoded with /FlateDecode (pixel-perfect;
       alpha/palette/grayscale variants split out into an /SMask where needed).
     - Anything else (Adam7-interlaced PNG, 1/2/4/16-bit PNG, TIFF, BMP,
       GIF, ...): falls back to Pillow.
@@ -1686,45 +1718,41 @@ def _make_raster_marker_pdf(raster_path: str, out_pdf_path: str) -> None:
                 break
         bpp_map = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
         bpp = bpp_map.get(color_type)
-        # Only the common subset goes through pure-Python. Adam7-interlaced
+        # Only the common subset is decoded here. Adam7-interlaced
         # streams pack each of 7 sub-images with its own filter bytes, so the
         # raw stream isn't (1+stride)*h; 1/2/4/16-bit depths use a different
         # sample layout. Both are handled fine by Pillow below.
         if (w is not None and bit_depth == 8
                 and interlace == 0 and bpp is not None):
+            import numpy as np
             raw = zlib.decompress(bytes(idat))
-            pixels = bytearray()
-            for row_bytes, err in _decode_image_rows(raw, w, h, bpp, predictor=10):
-                if err is not None:
-                    raise ValueError(f"PNG decode error in {raster_path}: {err}")
-                pixels.extend(row_bytes)
+            pixels, err = _unfilter_png(raw, w, h, bpp, 10)
+            if err is not None:
+                raise ValueError(f"PNG decode error in {raster_path}: {err}")
+            pixels = pixels.reshape(h * w, bpp)
             if color_type == 2:
-                colorspace = "/DeviceRGB"; sample_bytes = bytes(pixels)
+                colorspace = "/DeviceRGB"; sample_bytes = pixels.tobytes()
             elif color_type == 0:
-                colorspace = "/DeviceGray"; sample_bytes = bytes(pixels)
+                colorspace = "/DeviceGray"; sample_bytes = pixels.tobytes()
             elif color_type == 3:
                 colorspace = "/DeviceRGB"
-                out = bytearray(w * h * 3)
-                for k, idx in enumerate(pixels):
-                    out[k*3:k*3+3] = palette[idx*3:idx*3+3]
-                sample_bytes = bytes(out)
+                idx = pixels[:, 0]
+                pal = np.zeros((256, 3), np.uint8)
+                npal = min(len(palette) // 3, 256)
+                pal[:npal] = np.frombuffer(palette[:npal * 3], np.uint8).reshape(npal, 3)
+                sample_bytes = pal[idx].tobytes()
                 if trns is not None:
-                    smask_bytes = bytes(trns[idx] if idx < len(trns) else 255
-                                        for idx in pixels)
+                    alpha = np.full(256, 255, np.uint8)
+                    alpha[:min(len(trns), 256)] = np.frombuffer(trns[:256], np.uint8)
+                    smask_bytes = alpha[idx].tobytes()
             elif color_type == 4:
                 colorspace = "/DeviceGray"
-                gray  = bytearray(w * h); alpha = bytearray(w * h)
-                for k in range(w * h):
-                    gray[k]  = pixels[2*k]
-                    alpha[k] = pixels[2*k+1]
-                sample_bytes = bytes(gray); smask_bytes = bytes(alpha)
+                sample_bytes = pixels[:, 0].tobytes()
+                smask_bytes = pixels[:, 1].tobytes()
             else:  # 6: RGBA
                 colorspace = "/DeviceRGB"
-                rgb   = bytearray(w * h * 3); alpha = bytearray(w * h)
-                for k in range(w * h):
-                    rgb[k*3:k*3+3] = pixels[4*k:4*k+3]
-                    alpha[k]       = pixels[4*k+3]
-                sample_bytes = bytes(rgb); smask_bytes = bytes(alpha)
+                sample_bytes = pixels[:, :3].tobytes()
+                smask_bytes = pixels[:, 3].tobytes()
             img._data = zlib.compress(sample_bytes, level=9)
             img[NameObject("/Filter")] = NameObject("/FlateDecode")
             img[NameObject("/Width")]  = NumberObject(w)
@@ -1787,6 +1815,77 @@ def _make_raster_marker_pdf(raster_path: str, out_pdf_path: str) -> None:
     with open(out_pdf_path, "wb") as f:
         writer.write(f)
 
+def _marker_cache_key(src: str, exporter: Exporter) -> Optional[str]:
+    """Key identifying a marker PDF by its source bytes, the export options,
+    and the Inkscape binary. Returns None if caching does not apply.
+
+    The crop is not part of the key: it is applied when the PDF is inlined,
+    so one cached PDF serves every crop of the same figure. SVGs that link
+    external files are not cached, since their output depends on more than
+    the SVG itself.
+    """
+    import hashlib, json
+    import dhelpers as dh
+    if (not USE_MARKER_CACHE or getattr(exporter, "testmode", False)
+            or getattr(exporter, "debug", False) or DEBUG_PDF):
+        return None
+    try:
+        with open(src, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    keyd = {"source": hashlib.sha256(data).hexdigest()}
+    if src.lower().endswith(".svg"):
+        if any(not h.startswith(b"data:") for h in Exporter.HREF_RE.findall(data)):
+            return None
+        bfn = _inkscape_bin()
+        keyd["inkscape"] = [
+            bfn,
+            os.path.getmtime(bfn) if os.path.exists(bfn) else None,
+            dh.inkex.installed_ivp,
+        ]
+        keyd["options"] = {k: getattr(exporter, k, None)
+                           for k in Exporter.CACHE_OPTIONS}
+        if getattr(exporter, "darkmode", False):
+            keyd["dark_mode_colors"] = sorted(dh.si_config.dark_mode_colors.items())
+    else:
+        keyd["raster"] = True
+    keyv = json.dumps(keyd, sort_keys=True, default=str)
+    return hashlib.sha256(keyv.encode("utf-8")).hexdigest()
+
+
+def _restore_marker_pdf(ckey: str, pdf_path: str) -> bool:
+    """Copy a cached marker PDF to pdf_path. Returns True on success."""
+    import shutil
+    import dhelpers as dh
+    entry = os.path.join(dh.cache_dir("markers"), ckey + ".pdf")
+    try:
+        shutil.copyfile(entry, pdf_path)
+        os.utime(entry)
+    except OSError:
+        return False
+    return True
+
+
+def _store_marker_pdf(ckey: str, pdf_path: str) -> None:
+    """Save an exported marker PDF in the cache."""
+    import shutil
+    import dhelpers as dh
+    cdir = dh.cache_dir("markers")
+    tmp = os.path.join(cdir, "{}.{}.{}.tmp".format(
+        ckey, os.getpid(), threading.get_ident()))
+    try:
+        shutil.copyfile(pdf_path, tmp)
+        os.replace(tmp, os.path.join(cdir, ckey + ".pdf"))
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    dh.prune_cache(cdir, MAX_CACHED_MARKERS)
+
+
 def replace_color_markers_with_svgs(input_pdf_path: str,
                                     color_to_svg: Dict[str, tuple],
                                     output_pdf_path: Optional[str],
@@ -1828,28 +1927,38 @@ def replace_color_markers_with_svgs(input_pdf_path: str,
         pdf_path = os.path.splitext(src)[0] + ".pdf"
         cached = (os.path.exists(pdf_path)
                   and os.path.getmtime(pdf_path) >= os.path.getmtime(src))
-        if not cached:
+        ckey = None if cached else _marker_cache_key(src, exporter)
+        if cached:
+            _debug_print("using cached PDF for source: {}".format(src))
+        elif ckey is not None and _restore_marker_pdf(ckey, pdf_path):
+            _debug_print("restored PDF from cache for source: {}".format(src))
+        else:
             if src.lower().endswith(".svg"):
                 _debug_print("exporting SVG -> PDF: {}".format(src))
                 pdf_path = export_svg_to_pdf(src, exporter)
             else:
                 _debug_print("embedding raster -> PDF: {}".format(src))
                 _make_raster_marker_pdf(src, pdf_path)
-        else:
-            _debug_print("using cached PDF for source: {}".format(src))
+            if ckey is not None and os.path.exists(pdf_path):
+                _store_marker_pdf(ckey, pdf_path)
         svg_to_pdf_cache[src] = pdf_path
         _debug_copy(pdf_path, label="marker_pdf")
-    import threading
-    threads = []
+    import concurrent.futures
     # Same SVG referenced cropped + uncropped (or with two crops) appears
     # under multiple colors but only needs one Inkscape conversion.
     unique_svgs = {svg for (svg, _crop) in color_to_svg.values()}
-    for svg in unique_svgs:
-        t = threading.Thread(target=_export_one, args=(svg,), daemon=True)
-        t.start()
-        threads.append(t)
-    for t in threads:
-        t.join()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=MAX_MARKER_WORKERS) as pool:
+        futs = {export_stats.submit(pool, _export_one, svg): svg
+                for svg in unique_svgs}
+    for fut, svg in futs.items():
+        err = fut.exception()
+        if err is not None and not isinstance(err, SystemExit):
+            # Report as an uncaught thread exception would; the color then
+            # passes through unchanged
+            import traceback
+            traceback.print_exception(type(err), err, err.__traceback__)
+            _debug_print("marker export failed for {}: {!r}".format(svg, err))
 
     if hasattr(exporter, "aeThread") and exporter.aeThread.stopped is True:
         exporter.clear_temp()
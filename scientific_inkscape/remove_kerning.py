@@ -376,9 +376,6 @@ def Remove_Manual_Kerning(els, mergesupersub):
     return els
 
 
-import numpy as np
-
-
 def External_Merges(els, mergenearby, mergesupersub):
     # Generate list of merges
     chks = []
@@ -407,24 +404,19 @@ def External_Merges(els, mergenearby, mergesupersub):
         )
         w.mw = []
 
-    # Vectorized angle / bbox calculations
-    angles = np.array([[w.angle for w in chks]])
-    sameangle = abs(angles - angles.T) < 0.001
-
+    # Sparse candidate pairs from a spatial index, then same angle and
+    # off-diagonal only
     bb1s = [w.bb_big for w in chks]
     bb2s = pbbs
-    intersects = dh.bb_intersects(bb1s, bb2s)
-
-    # reshape(-1,1) is a transpose
-    potentials = np.logical_and(sameangle, intersects)
-    potentials = np.logical_and(
-        potentials, np.identity(len(chks)) == 0
-    )  # off-diagonal only
-    goodl = np.argwhere(potentials)
-
-    for ii in range(goodl.shape[0]):
-        w = chks[goodl[ii, 0]]
-        w2 = chks[goodl[ii, 1]]
+    goodl = [
+        (i1, i2)
+        for i1, i2 in dh.bb_intersect_pairs(bb1s, bb2s)
+        if i1 != i2 and abs(chks[i1].angle - chks[i2].angle) < 0.001
+    ]
+
+    for i1, i2 in goodl:
+        w = chks[i1]
+        w2 = chks[i2]
         trl_spcs, ldg_spcs = trailing_leading(w.txt, w2.txt)
 
         dx = w.spw * (NUM_SPACES - trl_spcs - ldg_spcs)
@@ -0,0 +1,242 @@
+# coding=utf-8
+
+# Unit tests of Autoexporter helpers. Inkscape calls are not made, but
+# importing dhelpers still requires an Inkscape installation to be found.
+
+import os, sys, io, random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh
+import inkex
+import autoexporter
+import export_stats
+from autoexporter import Exporter
+
+
+def load_svg(svgstr):
+    return inkex.load_svg(io.BytesIO(svgstr.encode("utf-8"))).getroot()
+
+def new_exporter(tmp_path, **kwargs):
+    opts = dict(formats=["pdf"], dpi=600, prints=None, testmode=False, debug=False,
+                bfn=sys.executable)
+    opts.update(kwargs)
+    ret = Exporter(os.path.join(str(tmp_path), "doc.svg"), SimpleNamespace(**opts))
+    ret.tempdir = str(tmp_path)
+    ret.temphead = "ae"
+    return ret
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cdir = tmp_path / "cache"
+    def cache_dir(name):
+        os.makedirs(str(cdir / name), exist_ok=True)
+        return str(cdir / name)
+    monkeypatch.setattr(dh, "cache_dir", cache_dir)
+    return cache_dir
+
+
+# Export cache
+def export_setup(tmp_path, **kwargs):
+    src = tmp_path / "doc.svg"
+    if not src.exists():
+        src.write_text('<svg xmlns="http://www.w3.org/2000/svg"><image href="img.png"/></svg>')
+        (tmp_path / "img.png").write_bytes(b"png")
+    outdir = tmp_path / "out"
+    outdir.mkdir(exist_ok=True)
+    exp = new_exporter(tmp_path, outtemplate=str(outdir / "doc.svg"), **kwargs)
+    return exp, outdir
+
+def test_export_cache_key(tmp_path):
+    exp, _ = export_setup(tmp_path)
+    key = exp.cache_key()
+    assert key is not None and export_setup(tmp_path)[0].cache_key() == key
+    assert export_setup(tmp_path, dpi=300)[0].cache_key() != key
+    assert export_setup(tmp_path, testmode=True)[0].cache_key() is None
+    (tmp_path / "img.png").write_bytes(b"changed png")  # linked file
+    assert export_setup(tmp_path)[0].cache_key() != key
+    key = export_setup(tmp_path)[0].cache_key()
+    (tmp_path / "doc.svg").write_text('<svg xmlns="http://www.w3.org/2000/svg"/>')
+    assert export_setup(tmp_path)[0].cache_key() != key
+
+def test_export_cache_restore(tmp_path, cache_dir):
+    exp, outdir = export_setup(tmp_path)
+    outs = [str(outdir / "doc_page_1.pdf"), str(outdir / "doc_page_2.pdf")]
+    for i, fname in enumerate(outs):
+        open(fname, "w").write("page {0}".format(i + 1))
+    exp.exported_files = list(outs)
+    exp.store_in_cache("key")
+
+    # The document now has one page, with stale pages left from before
+    for fname in outs:
+        open(fname, "w").write("old")
+    open(str(outdir / "doc.pdf"), "w").write("old")
+    open(str(outdir / "doc_page_3.pdf"), "w").write("old")
+    open(str(outdir / "other.pdf"), "w").write("other")
+    exp, _ = export_setup(tmp_path)
+    assert exp.restore_from_cache("key")
+    assert exp.exported_files == outs
+    assert sorted(os.listdir(str(outdir))) == ["doc_page_1.pdf", "doc_page_2.pdf", "other.pdf"]
+    assert open(outs[1]).read() == "page 2"
+    assert not export_setup(tmp_path)[0].restore_from_cache("missing")
+
+
+# Rasterization cache
+RASTER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100" viewBox="0 0 100 100">'
+    '<defs><linearGradient id="grad"><stop offset="0" style="stop-color:{stop}"/></linearGradient></defs>'
+    '<rect id="below" x="0" y="0" width="50" height="50" style="fill:{below}"/>'
+    '<rect id="el" x="10" y="10" width="20" height="20" style="fill:url(#grad)" transform="{tr}"/>'
+    '<rect id="above" x="15" y="15" width="20" height="20"/>'
+    '<rect id="other" x="80" y="80" width="5" height="5" style="fill:{other}"/>'
+    '</svg>'
+)
+
+def raster_key(tmp_path, **kwargs):
+    fmt = dict(stop="#000000", below="#ff0000", tr="", other="#00ff00")
+    fmt.update(kwargs)
+    svg = load_svg(RASTER_SVG.format(**fmt))
+    exp = new_exporter(tmp_path)
+    common = exp.raster_key_common(svg)
+    els = {k: svg.getElementById(k) for k in ("el", "above", "below")}
+    return Exporter.raster_key(common, els["el"], [els["above"]], [els["below"]])
+
+def test_raster_key(tmp_path):
+    key = raster_key(tmp_path)
+    assert raster_key(tmp_path) == key
+    assert raster_key(tmp_path, other="#0000ff") == key  # does not overlap
+    assert raster_key(tmp_path, stop="#ffffff") != key  # referenced def
+    assert raster_key(tmp_path, below="#ffff00") != key  # drawn below
+    assert raster_key(tmp_path, tr="translate(1,0)") != key
+    svg = load_svg(RASTER_SVG.format(stop="#000000", below="#ff0000", tr="", other="#00ff00"))
+    assert new_exporter(tmp_path, dpi=300).raster_key_common(svg) != new_exporter(tmp_path).raster_key_common(svg)
+    assert new_exporter(tmp_path, testmode=True).raster_key_common(svg) is None
+
+def test_raster_store_restore(tmp_path, cache_dir):
+    exp = new_exporter(tmp_path)
+    el = SimpleNamespace(get_id=lambda: "el")
+    actt = SimpleNamespace(els=[el], fname="t.png")
+    acto = SimpleNamespace(els=[el], fname="o.png")
+    assert not exp.restore_raster("key", actt, acto, dict())
+
+    exp.store_raster("key", actt, acto, {"el": [1, 2, 3, 4]})  # not rendered
+    assert not os.path.exists(cache_dir("rasters") + "/key")
+    for fname, data in (("t.png", b"t"), ("o.png", b"o")):
+        (tmp_path / fname).write_bytes(data)
+    exp.store_raster("key", actt, acto, dict())  # no bounding box
+    assert not os.path.exists(cache_dir("rasters") + "/key")
+    exp.store_raster("key", actt, acto, {"el": [1, 2, 3, 4]})
+
+    os.remove(str(tmp_path / "t.png"))
+    os.remove(str(tmp_path / "o.png"))
+    bbs = dict()
+    assert exp.restore_raster("key", actt, acto, bbs)
+    assert bbs == {"el": [1, 2, 3, 4]}
+    assert (tmp_path / "t.png").read_bytes() == b"t" and (tmp_path / "o.png").read_bytes() == b"o"
+
+
+# Page splitting
+PAGES_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="300" height="100" viewBox="0 0 300 100">'
+    '<defs><clipPath id="clip"><rect id="cliprect" width="10" height="10"/></clipPath></defs>'
+    '<g id="g1"><rect id="a" x="10" y="10" width="10" height="10"/>'
+    '<g id="g2"><rect id="b" x="110" y="10" width="10" height="10"/>'
+    '<rect id="c" x="95" y="10" width="10" height="10"/></g></g>'
+    '<rect id="d" x="210" y="10" width="10" height="10" clip-path="url(#clip)"/>'
+    '<text id="t" x="215" y="50">label</text>'
+    '</svg>'
+)
+PAGES_BBS = {
+    "g1": [10, 10, 110, 10], "a": [10, 10, 10, 10], "g2": [95, 10, 25, 10],
+    "b": [110, 10, 10, 10], "c": [95, 10, 10, 10], "d": [210, 10, 10, 10],
+    "t": [500, 500, 1, 1],
+}
+PAGES_PGBBS = [dh.bbox([0, 0, 100, 100]), dh.bbox([100, 0, 100, 100]), dh.bbox([200, 0, 100, 100])]
+
+def test_partition_pages():
+    dlbl = {"t": "d"}  # t labels d, so goes with it
+    onpage = Exporter.partition_pages(PAGES_BBS, PAGES_PGBBS, dlbl)
+    for k, bbx in PAGES_BBS.items():
+        bbx = PAGES_BBS[dlbl.get(k, k)]
+        ref = {i for i, pg in enumerate(PAGES_PGBBS) if dh.bbox(bbx).intersect(pg)}
+        assert onpage[k] == ref
+    assert onpage["c"] == {0, 1} and onpage["t"] == {2}
+    assert Exporter.partition_pages({"n": None}, PAGES_PGBBS, dict()) == {"n": set()}
+
+def test_detach_offpage():
+    svg = load_svg(PAGES_SVG)
+    svg.getElementById("a")  # assigns ids to the root and defs
+    original = svg.tostring()
+    dlbl = {"t": "d"}
+    onpage = Exporter.partition_pages(PAGES_BBS, PAGES_PGBBS, dlbl)
+    pages = []
+    for ii in Exporter.detach_offpage(svg, PAGES_BBS, PAGES_PGBBS, dlbl):
+        present = {el.get("id") for el in svg.iter("*")}
+        # the same as detaching every off-page element with no off-page ancestor
+        ref = load_svg(PAGES_SVG)
+        offpage = {k for k in PAGES_BBS if ii not in onpage[k]}
+        for k in offpage:
+            el = ref.getElementById(k)
+            if not any(anc.get("id") in offpage for anc in el.iterancestors()):
+                el.getparent().remove(el)
+        assert present == {el.get("id") for el in ref.iter("*")}
+        assert all(svg.getElementById(k) is not None for k in present)
+        assert svg.getElementById("cliprect") is not None
+        pages.append(present & set(PAGES_BBS))
+    assert pages == [{"g1", "a", "g2", "c"}, {"g1", "g2", "b", "c"}, {"d", "t"}]
+    # reattached in place, with caches updated
+    assert svg.tostring() == original
+    assert all(svg.getElementById(k).croot is svg for k in PAGES_BBS)
+    assert svg.getElementById("d").get("clip-path") == "url(#clip)"
+
+
+# In-memory handoff between stages
+def test_document_handoff(tmp_path, monkeypatch):
+    exp = new_exporter(tmp_path)
+    exp.live_docs = dict()
+    exp.stats = export_stats.ExportStats("doc.svg")
+    svg = load_svg('<svg xmlns="http://www.w3.org/2000/svg"><rect id="r" width="1" height="2"/></svg>')
+    fname = str(tmp_path / "stage.svg")
+    exp.write_svg(svg, fname)
+    assert not os.path.exists(fname)  # not written until the binary needs it
+
+    copy1 = exp.read_svg(fname)
+    assert copy1 is not svg and copy1.tostring() == svg.tostring()
+    copy1.getElementById("r").set("width", "5")  # later stages edit copies
+    assert exp.read_svg(fname).getElementById("r").get("width") == "1"
+    assert exp.stats.counts["memory_handoffs"] == 2 and exp.stats.counts["files_read"] == 0
+
+    assert exp.materialize(fname) == fname
+    assert load_svg(open(fname).read()).getElementById("r").get("width") == "1"
+    os.remove(fname)
+    exp.materialize(fname)  # only written once
+    assert not os.path.exists(fname)
+    assert exp.stats.counts["files_written"] == 1
+
+    # Outside of a run, or with the pipeline off, documents go to disk
+    for exp2 in (new_exporter(tmp_path), None):
+        if exp2 is None:
+            monkeypatch.setattr(autoexporter, "PIPELINE", False)
+            exp2 = new_exporter(tmp_path)
+            exp2.live_docs = dict()
+        exp2.write_svg(svg, fname)
+        assert os.path.exists(fname) and not exp2.__dict__.get("live_docs")
+        assert exp2.read_svg(fname).getElementById("r") is not None
+        os.remove(fname)
+
+
+# Dark-mode color inversion
+def test_invert_rgb255_lab_d50_array():
+    rng = random.Random(0)
+    rgbs = [(v, v, v) for v in range(256)]
+    rgbs += [tuple(rng.randrange(256) for _ in range(3)) for _ in range(2000)]
+    rgbs += [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+    inv = Exporter.invert_rgb255_lab_d50_array(rgbs)
+    assert np.shape(inv) == (len(rgbs), 3)
+    for rgb, irgb in zip(rgbs, inv):
+        assert tuple(int(v) for v in irgb) == Exporter.invert_rgb255_lab_d50(*rgb)
@@ -0,0 +1,103 @@
+# coding=utf-8
+
+# Unit tests of the headless batch export entry point.
+
+import os, sys, json
+import concurrent.futures
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh  # sets up inkex
+import autoexporter_batch as ab
+
+
+def test_collect_files(tmp_path):
+    names = ["a.svg", "B.SVG", "a_plain.svg", "a_portable (2).svg",
+             "a.2025_01_02_03_04_05.123.svg", "notes.txt"]
+    (tmp_path / "sub").mkdir()
+    for n in names:
+        (tmp_path / n).write_text("")
+    (tmp_path / "sub" / "c.svg").write_text("")
+    got = ab.collect_files([str(tmp_path), str(tmp_path / "sub" / "c.svg"),
+                            str(tmp_path / "missing.svg")])
+    root = str(tmp_path)
+    assert sorted(got) == sorted([
+        (os.path.join(root, "B.SVG"), root),
+        (os.path.join(root, "a.svg"), root),
+        (os.path.join(root, "sub", "c.svg"), root),
+        (os.path.join(root, "sub", "c.svg"), os.path.join(root, "sub")),
+    ])
+
+
+def test_parse_options():
+    bopts, opts = ab.parse_options(
+        ["figs", "--usepng=true", "--usepsvg=true", "--dpi=300",
+         "--jobs=2", "--inkscape=/opt/inkscape"]
+    )
+    assert bopts.paths == ["figs"] and bopts.jobs == 2 and not bopts.verbose
+    assert opts.formats == ["png", "psvg"]
+    assert opts.dpi == 300.0 and opts.bfn == "/opt/inkscape"
+    assert opts.exportnow is False and opts.guitype == "terminal"
+    assert not hasattr(opts, "output")
+
+    _, opts = ab.parse_options(["figs"])
+    assert opts.formats == ["pdf"]  # default when nothing is selected
+
+    try:
+        ab.parse_options(["figs", "--nosuchoption=1"])
+    except SystemExit:
+        pass
+    else:
+        assert False, "unknown export option accepted"
+
+
+def test_outtemplate(tmp_path):
+    root = str(tmp_path / "in")
+    fname = os.path.join(root, "sub", "f.svg")
+    assert ab.outtemplate(fname, root, None) == fname
+    out = ab.outtemplate(fname, root, str(tmp_path / "out"))
+    assert out == str(tmp_path / "out" / "sub" / "f.svg")
+    assert os.path.isdir(os.path.dirname(out))
+
+
+class FakeExporter:
+    def __init__(self, fname, opts):
+        self.fname = fname
+
+    def export_all(self):
+        if "bad" in self.fname:
+            raise ValueError("cannot export")
+        self.exported_files = [self.fname[:-4] + ".pdf"]
+
+
+def test_export_one(monkeypatch, tmp_path):
+    monkeypatch.setattr(ab, "Exporter", FakeExporter)
+    _, opts = ab.parse_options(["figs"])
+    res = ab.export_one(str(tmp_path / "f.svg"), str(tmp_path), opts, False)
+    assert res["status"] == "ok" and res["error"] is None
+    assert res["outputs"] == [str(tmp_path / "f.pdf")]
+    assert opts.outtemplate == str(tmp_path / "f.svg")
+
+    res = ab.export_one(str(tmp_path / "bad.svg"), str(tmp_path), opts, False)
+    assert res["status"] == "error" and res["outputs"] == []
+    assert "cannot export" in res["error"]
+
+
+def test_main_summary(monkeypatch, tmp_path):
+    for n in ["a.svg", "bad.svg"]:
+        (tmp_path / n).write_text("")
+    # Run in threads so the fake Exporter is used
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor",
+                        concurrent.futures.ThreadPoolExecutor)
+    monkeypatch.setattr(ab, "init_worker", lambda: None)
+    monkeypatch.setattr(ab, "Exporter", FakeExporter)
+    summ = tmp_path / "summary.json"
+    ret = ab.main([str(tmp_path), "--jobs=2", "--summary=" + str(summ)])
+    assert ret == 1
+    data = json.loads(summ.read_text())
+    assert data["ok"] == 1 and data["failed"] == 1 and data["jobs"] == 2
+    assert [os.path.basename(r["file"]) for r in data["files"]] == ["a.svg", "bad.svg"]
+    assert [r["status"] for r in data["files"]] == ["ok", "error"]
+
+    os.remove(str(tmp_path / "bad.svg"))
+    assert ab.main([str(tmp_path), "--summary=" + str(summ)]) == 0
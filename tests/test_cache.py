@@ -0,0 +1,112 @@
+# coding=utf-8
+
+# Unit tests of the cached element properties used by dhelpers.
+
+import os, sys, io
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh
+import inkex
+
+
+def load_svg(svgstr):
+    return inkex.load_svg(io.BytesIO(svgstr.encode("utf-8"))).getroot()
+
+SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100">'
+    '<g id="g"><rect id="r1" width="5" height="5"/><rect id="r2" width="5" height="5"/></g>'
+    '<rect id="r3" width="5" height="5" style="stroke:#000000"/>'
+    '</svg>'
+)
+
+def test_elcache_style_changes():
+    svg = load_svg(SVG)
+    g, r1, r2, r3 = (svg.getElementById(i) for i in ("g", "r1", "r2", "r3"))
+    assert all(dh.isdrawn(el) for el in (r1, r2, r3))
+    cache = svg.elcache
+    assert len(cache["isdrawn"]) >= 3 and len(cache["hasbbox"]) >= 3
+
+    # Styles that do not affect display leave the caches alone
+    nhas = len(cache["hasbbox"])
+    r3.cstyle["stroke-width"] = "5"
+    g.cstyle["font-size"] = "20px"
+    assert all(el in cache["isdrawn"] for el in (r1, r2, r3))
+    assert len(cache["hasbbox"]) == nhas
+
+    # Display only invalidates the subtree whose display changed
+    g.cstyle["display"] = "none"
+    assert r1 not in cache["isdrawn"] and r2 not in cache["isdrawn"]
+    assert r3 in cache["isdrawn"] and len(cache["hasbbox"]) == nhas
+    assert not dh.isdrawn(r1) and not dh.isdrawn(r2) and dh.isdrawn(r3)
+    g.cstyle["display"] = "inline"
+    assert dh.isdrawn(r1)
+    g.cstyle = "display:none"
+    assert not dh.isdrawn(r2)
+
+def test_elcache_cap(monkeypatch):
+    monkeypatch.setattr(dh, "MAX_ELCACHE", 5)
+    monkeypatch.setattr(dh, "_elcache_adds", 0)
+    svg1, svg2 = load_svg(SVG), load_svg(SVG)
+    dh.hasbbox(svg1.getElementById("r1"))  # 3 entries
+    dh.hasbbox(svg2.getElementById("r3"))  # 2 entries
+    assert len(svg1.elcache["hasbbox"]) == 3 and len(svg2.elcache["hasbbox"]) == 2
+    # The cap is shared by both documents
+    dh.hasbbox(svg2.getElementById("r2"))
+    assert len(svg1.elcache["hasbbox"]) == 0
+    assert set(svg2.elcache["hasbbox"]) == {svg2.getElementById("g"), svg2.getElementById("r2")}
+
+BOXSVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="100" height="100">'
+    '<g id="g"><rect id="r1" width="5" height="5" style="fill:#ff0000;stroke:#000000;stroke-width:1"/>'
+    '<rect id="r2" x="20" width="5" height="5"/></g>'
+    '<use id="u" xlink:href="#r1" x="50"/>'
+    '<rect id="r3" y="20" width="5" height="5"/>'
+    '</svg>'
+)
+
+def test_cbbox_dependencies():
+    svg = load_svg(BOXSVG)
+    g, r1, r2, u, r3 = (svg.getElementById(i) for i in ("g", "r1", "r2", "u", "r3"))
+    els = (svg, g, r1, r2, u, r3)
+    def cached():
+        for el in els:
+            el.bounding_box2()
+            el.bounding_box2(dotransform=False)
+    def has(*els):
+        return all(el.__dict__.get("_cbbox") for el in els)
+    def hasnt(*els):
+        return not any(el.__dict__.get("_cbbox") for el in els)
+
+    # Fill does not change boxes
+    cached()
+    r1.cstyle["fill"] = "#0000ff"
+    assert has(*els)
+
+    # Stroke width changes the element, its ancestors and its clones
+    r1.cstyle["stroke-width"] = "3"
+    assert hasnt(r1, g, svg, u) and has(r2, r3)
+    assert r1.bounding_box2().sbb == [-1.5, -1.5, 8, 8]
+
+    # A transform keeps the element's own boxes
+    cached()
+    r1.ctransform = inkex.Transform("translate(10,0)")
+    assert list(r1._cbbox) == [(False, True, False, False, True)]
+    assert hasnt(g, svg, u) and has(r2, r3)
+    assert r1.bounding_box2().sbb == [8.5, -1.5, 8, 8]
+
+    # Path edits
+    cached()
+    r2.set("width", "10")
+    r2.cpath = None
+    assert hasnt(r2, g, svg) and has(r1, u, r3)
+    assert g.bounding_box2().sbb == [8.5, -1.5, 21.5, 8]
+
+    # Moves change the moved element and its old and new ancestors, and
+    # deletions change the ancestors
+    cached()
+    g.append(r3)
+    assert hasnt(r3, g, svg) and has(r1, r2, u)
+    cached()
+    r2.delete()
+    assert hasnt(g, svg) and has(r1, u, r3)
@@ -0,0 +1,107 @@
+# coding=utf-8
+
+# Unit tests of dhelpers' bounding box functions.
+
+import os, sys, io, math, random
+
+import numpy as np
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh
+import inkex
+from inkex.text.utils import bbox
+
+
+# Bounding box intersections
+def random_bbs(n, seed):
+    rng = random.Random(seed)
+    bbs = []
+    for _ in range(n):
+        if rng.random() < 0.05:
+            bbs.append(bbox(None))
+            continue
+        x, y = rng.uniform(-500, 500), rng.uniform(-500, 500)
+        w = rng.choice([0, rng.uniform(0, 10), rng.uniform(0, 100), rng.uniform(0, 1000)])
+        h = rng.choice([0, rng.uniform(0, 10), rng.uniform(0, 100), rng.uniform(0, 1000)])
+        bbs.append(bbox([x, y, w, h]))
+    return bbs
+
+def test_bb_intersect_pairs():
+    for seed in range(5):
+        bbs = random_bbs(300, seed)
+        bb2s = random_bbs(200, seed + 100)
+        ref = [tuple(int(v) for v in ij) for ij in np.argwhere(dh.bb_intersects(bbs, bb2s))]
+        assert dh.bb_intersect_pairs(bbs, bb2s) == ref
+        ref = [tuple(int(v) for v in ij) for ij in np.argwhere(dh.bb_intersects(bbs))]
+        assert dh.bb_intersect_pairs(bbs) == ref
+
+def test_bboxgrid_query():
+    bbs = random_bbs(400, 10) + [bbox([-math.inf, 0, math.inf, 1])]
+    grid = dh.BBoxGrid(bbs)
+    for bb in random_bbs(100, 11):
+        ref = [i for i, b in enumerate(bbs)
+               if not bb.isnull and not b.isnull and b.intersect(bb)]
+        assert grid.query(bb) == ref
+    assert dh.BBoxGrid([]).query(bbox([0, 0, 1, 1])) == []
+
+
+# Batched bounding boxes
+def test_batch_bounding_boxes_percent_stroke():
+    # Percentage stroke widths cannot be parsed by the batch path and are
+    # left to bounding_box2 instead of failing the whole call
+    svgstr = ('<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100" viewBox="0 0 100 100">'
+              '<path id="p1" d="M 10,10 L 20,30" style="stroke:#000000;stroke-width:5%"/>'
+              '<path id="p2" d="M 10,10 L 20,30" style="stroke:#000000;stroke-width:2"/>'
+              '<path id="p3" d="M 40,40 C 50,60 70,60 80,40" style="fill:#ff0000;stroke:none"/>'
+              '</svg>')
+    def load():
+        return inkex.load_svg(io.BytesIO(svgstr.encode('utf-8'))).getroot()
+    svg = load()
+    els = [svg.getElementById(i) for i in ('p1', 'p2', 'p3')]
+    ret = dh.BB2(svg, els)
+
+    svg2 = load()  # unbatched reference
+    for elid in ('p1', 'p2', 'p3'):
+        ref = svg2.getElementById(elid).bounding_box2()
+        if ref.isnull:
+            assert elid not in ret
+        else:
+            assert np.allclose(ret[elid], ref.sbb)
+    assert np.allclose(ret['p2'], [9, 9, 12, 22])
+
+
+# Query-all cache
+def test_cached_query(tmp_path, monkeypatch):
+    cdir = tmp_path / "cache"
+    def cache_dir(name):
+        os.makedirs(str(cdir / name), exist_ok=True)
+        return str(cdir / name)
+    monkeypatch.setattr(dh, "cache_dir", cache_dir)
+    calls = []
+    def wrapped_binary(filename, svg=None):
+        calls.append(filename)
+        return {"sw": [1.0, 2.0, 3.0, 4.0]}
+    monkeypatch.setattr(dh, "wrapped_binary", wrapped_binary)
+
+    # switch is not supported by BB2, so Inkscape is queried
+    svgstr = ('<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100">'
+              '<switch id="sw"><rect x="{0}" width="10" height="10"/></switch></svg>')
+    def load(x):
+        return inkex.load_svg(io.BytesIO(svgstr.format(x).encode('utf-8'))).getroot()
+    assert dh.BB2(load(1)) == {"sw": [1.0, 2.0, 3.0, 4.0]}
+    assert dh.BB2(load(1)) == {"sw": [1.0, 2.0, 3.0, 4.0]}
+    assert len(calls) == 1
+    assert len(os.listdir(cache_dir("bboxes"))) == 1
+
+    dh.BB2(load(2))  # changed document
+    assert len(calls) == 2
+
+    monkeypatch.setattr(dh, "USE_QUERY_CACHE", False)
+    dh.BB2(load(1))
+    assert len(calls) == 3
+
+    monkeypatch.setattr(dh, "USE_QUERY_CACHE", True)
+    monkeypatch.setattr(dh, "MAX_CACHED_QUERIES", 1)
+    dh.BB2(load(3))
+    assert len(os.listdir(cache_dir("bboxes"))) == 1
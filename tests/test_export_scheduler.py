@@ -0,0 +1,108 @@
+# coding=utf-8
+
+# Unit tests of the Autoexporter's job scheduler.
+
+import os, sys, time, threading
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+from export_scheduler import ExportScheduler
+
+
+class Job:
+    def __init__(self, name, log, gate=None, delay=0):
+        self.name = name
+        self.log = log
+        self.gate = gate
+        self.delay = delay
+        self.stopped = False
+
+    def run(self):
+        self.log.append(("start", self.name))
+        if self.gate is not None:
+            self.gate.wait(10)
+        time.sleep(self.delay)
+        self.log.append(("end", self.name))
+
+def wait_idle(sched, timeout=10):
+    deadline = time.time() + timeout
+    while not sched.idle():
+        assert time.time() < deadline
+        sched.wait(0.05)
+
+def test_scheduler_order():
+    log = []
+    gate = threading.Event()
+    sched = ExportScheduler(nworkers=1)
+    sched.submit("busy", Job("busy", log, gate))
+    while not sched.nrunning:
+        time.sleep(0.01)
+    sched.submit("c", Job("c", log), priority=(1, 0))
+    sched.submit("b", Job("b", log), priority=(0, 5))
+    sched.submit("a", Job("a", log), priority=(0, 1))
+    old = Job("d_old", log)
+    sched.submit("d", old, priority=(0, 0))
+    sched.submit("d", Job("d", log), priority=(2, 0))  # replaces the queued job
+    assert old.stopped and sched.depth == 4
+    gate.set()
+    wait_idle(sched)
+    starts = [name for evt, name in log if evt == "start"]
+    assert starts == ["busy", "a", "b", "c", "d"]
+    assert sched.completed == 5 and len(sched.latencies()) == 5
+    sched.close()
+
+def test_scheduler_bounds():
+    log = []
+    sched = ExportScheduler(nworkers=2)
+    active = []
+    maxactive = [0]
+    lock = threading.Lock()
+
+    class CountingJob(Job):
+        def run(self):
+            with lock:
+                active.append(self)
+                maxactive[0] = max(maxactive[0], len(active))
+            Job.run(self)
+            with lock:
+                active.remove(self)
+
+    for i in range(8):
+        sched.submit(i, CountingJob(i, log, delay=0.05))
+    wait_idle(sched)
+    assert maxactive[0] <= 2 and len(sched.workers) <= 2
+    assert sched.completed == 8
+
+    # A running job is stopped when its key is submitted again
+    gate = threading.Event()
+    running = Job("x", log, gate)
+    sched.submit("x", running)
+    while not sched.nrunning:
+        time.sleep(0.01)
+    sched.submit("x", Job("x2", log))
+    assert running.stopped
+    gate.set()
+    wait_idle(sched)
+    sched.close()
+
+def test_scheduler_errors():
+    # A job that raises does not take its worker down with it
+    log = []
+
+    class FailingJob(Job):
+        def run(self):
+            Job.run(self)
+            raise ValueError("export failed")
+
+    sched = ExportScheduler(nworkers=1)
+    bad = FailingJob("bad", log)
+    sched.submit("bad", bad, priority=(0, 0))
+    sched.submit("good", Job("good", log), priority=(1, 0))
+    wait_idle(sched)
+    assert "ValueError" in bad.error
+    assert [name for evt, name in log if evt == "end"] == ["bad", "good"]
+    assert len(sched.workers) == 1 and sched.workers[0].is_alive()
+    sched.submit("again", Job("again", log))
+    wait_idle(sched)
+    assert log[-1] == ("end", "again") and sched.completed == 3
+    sched.close()
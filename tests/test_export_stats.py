@@ -0,0 +1,93 @@
+# coding=utf-8
+
+# Unit tests of the Autoexporter's per-stage stats.
+
+import os, sys, json, subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh  # sets up inkex
+import export_stats
+import inkscape_shell
+
+
+class Doc:
+    """Stands in for an Exporter"""
+    def __init__(self):
+        self.display_name = "doc.svg"
+        self.reported = []
+
+    def report_stats(self, stats, total):
+        self.reported.append((stats, total))
+
+    @export_stats.timed("export_all", report=True)
+    def export_all(self, depth=0):
+        self.stage(depth)
+
+    @export_stats.timed("stage")
+    def stage(self, depth):
+        export_stats.count("files_written")
+        if depth:
+            self.stage(depth - 1)  # recursive calls are one stage call
+
+def test_timed():
+    doc = Doc()
+    doc.export_all(depth=2)
+    assert len(doc.reported) == 1 and doc.stats is None
+    stats, total = doc.reported[0]
+    assert total == "export_all"
+    assert stats.stages["stage"][1] == 1 and stats.stages["export_all"][1] == 1
+    assert stats.counts["files_written"] == 3
+    assert stats.summary(total).startswith("Timing: ")
+    assert "3 files written" in stats.summary(total)
+    doc.export_all()  # the next run gets new stats
+    assert doc.reported[1][0] is not stats and doc.reported[1][0].counts["files_written"] == 1
+    export_stats.count("files_written")  # outside a run, does nothing
+
+def test_count_in_pool():
+    # Binary calls made on pool threads are counted for the document
+    calls = []
+    def fake_repeat(args, cwd=None):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0)
+
+    class PoolDoc(Doc):
+        @export_stats.timed("export_all", report=True)
+        def export_all(self):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                futs = [export_stats.submit(pool, inkscape_shell.run_binary, ["inkscape", "a.svg"])
+                        for _ in range(3)]
+                futs.append(pool.submit(export_stats.count, "binary_calls"))  # no context
+                for fut in futs:
+                    fut.result()
+            inkscape_shell.run_binary(["inkscape", "b.svg"])
+
+    orig = inkscape_shell.subprocess_repeat
+    inkscape_shell.subprocess_repeat = fake_repeat
+    try:
+        doc = PoolDoc()
+        doc.export_all()
+    finally:
+        inkscape_shell.subprocess_repeat = orig
+    assert len(calls) == 4
+    assert doc.reported[0][0].counts["binary_calls"] == 4
+
+def test_write_and_rotate(tmp_path, monkeypatch):
+    logfile = str(tmp_path / "stats.jsonl")
+    stats = export_stats.ExportStats("doc.svg")
+    with stats.stage("export_all"):
+        stats.count("bytes_read", 10)
+    stats.write(logfile)
+    stats.write(logfile)
+    lines = open(logfile).read().splitlines()
+    assert len(lines) == 2
+    data = json.loads(lines[0])
+    assert data["file"] == "doc.svg" and data["counts"] == {"bytes_read": 10}
+    assert data["stages"]["export_all"]["calls"] == 1
+
+    monkeypatch.setattr(export_stats, "MAX_LOG_BYTES", 10)
+    stats.write(logfile)  # rotated first
+    assert len(open(logfile).read().splitlines()) == 1
+    assert len(open(logfile + ".1").read().splitlines()) == 2
+    stats.write(str(tmp_path / "missing" / "stats.jsonl"))  # errors are ignored
@@ -0,0 +1,83 @@
+# coding=utf-8
+
+# Unit tests of font loading helpers. Fonts are built with fontTools, so no
+# installed fonts are needed.
+
+import os, sys, mmap
+
+import pytest
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh  # sets up inkex
+from inkex.text import font_properties
+
+
+def build_font(fname, advance):
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    pen = TTGlyphPen(None)
+    pen.moveTo((0, 0))
+    pen.lineTo((250, 700))
+    pen.lineTo((500, 0))
+    pen.closePath()
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder([".notdef", "A"])
+    fb.setupCharacterMap({ord("A"): "A"})
+    fb.setupGlyf({".notdef": pen.glyph(), "A": pen.glyph()})
+    fb.setupHorizontalMetrics({".notdef": (500, 0), "A": (advance, 0)})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": "Test", "styleName": "Regular"})
+    fb.setupOS2()
+    fb.setupPost()
+    fb.save(fname)
+    return fname
+
+@pytest.fixture
+def maps(monkeypatch):
+    """Records the memory maps opened by open_ttfont"""
+    opened = []
+    mmap0 = mmap.mmap
+    def record(*args, **kwargs):
+        opened.append(mmap0(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(mmap, "mmap", record)
+    return opened
+
+def test_open_ttfont(tmp_path, maps):
+    fname = build_font(str(tmp_path / "a.ttf"), 600)
+
+    # Lazy fonts read from the map until they are closed
+    font = font_properties.open_ttfont(fname)
+    assert len(maps) == 1 and font.reader.file is maps[0]
+    assert font["hmtx"]["A"] == (600, 0)
+    assert not maps[0].closed
+    font.close()
+    assert maps[0].closed
+
+    # Other fonts are copied and the map is released at once
+    for lazy in (False, None):
+        font = font_properties.open_ttfont(fname, lazy=lazy)
+        assert maps[-1].closed
+        assert font["hmtx"]["A"] == (600, 0)
+        font.close()
+
+def test_open_ttfont_collection(tmp_path, maps):
+    from fontTools.ttLib import TTFont, TTCollection
+    ttc = TTCollection()
+    ttc.fonts = [TTFont(build_font(str(tmp_path / "{}.ttf".format(adv)), adv))
+                 for adv in (600, 700)]
+    ttc.save(str(tmp_path / "c.ttc"))
+    font = font_properties.open_ttfont(str(tmp_path / "c.ttc"), fontNumber=1)
+    assert font["hmtx"]["A"] == (700, 0)
+    font.close()
+    assert maps[-1].closed
+
+def test_open_ttfont_empty(tmp_path, maps):
+    # Empty files cannot be mapped and are left to fontTools to reject
+    from fontTools.ttLib import TTLibError
+    fname = str(tmp_path / "empty.ttf")
+    open(fname, "wb").close()
+    with pytest.raises(TTLibError):
+        font_properties.open_ttfont(fname)
+    assert maps == []
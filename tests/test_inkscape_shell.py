@@ -0,0 +1,93 @@
+# coding=utf-8
+
+# Unit tests of the Inkscape shell-mode pool. These translate and check
+# command lines without starting Inkscape.
+
+import os, sys
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh  # sets up inkex
+import inkscape_shell
+
+
+def test_shell_actions():
+    reset = inkscape_shell.RESET_ACTIONS
+    assert inkscape_shell.shell_actions(["inkscape", "--export-filename", "a.pdf", "a.svg"]) == (
+        "file-open:a.svg; " + reset + "export-filename:a.pdf; export-do; file-close"
+    )
+    assert inkscape_shell.shell_actions(
+        ["inkscape", "--export-dpi=600", "--export-area-drawing", "--vacuum-defs",
+         "--export-filename=b.png", "b.svg"]
+    ) == ("file-open:b.svg; " + reset + "vacuum-defs; export-dpi:600; "
+          "export-area-drawing:true; export-filename:b.png; export-do; file-close")
+    assert inkscape_shell.shell_actions(["inkscape", "--actions", "select-all;delete", "c.svg"]) == (
+        "file-open:c.svg; " + reset + "select-all;delete; file-close"
+    )
+    assert inkscape_shell.shell_actions(["inkscape", "--query-all", "d.svg"]) == (
+        "file-open:d.svg; " + reset + "query-all; file-close"
+    )
+    # No shell equivalent
+    assert inkscape_shell.shell_actions(["inkscape"]) is None
+    assert inkscape_shell.shell_actions(["inkscape", "--pdf-poppler", "a.pdf"]) is None
+    assert inkscape_shell.shell_actions(["inkscape", "--export-dpi", "a.svg"]) is None
+    assert inkscape_shell.shell_actions(["inkscape", "--export-filename", "a;b.pdf", "a.svg"]) is None
+    assert inkscape_shell.shell_actions(["inkscape", "--export-filename", "a.pdf", "a;b.svg"]) is None
+    assert inkscape_shell.shell_actions(["inkscape", "--export-filename", "a.pdf", "--version"]) is None
+
+
+def run_on_worker(settings, actions):
+    """Apply an action string's export settings to a worker's state."""
+    exported = None
+    for act in actions.split(";"):
+        name, _, val = act.strip().partition(":")
+        if name.startswith("export-") and name != "export-do":
+            settings[name] = val
+        elif name == "export-do":
+            exported = dict(settings)
+    return exported
+
+def test_shell_settings_reset():
+    # Settings persist on a worker, so one job's must not leak into the next
+    defaults = dict(inkscape_shell.VALUE_DEFAULTS)
+    defaults.update({v: "false" for v in inkscape_shell.BOOL_OPTIONS.values()})
+    settings = dict()
+    first = inkscape_shell.shell_actions(
+        ["inkscape", "--export-dpi=600", "--export-width", "300", "--export-height=200",
+         "--export-type=png", "--export-background", "#ffffff",
+         "--export-background-opacity=1", "--export-id=g1", "--export-id-only",
+         "--export-area-drawing", "--export-filename", "a.png", "a.svg"]
+    )
+    second = inkscape_shell.shell_actions(
+        ["inkscape", "--export-text-to-path", "--export-filename", "b.pdf", "b.svg"]
+    )
+    exported = run_on_worker(settings, first)
+    assert exported["export-dpi"] == "600" and exported["export-width"] == "300"
+    exported = run_on_worker(settings, second)
+    assert exported == dict(defaults, **{"export-text-to-path": "true", "export-filename": "b.pdf"})
+    for opt in inkscape_shell.VALUE_OPTIONS.values():
+        assert opt == "export-filename" or opt in inkscape_shell.VALUE_DEFAULTS
+
+
+def test_shell_outputs(tmp_path):
+    cwd = str(tmp_path)
+    args = ["inkscape", "--export-filename", "a.pdf", "--export-filename=sub/b.png", "a.svg"]
+    fnames = inkscape_shell.export_filenames(args, cwd)
+    assert fnames == [os.path.join(cwd, "a.pdf"), os.path.join(cwd, "sub", "b.png")]
+
+    os.makedirs(os.path.join(cwd, "sub"))
+    for fname in fnames:
+        with open(fname, "wb") as f:
+            f.write(b"x")
+    assert inkscape_shell.outputs_written(fnames)
+    # outputs left over from an earlier export are removed beforehand
+    assert inkscape_shell.clear_outputs(fnames)
+    assert not any(os.path.exists(fname) for fname in fnames)
+    assert not inkscape_shell.outputs_written(fnames)
+    assert inkscape_shell.clear_outputs(fnames)  # already gone
+    with open(fnames[0], "wb") as f:
+        f.write(b"x")
+    assert not inkscape_shell.outputs_written(fnames)
+    assert inkscape_shell.outputs_written([])
+    os.makedirs(os.path.join(cwd, "c.pdf"))  # cannot be removed as a file
+    assert not inkscape_shell.clear_outputs([os.path.join(cwd, "c.pdf")])
@@ -0,0 +1,79 @@
+# coding=utf-8
+
+# Unit tests of the persistent si_cache helpers and metrics store.
+
+import os, sys, time
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh
+from inkex.text import metrics_cache as mc
+
+
+def use_dir(monkeypatch, tmp_path):
+    def cache_dir(name):
+        os.makedirs(str(tmp_path / name), exist_ok=True)
+        return str(tmp_path / name)
+    monkeypatch.setattr(mc, "cache_dir", cache_dir)
+    return cache_dir("fonts")
+
+def test_metrics_store(monkeypatch, tmp_path):
+    cdir = use_dir(monkeypatch, tmp_path)
+    store = mc.MetricsStore()
+    key = ["pango", 100, ["/fonts/a.ttf", 0, 0, 0], "font-family:A"]
+    ent = store.get(key)
+    assert ent is store.get(list(key)) and ent is not store.get(key[:3] + ["font-family:B"])
+    assert ent.chars == dict() and ent.caph is None
+    ent.update({"a": [0.5, [0, 0, 0.5, 0.7]]}, {("a", "b"): -0.01}, 0.25, 0.7)
+    store.save()
+    assert not ent.dirty and len(os.listdir(cdir)) == 1
+
+    # A later process sees the saved entry
+    ent2 = mc.MetricsStore().get(key)
+    assert ent2.chars == {"a": [0.5, [0, 0, 0.5, 0.7]]}
+    assert ent2.pairs == {("a", "b"): -0.01} and ent2.spacew == 0.25 and ent2.caph == 0.7
+
+def test_metrics_merge(monkeypatch, tmp_path):
+    # Two processes measuring different characters both keep their results
+    use_dir(monkeypatch, tmp_path)
+    key = ["fonttools", 100, ["/fonts/a.ttf"], "font-family:A"]
+    ent1 = mc.MetricsStore().get(key)
+    ent2 = mc.MetricsStore().get(key)
+    ent1.update({"a": [1, None]}, {("a", "a"): 0.1}, 0.25, 0.7)
+    ent2.update({"b": [2, None]}, {("b", "b"): 0.2}, 0.25, 0.7)
+    ent1.save()
+    ent2.save()
+    ent = mc.MetricsStore().get(key)
+    assert ent.chars == {"a": [1, None], "b": [2, None]}
+    assert ent.pairs == {("a", "a"): 0.1, ("b", "b"): 0.2}
+
+    # Corrupt files are ignored
+    with open(ent.fname, "w") as f:
+        f.write("{not json")
+    assert mc.MetricsStore().get(key).chars == dict()
+
+def test_metrics_disabled(monkeypatch, tmp_path):
+    use_dir(monkeypatch, tmp_path)
+    monkeypatch.setattr(mc, "USE_METRICS_CACHE", False)
+    store = mc.MetricsStore()
+    assert store.cdir is None
+    store.get(["x"]).update({"a": [1, None]}, dict(), 0.25, 0.7)
+    store.save()
+    assert not os.path.exists(str(tmp_path / "fonts")) or not os.listdir(str(tmp_path / "fonts"))
+
+def test_prune_cache(tmp_path):
+    now = time.time()
+    for i in range(5):
+        pth = str(tmp_path / "e{0}".format(i))
+        if i % 2:
+            os.makedirs(pth)
+            open(os.path.join(pth, "f"), "w").close()
+        else:
+            open(pth, "w").close()
+        os.utime(pth, (now - 100 * (5 - i), now - 100 * (5 - i)))
+    mc.prune_cache(str(tmp_path), 5)
+    assert len(os.listdir(str(tmp_path))) == 5
+    mc.prune_cache(str(tmp_path), 2)  # least recently used go first
+    assert sorted(os.listdir(str(tmp_path))) == ["e3", "e4"]
+    mc.prune_cache(str(tmp_path / "missing"), 2)
+    assert dh.prune_cache is mc.prune_cache and dh.cache_dir is mc.cache_dir
@@ -0,0 +1,114 @@
+# coding=utf-8
+
+# Unit tests of the Office export helpers. Inkscape calls are replaced by
+# a fake that writes the requested outputs.
+
+import os, sys, random, subprocess, zipfile
+
+import pytest
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import office
+import inkscape_shell
+
+
+class FakeInkscape:
+    """Records command lines and writes their outputs, except for bad inputs."""
+    def __init__(self, bad=(), fail_batch=False):
+        self.calls = []
+        self.bad = set(bad)
+        self.fail_batch = fail_batch
+
+    def __call__(self, args, cwd=None):
+        self.calls.append(list(args))
+        if "--actions" in args:
+            if self.fail_batch:
+                raise subprocess.CalledProcessError(1, args)
+            filein = None
+            for act in args[args.index("--actions") + 1].split(";"):
+                name, _, val = act.strip().partition(":")
+                if name == "file-open":
+                    filein = val
+                elif name == "export-filename" and filein not in self.bad:
+                    open(val, "wb").close()
+        elif args[-1] not in self.bad:
+            open(args[args.index("--export-filename") + 1], "wb").close()
+
+@pytest.fixture
+def pairs(tmp_path, monkeypatch):
+    monkeypatch.setattr(office.dh.inkex, "installed_ivp", [1, 4, 0])
+    monkeypatch.setattr(inkscape_shell, "_pool_size", None)
+    ret = []
+    for i in range(4):
+        filein = os.path.join(str(tmp_path), "f{0}.svg".format(i))
+        fileout = os.path.join(str(tmp_path), "f{0}.png".format(i))
+        open(filein, "wb").close()
+        open(fileout, "wb").close()  # stale output
+        ret.append((filein, fileout))
+    return ret
+
+def test_overwrite_outputs_batch(pairs, monkeypatch):
+    fake = FakeInkscape()
+    monkeypatch.setattr(office.dh, "run_binary", fake)
+    office.overwrite_outputs(pairs)
+    assert len(fake.calls) == 1
+    # a file-less --actions call must not open the GUI
+    assert fake.calls[0][1:3] == ["--batch-process", "--actions"]
+    assert all(os.path.exists(fout) for _, fout in pairs)
+
+def test_overwrite_outputs_retries(pairs, monkeypatch):
+    # a file that did not render is retried on its own
+    fake = FakeInkscape(bad=[pairs[1][0]])
+    monkeypatch.setattr(office.dh, "run_binary", fake)
+    office.overwrite_outputs(pairs)
+    assert [c[-1] for c in fake.calls[1:]] == [pairs[1][0]]
+    assert not os.path.exists(pairs[1][1])  # stale output was removed
+
+    # a failed batch call is retried file by file
+    fake = FakeInkscape(fail_batch=True)
+    monkeypatch.setattr(office.dh, "run_binary", fake)
+    office.overwrite_outputs(pairs)
+    assert [c[-1] for c in fake.calls[1:]] == [fin for fin, _ in pairs]
+    assert all(os.path.exists(fout) for _, fout in pairs)
+
+def test_overwrite_outputs_shell(pairs, monkeypatch):
+    # shell workers render each file without a batch call
+    monkeypatch.setattr(inkscape_shell, "_pool_size", 2)
+    fake = FakeInkscape()
+    monkeypatch.setattr(office.dh, "run_binary", fake)
+    office.overwrite_outputs(pairs)
+    assert [c[-1] for c in fake.calls] == [fin for fin, _ in pairs]
+    assert all(inkscape_shell.shell_actions(c) is not None for c in fake.calls)
+
+
+# Office packages
+def test_copy_member_raw(tmp_path):
+    src = os.path.join(str(tmp_path), "src.zip")
+    dst = os.path.join(str(tmp_path), "dst.zip")
+    rng = random.Random(0)
+    contents = {
+        "[Content_Types].xml": b"<Types/>",
+        "ppt/slides/slide1.xml": b"<p:sld>" + b"text " * 1000 + b"</p:sld>",
+        "ppt/media/image1.png": bytes(rng.randrange(256) for _ in range(5000)),
+        "docProps/empty.xml": b"",
+    }
+    with zipfile.ZipFile(src, "w") as zf:
+        for i, (name, data) in enumerate(contents.items()):
+            comp = zipfile.ZIP_STORED if i % 2 else zipfile.ZIP_DEFLATED
+            zf.writestr(name, data, compress_type=comp)
+
+    with zipfile.ZipFile(src, "r") as zr, zipfile.ZipFile(dst, "w") as zw:
+        for info in zr.infolist():
+            office.copy_member_raw(zr, zw, info)
+        zw.writestr("ppt/media/image2.png", b"new member")
+
+    with zipfile.ZipFile(dst, "r") as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == list(contents) + ["ppt/media/image2.png"]
+        for name, data in contents.items():
+            assert zf.read(name) == data
+        assert zf.read("ppt/media/image2.png") == b"new member"
+        with zipfile.ZipFile(src, "r") as zr:
+            for info in zr.infolist():
+                assert zf.getinfo(info.filename).compress_type == info.compress_type
@@ -0,0 +1,142 @@
+# coding=utf-8
+
+# Unit tests of the text parser's measurement and layout helpers. Measuring
+# characters needs at least one font that fontconfig can find.
+
+import os, sys, math, random, subprocess
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh
+from inkex import Style
+from inkex.text import parser
+
+
+# Measuring styles
+STYLES = [
+    "font-family:sans-serif;font-weight:normal;font-style:normal;font-stretch:normal",
+    "font-family:sans-serif;font-weight:bold;font-style:normal;font-stretch:normal",
+    "font-family:serif;font-weight:normal;font-style:italic;font-stretch:normal",
+]
+
+def serial_table(tstyset, pchrset):
+    tbl = parser.CharacterTable.__new__(parser.CharacterTable)
+    tbl.method = "fonttools"
+    return tbl.extract_characters(tstyset, pchrset)
+
+def test_measure_styles():
+    styles = [
+        (STYLES[0], ["a", "b", " "], {"b": ["a"]}),
+        (STYLES[1], ["x", " "], dict()),
+        (STYLES[0], ["c", " "], {"c": ["b"]}),  # same style string as the first
+        (STYLES[2], ["a", " "], dict()),
+    ]
+    method, results = parser._measure_styles("fonttools", styles)
+    assert method == "fonttools" and len(results) == len(styles)
+
+    # Each result belongs to its own entry, and matches a serial measurement
+    for (stystr, chrs, pchrs), (chars, pairs) in zip(styles, results):
+        sty = Style(stystr)
+        ref = serial_table({sty: set(chrs)}, {sty: {c: set(v) for c, v in pchrs.items()}})[sty]
+        for c in chrs:
+            cwd, spw, caph, inkbb = chars[c]
+            assert cwd == pytest.approx(ref[c].charw) and spw == pytest.approx(ref[c].spacew)
+            assert caph == pytest.approx(ref[c].caph) and inkbb == pytest.approx(list(ref[c].inkbb))
+        found = {(p, c) for p, c, _ in pairs}
+        assert all((p, c) in found for c, v in pchrs.items() for p in v)
+    assert results[0] == results[2]  # measured together
+    assert set(results[0][0]) == {"a", "b", "c", " "}
+
+# Spawned workers set up inkex by importing the main script, which in SI
+# imports dhelpers, so the pool is run from a script like SI's
+PARALLEL_SCRIPT = """
+import os, sys
+sys.path.append({sidir!r})
+import dhelpers as dh
+from inkex import Style
+from inkex.text import parser
+
+if __name__ == "__main__":
+    parser.MAX_MEASURE_WORKERS = 2
+    os.cpu_count = lambda: 2  # two workers, even on a single CPU
+    tstyset = {{Style(s): set("The quick fox ") for s in {styles!r}}}
+    pchrset = {{sty: {{"h": {{"T"}}, "u": {{"q"}}}} for sty in tstyset}}
+    tstyset[None] = {{"a"}}
+    tbl = parser.CharacterTable.__new__(parser.CharacterTable)
+    tbl.method = "fonttools"
+    ctable = tbl.measure_parallel(tstyset, pchrset)
+    assert ctable is not None, "process pool failed"
+    tbl = parser.CharacterTable.__new__(parser.CharacterTable)
+    tbl.method = "fonttools"
+    ref = tbl.extract_characters(tstyset, pchrset)
+    assert set(ctable) == set(ref)
+    for sty in ref:
+        for c, prop in ref[sty].items():
+            new = ctable[sty][c]
+            assert abs(new.charw - prop.charw) < 1e-9 and abs(new.caph - prop.caph) < 1e-9
+            assert list(new.inkbb) == list(prop.inkbb) and new.dadvs == prop.dadvs
+    print("ok")
+"""
+
+def test_measure_parallel(tmp_path):
+    sidir = os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0], "scientific_inkscape")
+    script = tmp_path / "measure.py"
+    script.write_text(PARALLEL_SCRIPT.format(sidir=sidir, styles=STYLES))
+    proc = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0 and proc.stdout.strip() == "ok", proc.stderr
+
+
+# Differential advances
+def test_kerning_index():
+    dadvs = {("A", "V"): -0.08, ("V", "A"): -0.07, ("T", "o"): -0.1, ("f", "f"): 0.01}
+    kidx = parser.KerningIndex(dadvs)
+    lefts = ["A", "V", "T", "f", "A", "x", "o", "V"]
+    rights = ["V", "A", "o", "f", "A", "A", "T", "x"]
+    ref = [dadvs.get(pair, 0) for pair in zip(lefts, rights)]
+    assert np.array_equal(kidx.pairs(lefts, rights), ref)
+    assert np.array_equal(parser.KerningIndex(dict()).pairs(["A"], ["V"]), [0])
+    assert len(kidx.pairs([], [])) == 0
+
+
+# Character positions
+def random_chunks(seed):
+    rng = random.Random(seed)
+    rnd = lambda k: [rng.choice([0, 0, rng.uniform(-2, 2)]) for _ in range(k)]
+    chks = []
+    for _ in range(20):
+        line = SimpleNamespace(anchfrac=rng.choice([0, 0.5, 1]), rtl=rng.choice([False, True]))
+        n = rng.randint(1, 6)
+        chk = SimpleNamespace(
+            ncs=n, line=line, _charpos=None,
+            cwd=[rng.uniform(1, 5) for _ in range(n)],
+            dx=rnd(n) + [0], dxlsp=rnd(n + 1), dy=rnd(n), bshft=rnd(n), dadv=rnd(n),
+            caph=[rng.uniform(1, 3) for _ in range(n)],
+            unrenderedspace=rng.choice([False, True]),
+            x=rng.uniform(0, 100), y=rng.uniform(0, 100),
+            transform=SimpleNamespace(matrix=((1, 0, 0), (0, 1, 0))),
+        )
+        chk.chrs = [SimpleNamespace(cwd=cwd) for cwd in chk.cwd]
+        chks.append(chk)
+    return chks
+
+def test_chunk_arrays_positions():
+    for seed in range(5):
+        chks = random_chunks(seed)
+        arrs = parser.ChunkArrays(chks)
+        lftx, rgtx, btmy, topy, lx2, rx2, by2, ty2 = arrs.positions()
+        for i, chk in enumerate(chks):
+            sl = slice(arrs.starts[i], arrs.stops[i])
+            # same as each chunk's own calculation
+            ref = parser.TChunk.charpos.fget(chk)
+            for v, r in zip((lftx, rgtx, btmy, topy), ref):
+                assert np.allclose(v[sl], r[:, 0])
+            n = chk.ncs
+            assert math.isclose(lx2[i], min(lftx[sl] - chk.dx[:n] - chk.dxlsp[:n]))
+            wds = [c + dx + dxl + (da if dx == 0 else 0) for c, dx, dxl, da
+                   in zip(chk.cwd, chk.dx, chk.dxlsp, chk.dadv)]
+            assert math.isclose(rx2[i] - lx2[i], sum(wds), abs_tol=1e-9)
+            assert by2[i] == max(btmy[sl]) and ty2[i] == min(topy[sl])
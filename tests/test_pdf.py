@@ -0,0 +1,167 @@
+# coding=utf-8
+
+# Unit tests of the PDF helpers that do not need an Inkscape export.
+
+import os, sys, time, random, threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path += [os.path.join(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],'scientific_inkscape')]
+
+import dhelpers as dh
+import export_stats
+import pdf
+from autoexporter import Exporter
+
+
+def test_subexport_options():
+    # A sub-export inherits settings, but not the parent's run state
+    parent = Exporter("doc.docx", SimpleNamespace(formats=["docx"], dpi=300, prints=None, margin=1))
+    parent.stats = export_stats.ExportStats("doc.docx")
+    parent.stats.count("binary_calls")
+    parent.live_docs = {"a.svg": object()}
+    parent.exported_files = ["a.pdf"]
+    parent.unwritten = {"a.svg"}
+    opts = pdf._subexport_options(parent, "/tmp/fig.svg", "/tmp/fig.pdf")
+    child = Exporter("/tmp/stripped/fig.svg", opts)
+    assert child.filein == "/tmp/stripped/fig.svg"
+    assert child.dpi == 300 and child.formats == ["pdf"] and child.margin == 0
+    assert child.outtemplate == "/tmp/fig.svg" and child.display_name == "fig.svg in doc.docx"
+    for key in Exporter.RUN_STATE:
+        assert not hasattr(child, key)
+
+    # The child's report only covers its own run, leaving the parent's alone
+    reported = []
+    parent.report_stats = lambda stats, name: reported.append(("parent", stats))
+    child.report_stats = lambda stats, name: reported.append(("child", stats))
+    @export_stats.timed("export_all", report=True)
+    def export_all(self):
+        export_stats.count("binary_calls")
+    export_all(child)
+    assert [who for who, _ in reported] == ["child"]
+    assert reported[0][1] is not parent.stats and reported[0][1].counts["binary_calls"] == 1
+    assert parent.stats.counts["binary_calls"] == 1
+
+
+# PNG predictors
+def unfilter_reference(raw, w, h, bpp):
+    """Row-by-row PNG unfiltering, as in the PNG specification"""
+    stride = w * bpp
+    out = []
+    prev = [0] * stride
+    for r in range(h):
+        f = raw[r * (stride + 1)]
+        line = list(raw[r * (stride + 1) + 1:(r + 1) * (stride + 1)])
+        for i in range(stride):
+            a = line[i - bpp] if i >= bpp else 0
+            b = prev[i]
+            c = prev[i - bpp] if i >= bpp else 0
+            if f == 1:
+                line[i] = (line[i] + a) & 0xFF
+            elif f == 2:
+                line[i] = (line[i] + b) & 0xFF
+            elif f == 3:
+                line[i] = (line[i] + (a + b) // 2) & 0xFF
+            elif f == 4:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                pr = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                line[i] = (line[i] + pr) & 0xFF
+        out.append(line)
+        prev = line
+    return np.array(out, dtype=np.uint8).reshape(h, stride)
+
+def random_png_stream(w, h, bpp, filters, seed):
+    rng = random.Random(seed)
+    raw = bytearray()
+    for r in range(h):
+        raw.append(rng.choice(filters))
+        raw += bytes(rng.randrange(256) for _ in range(w * bpp))
+    return bytes(raw)
+
+@pytest.mark.parametrize("usepil", [True, False])
+def test_unfilter_png(monkeypatch, usepil):
+    if not usepil:
+        monkeypatch.setattr(pdf, "_unfilter_png_pil", lambda *args: None)
+    cases = [((0,), 1), ((1,), 3), ((2,), 3), ((0, 1, 2), 3), ((2, 2, 2, 1), 4),
+             ((3,), 3), ((4,), 3), ((0, 1, 2, 3, 4), 1), ((0, 1, 2, 3, 4), 4)]
+    for seed, (filters, bpp) in enumerate(cases):
+        w, h = 7 + seed, 9
+        raw = random_png_stream(w, h, bpp, filters, seed)
+        out, err = pdf._unfilter_png(raw, w, h, bpp, 15)
+        assert err is None
+        assert np.array_equal(out, unfilter_reference(raw, w, h, bpp))
+
+def test_unfilter_png_errors():
+    raw = bytes(range(24))
+    out, err = pdf._unfilter_png(raw, 4, 2, 3, 1)  # no predictor
+    assert err is None and out.tobytes() == raw
+    assert pdf._unfilter_png(raw[:-1], 4, 2, 3, 1)[0] is None
+    assert pdf._unfilter_png(raw, 4, 2, 3, 15)[0] is None  # missing filter bytes
+    raw = bytes([5] + [0] * 12 + [0] + [0] * 12)
+    out, err = pdf._unfilter_png(raw, 4, 2, 3, 15)
+    assert out is None and "filter" in err
+
+
+# Marker exports
+def blank_pdf(fname):
+    writer = pdf.PdfWriter()
+    writer.add_blank_page(width=10, height=10)
+    with open(fname, "wb") as f:
+        writer.write(f)
+
+def test_marker_exports(tmp_path, monkeypatch):
+    cdir = tmp_path / "cache"
+    def cache_dir(name):
+        os.makedirs(str(cdir / name), exist_ok=True)
+        return str(cdir / name)
+    monkeypatch.setattr(dh, "cache_dir", cache_dir)
+    monkeypatch.setattr(pdf, "MAX_MARKER_WORKERS", 2)
+    lock = threading.Lock()
+    active, calls = [0, 0], []
+    def export_svg_to_pdf(src, exporter):
+        with lock:
+            calls.append(src)
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        if "bad" in open(src).read():
+            raise ValueError("cannot export")
+        blank_pdf(os.path.splitext(src)[0] + ".pdf")
+        return os.path.splitext(src)[0] + ".pdf"
+    monkeypatch.setattr(pdf, "export_svg_to_pdf", export_svg_to_pdf)
+    blank_pdf(str(tmp_path / "in.pdf"))
+    exporter = SimpleNamespace(dpi=300)
+
+    def run(folder, contents):
+        os.makedirs(str(tmp_path / folder), exist_ok=True)
+        colors = dict()
+        for i, cnt in enumerate(contents):
+            src = str(tmp_path / folder / "fig{}.svg".format(i))
+            with open(src, "w") as f:
+                f.write('<svg xmlns="http://www.w3.org/2000/svg">{}</svg>'.format(cnt))
+            colors["{:06x}".format(i + 1)] = (src, None)
+        del calls[:]
+        out = pdf.replace_color_markers_with_svgs(
+            str(tmp_path / "in.pdf"), colors, str(tmp_path / folder / "out.pdf"), exporter)
+        assert os.path.exists(out)
+        return [os.path.basename(c) for c in calls]
+
+    # Exports are bounded, and failures only affect their own figure
+    figs = ["<g id='{}'/>".format(i) for i in range(5)] + ["bad"]
+    assert len(run("a", figs)) == 6 and active[1] == 2
+    assert len(os.listdir(cache_dir("markers"))) == 5
+
+    # The same figures in another document are copied from the cache
+    assert run("b", figs) == ["fig5.svg"]
+    assert os.path.exists(str(tmp_path / "b" / "fig0.pdf"))
+
+    # Different export options or linked files are not
+    exporter.dpi = 600
+    assert len(run("c", figs[:2])) == 2
+    linked = ['<image href="photo.png"/>']
+    assert len(run("d", linked)) == 1 and len(run("e", linked)) == 1